@@ -0,0 +1,89 @@
+"""
+TelegramClient в памяти для бенчмарков: запоминает вызовы, имитирует задержку и FloodWait.
+"""
+import asyncio
+import collections
+import datetime
+import itertools
+import random
+import time
+
+from telethon import errors, types, utils
+
+
+class FakeTelegramClient:
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, flood_rate: float = 0.0, flood_seconds: int = 1, seed: int = 0):
+        """
+        :param latency: Задержка (сек.) каждого вызова.
+        :param jitter: Случайная добавка к задержке (сек., равномерно от 0 до jitter).
+        :param flood_rate: Вероятность ответа FloodWaitError на send_message/edit_message/forward_messages.
+        :param flood_seconds: Значение seconds у FloodWaitError.
+        :param seed: Начальное значение генератора случайных чисел.
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.flood_rate = flood_rate
+        self.flood_seconds = flood_seconds
+        self._random = random.Random(seed)
+        self._ids = itertools.count(1)
+
+        self.calls: collections.Counter[str] = collections.Counter()
+        self.call_seconds: collections.Counter[str] = collections.Counter()
+        self.flood_waits = 0
+        # Хранится только последнее сообщение чата, чтобы сам клиент не влиял на рост памяти
+        self.last_sent: dict[int, types.Message] = dict()
+
+    async def forward_messages(self, entity, messages, from_peer=None):
+        await self._call("forward_messages", flood=True)
+        ids = messages if isinstance(messages, list) else [messages]
+        return [self._message(entity, f"forward of {msg_id}") for msg_id in ids]
+
+    async def send_message(self, entity, message=""):
+        await self._call("send_message", flood=True)
+        return self._message(entity, message)
+
+    async def send_file(self, entity, file, caption=""):
+        await self._call("send_file", flood=True)
+        return self._message(entity, caption)
+
+    async def edit_message(self, entity, message=None, text=None):
+        await self._call("edit_message", flood=True)
+        return self._message(entity, text)
+
+    async def get_messages(self, entity, limit=None, ids=None):
+        await self._call("get_messages")
+        last = self.last_sent.get(utils.get_peer_id(entity))
+        return [last] if last is not None else []
+
+    async def get_entity(self, entity):
+        await self._call("get_entity")
+        peer = utils.get_peer(entity)
+        if isinstance(peer, types.PeerUser):
+            return types.User(id=peer.user_id, first_name="User", last_name=str(peer.user_id), username=f"user{peer.user_id}")
+        if isinstance(peer, types.PeerChat):
+            return types.Chat(id=peer.chat_id, title=f"Chat {peer.chat_id}", photo=types.ChatPhotoEmpty(), participants_count=10, date=None, version=1)
+        return types.Channel(id=peer.channel_id, title=f"Channel {peer.channel_id}", photo=types.ChatPhotoEmpty(), date=None)
+
+    def rpc_count(self) -> int:
+        return sum(self.calls.values())
+
+    async def _call(self, method: str, flood: bool = False):
+        started = time.perf_counter()
+        self.calls[method] += 1
+        delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay:
+            await asyncio.sleep(delay)
+        self.call_seconds[method] += time.perf_counter() - started
+
+        if flood and self.flood_rate and self._random.random() < self.flood_rate:
+            self.flood_waits += 1
+            raise errors.FloodWaitError(None, capture=self.flood_seconds)
+
+    def _message(self, entity, text: str) -> types.Message:
+        peer = utils.get_peer(entity)
+        message = types.Message(id=next(self._ids), peer_id=peer, date=datetime.datetime.now(tz=datetime.timezone.utc), message=text)
+        self.last_sent[utils.get_peer_id(peer)] = message
+        return message
+
+
+__all__ = ['FakeTelegramClient']
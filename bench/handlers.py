@@ -0,0 +1,239 @@
+"""
+Пропускная способность обработчиков событий без Telegram: EventHandlers с FakeTelegramClient
+получают синтетический поток NewMessage, правок, удалений, TYPING и сырых статусов.
+
+    python -m bench.handlers [--events N] [--rate ev/s] [--latency сек.] [--flood-rate p] [--workers N] [--tracemalloc]
+
+Без --rate события подаются без пауз, и задержка включает ожидание в очереди всего потока.
+"""
+import argparse
+import asyncio
+import datetime
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from telethon import events, types
+
+from bench.fake_client import FakeTelegramClient
+from src.handlers import EventHandlers
+from src.log_store import LogStoreManager
+from src.services.config import ConfigSnapshot
+from src.services.crypt import CipherHandler
+from src.services.dispatcher import JournalDispatcher
+from src.services.forwarder import ForwardBatcher
+from src.services.journal import JournalWriter
+from src.services.pipeline import EventPipeline, event_chat_key
+from src.services.router import EventRouter
+from src.services.serializers import JsonSerializer
+
+# Доли видов событий в потоке
+MIX = (("new", 0.5), ("edit", 0.15), ("delete", 0.05), ("typing", 0.1), ("status", 0.2))
+MEMORY_SAMPLES = 10
+
+
+def make_events(count: int, chats: int = 50, users: int = 200, seed: int = 0):
+    """
+    Синтетический поток: пары (вид события, событие). Правки и удаления относятся
+    к ранее созданным сообщениям того же чата.
+    """
+    rng = random.Random(seed)
+    now = datetime.datetime.now(tz=datetime.timezone.utc)
+    peers = [
+        types.PeerChannel(1000 + i) if i % 3 else types.PeerUser(10 ** 9 + i)
+        for i in range(chats)
+    ]
+    sent: dict[int, list[tuple[int, str]]] = {i: [] for i in range(chats)}
+    next_id = 1
+    kinds, weights = zip(*MIX)
+
+    for _ in range(count):
+        kind = rng.choices(kinds, weights)[0]
+        chat = rng.randrange(chats)
+        peer = peers[chat]
+        user = types.PeerUser(10 ** 8 + rng.randrange(users))
+
+        if kind in ("edit", "delete") and not sent[chat]:
+            kind = "new"
+
+        if kind == "new":
+            text = " ".join(rng.choice(("привет", "как дела", "ok", "🙂")) for _ in range(rng.randrange(1, 20)))
+            message = types.Message(id=next_id, peer_id=peer, date=now, message=text, from_id=user)
+            sent[chat].append((next_id, text))
+            next_id += 1
+            yield kind, events.NewMessage.Event(message)
+        elif kind == "edit":
+            # Половина правок - только метаданные (реакции, предпросмотр): текст тот же
+            msg_id, text = rng.choice(sent[chat])
+            text = text if rng.random() < 0.5 else f"{text} (edited {rng.random():.6f})"
+            message = types.Message(id=msg_id, peer_id=peer, date=now, message=text, from_id=user)
+            yield kind, events.MessageEdited.Event(message)
+        elif kind == "delete":
+            ids = [sent[chat].pop(rng.randrange(len(sent[chat])))[0]]
+            # Для личных чатов и групп Telegram не сообщает чат удаленного сообщения
+            yield kind, events.MessageDeleted.Event(ids, peer if isinstance(peer, types.PeerChannel) else None)
+        elif kind == "typing":
+            yield kind, events.UserUpdate.Event(user, typing=types.SendMessageTypingAction(), chat_peer=peer)
+        else:
+            status = types.UserStatusOnline(expires=now) if rng.random() < 0.5 else types.UserStatusOffline(was_online=now)
+            yield kind, types.UpdateUserStatus(user_id=user.user_id, status=status)
+
+
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+def _percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p * len(values)))]
+
+
+async def run(args) -> dict:
+    client = FakeTelegramClient(args.latency, args.jitter, args.flood_rate, args.flood_seconds)
+    config = ConfigSnapshot(
+        tg_api_id="0",
+        tg_api_hash="",
+        journal_key=None,
+        fwd_chat_id=1,
+        journal_chat_id=2,
+        dispatch_rate=args.dispatch_rate,
+        dispatch_burst=args.dispatch_burst,
+    )
+
+    directory = tempfile.mkdtemp(prefix="bench-handlers-")
+    journal = JournalWriter(os.path.join(directory, "events.jsonl"))
+    router = EventRouter({"journal": (journal, JsonSerializer().dumps)})
+    dispatcher = JournalDispatcher(client, rate=config.dispatch_rate, burst=config.dispatch_burst, edit_interval=config.typing_edit_interval)
+    forwarder = ForwardBatcher(client, window=config.forward_window)
+    store_manager = LogStoreManager(client)
+    handlers = EventHandlers(client, config, store_manager, CipherHandler(None), router, dispatcher, forwarder)
+    pipeline = EventPipeline(workers=args.workers, queue_size=args.queue_size)
+
+    targets = {
+        "new": handlers.new_message_action,
+        "edit": handlers.edit_message_action,
+        "delete": handlers.delete_message_action,
+        "typing": handlers.typing_message_action,
+    }
+    latencies: dict[str, list[float]] = {kind: [] for kind, _ in MIX}
+
+    def timed(kind, handler, submitted):
+        async def call(event):
+            await handler(event)
+            latencies[kind].append(time.perf_counter() - submitted)
+        return call
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    await journal.start()
+    dispatcher.start()
+    pipeline.start()
+
+    memory = []
+    rss_start = _rss_bytes()
+    step = max(1, args.events // MEMORY_SAMPLES)
+    started = time.perf_counter()
+
+    for i, (kind, event) in enumerate(make_events(args.events, args.chats, seed=args.seed), 1):
+        submitted = time.perf_counter()
+        if kind == "status":
+            # Сырые события обрабатываются сразу, как в EventLogger
+            await handlers.all_events_handler(event)
+            latencies[kind].append(time.perf_counter() - submitted)
+        else:
+            await pipeline.submit(event_chat_key(event), timed(kind, targets[kind], submitted), event)
+        if args.rate:
+            # Равномерная подача с заданной скоростью
+            delay = started + i / args.rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        elif i % 100 == 0:
+            # Отдаем управление, как это делает прием обновлений Telethon между событиями
+            await asyncio.sleep(0)
+        if i % step == 0:
+            traced = tracemalloc.get_traced_memory()[0] if args.tracemalloc else 0
+            memory.append((i, _rss_bytes() - rss_start, traced))
+
+    await pipeline.stop(timeout=3600)
+    await forwarder.flush()
+    handled = time.perf_counter() - started
+    await dispatcher.stop(timeout=args.drain_timeout)
+    await journal.stop()
+    total = time.perf_counter() - started
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    return {
+        "client": client,
+        "handled_seconds": handled,
+        "total_seconds": total,
+        "latencies": latencies,
+        "all_latencies": all_latencies,
+        "memory": memory,
+        "pipeline": pipeline.stats(),
+        "handlers": handlers.stats(),
+        "dispatcher": dispatcher.stats(),
+        "forwarder": forwarder.stats(),
+        "messages": store_manager.message_store.stats(),
+        "entities": store_manager.entity_store.stats(),
+    }
+
+
+def report(args, result: dict):
+    client: FakeTelegramClient = result["client"]
+    count = args.events
+    print(
+        f"{count} events, {args.workers} workers, latency {args.latency * 1000:.1f} ms "
+        f"(+{args.jitter * 1000:.1f} jitter), flood rate {args.flood_rate}"
+    )
+    print(f"handled in {result['handled_seconds']:.3f}s: {count / result['handled_seconds']:.0f} events/s")
+    print(f"journal chat drained in {result['total_seconds']:.3f}s total")
+
+    print(f"{'kind':<8} {'events':>8} {'p50 ms':>10} {'p99 ms':>10}")
+    for kind, values in result["latencies"].items():
+        print(f"{kind:<8} {len(values):>8} {_percentile(values, 0.5) * 1000:>10.2f} {_percentile(values, 0.99) * 1000:>10.2f}")
+    values = result["all_latencies"]
+    print(f"{'all':<8} {len(values):>8} {_percentile(values, 0.5) * 1000:>10.2f} {_percentile(values, 0.99) * 1000:>10.2f}")
+
+    print(f"RPC per event: {client.rpc_count() / count:.3f} (flood waits: {client.flood_waits})")
+    for method, calls in client.calls.most_common():
+        print(f"  {method:<18} {calls:>8} calls, {client.call_seconds[method] / calls * 1000:.2f} ms avg")
+
+    print("memory growth (events, rss MB, traced MB):")
+    for events_done, rss, traced in result["memory"]:
+        print(f"  {events_done:>8} {rss / 2 ** 20:>10.1f} {traced / 2 ** 20:>10.1f}")
+
+    for name in ("pipeline", "handlers", "dispatcher", "forwarder", "messages", "entities"):
+        print(f"{name}: {result[name]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument("--chats", type=int, default=50)
+    parser.add_argument("--rate", type=float, default=0.0, help="Скорость подачи событий (ev/s), 0 - без ограничения")
+    parser.add_argument("--latency", type=float, default=0.005, help="Задержка каждого вызова API (сек.)")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--flood-rate", type=float, default=0.0, help="Вероятность FloodWaitError")
+    parser.add_argument("--flood-seconds", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--queue-size", type=int, default=10000)
+    parser.add_argument("--dispatch-rate", type=float, default=1000.0, help="Ограничение отправки в чат журнала (сообщ./сек.)")
+    parser.add_argument("--dispatch-burst", type=int, default=1000)
+    parser.add_argument("--drain-timeout", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tracemalloc", action="store_true", help="Учитывать выделения Python (медленнее)")
+    args = parser.parse_args()
+
+    report(args, asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
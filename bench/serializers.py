@@ -0,0 +1,88 @@
+"""
+Сравнение форматов журнала по размеру и скорости на синтетических обновлениях.
+
+    python -m bench.serializers [число событий]
+"""
+import datetime
+import io
+import random
+import sys
+import time
+
+from cryptography.fernet import Fernet
+from telethon import types
+
+from src.services.framing import encode_block, iter_codec_records
+from src.services.journal import LineEncoder
+from src.services.serializers import get_serializer, msgpack, serializer_for_codec
+
+BATCH_SIZE = 500
+
+
+def make_updates(count: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    now = datetime.datetime.now(tz=datetime.timezone.utc)
+    updates = []
+    for i in range(count):
+        user_id = rng.randrange(10 ** 8, 10 ** 10)
+        kind = rng.random()
+        if kind < 0.6:
+            status = types.UserStatusOnline(expires=now) if rng.random() < 0.5 else types.UserStatusOffline(was_online=now)
+            updates.append(types.UpdateUserStatus(user_id=user_id, status=status))
+        elif kind < 0.8:
+            updates.append(types.UpdateUserTyping(user_id=user_id, action=types.SendMessageTypingAction()))
+        else:
+            text = " ".join(rng.choice(("привет", "как дела", "ok", "https://t.me/c/1/2", "🙂")) for _ in range(rng.randrange(1, 30)))
+            message = types.Message(
+                id=i,
+                peer_id=types.PeerUser(user_id),
+                date=now,
+                message=text,
+                from_id=types.PeerUser(user_id),
+                entities=[types.MessageEntityBold(offset=0, length=min(3, len(text)))],
+            )
+            updates.append(types.UpdateNewMessage(message=message, pts=i, pts_count=1))
+    return updates
+
+
+def _encode(updates, serializer, cipher, lines: bool) -> tuple[bytes, float]:
+    started = time.perf_counter()
+    out = []
+    for start in range(0, len(updates), BATCH_SIZE):
+        records = [serializer.dumps(update) for update in updates[start:start + BATCH_SIZE]]
+        out.append(LineEncoder(cipher)(records) if lines else encode_block(records, cipher, serializer.codec))
+    return b"".join(out), time.perf_counter() - started
+
+
+def _decode(data: bytes, cipher) -> float:
+    started = time.perf_counter()
+    serializers = {}
+    for codec, record in iter_codec_records(io.BytesIO(data), cipher):
+        serializer = serializers.get(codec) or serializers.setdefault(codec, serializer_for_codec(codec))
+        serializer.to_dict(record)
+    return time.perf_counter() - started
+
+
+def main(count: int):
+    updates = make_updates(count)
+    cipher = Fernet(Fernet.generate_key())
+
+    variants = [("json lines + fernet per line (old)", "json", cipher, True), ("json lines", "json", None, True)]
+    for name in ("json", "tl") + (("msgpack",) if msgpack is not None else ()):
+        variants.append((f"{name} blocks", name, None, False))
+        variants.append((f"{name} blocks + fernet", name, cipher, False))
+
+    print(f"{count} updates, {BATCH_SIZE} per block")
+    print(f"{'format':<36} {'bytes/event':>12} {'encode ev/s':>12} {'decode ev/s':>12}")
+    for title, name, variant_cipher, lines in variants:
+        serializer = get_serializer(name)
+        data, encode_seconds = _encode(updates, serializer, variant_cipher, lines)
+        decode_seconds = _decode(data, variant_cipher)
+        print(
+            f"{title:<36} {len(data) / count:>12.1f} "
+            f"{count / encode_seconds:>12.0f} {count / decode_seconds:>12.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,43 @@
+import sys
+import time
+from cryptography.fernet import Fernet
+
+from src.services.framing import encode_block, iter_codec_records
+from src.services.journal import LineEncoder
+from src.services.serializers import get_serializer, serializer_for_codec
+
+# Число записей в одном блоке выходного файла
+BATCH_SIZE = 500
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (4, 5):
+        print("Usage: python convert.py <file in> <file out> <json|tl|msgpack> [key]")
+        sys.exit(1)
+
+    file_in = sys.argv[1]
+    file_out = sys.argv[2]
+    target = get_serializer(sys.argv[3])
+    cipher = Fernet(sys.argv[4]) if len(sys.argv) == 5 else None
+
+    # Незашифрованный JSON остается построчным, остальное пишется блоками
+    encoder = LineEncoder() if cipher is None and not target.binary else None
+
+    started = time.perf_counter()
+    count = 0
+    with open(file_in, "rb") as f, open(file_out, "wb") as g:
+        batch = []
+        for codec, record in iter_codec_records(f, cipher):
+            if codec != target.codec:
+                record = target.from_dict(serializer_for_codec(codec).to_dict(record))
+            batch.append(record)
+            count += 1
+
+            if len(batch) >= BATCH_SIZE:
+                g.write(encoder(batch) if encoder else encode_block(batch, cipher, target.codec))
+                batch = []
+
+        if batch:
+            g.write(encoder(batch) if encoder else encode_block(batch, cipher, target.codec))
+
+    print(f"Converted {count} records in {time.perf_counter() - started:.3f}s")
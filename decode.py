@@ -1,19 +1,75 @@
+import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from cryptography.fernet import Fernet
 
+from src.services.framing import CODEC_JSON, RawBlock, decode_block, iter_blocks
+from src.services.segments import journal_files, open_segment
+from src.services.serializers import JsonSerializer, serializer_for_codec
+
+# Сколько байт зашифрованных данных отправляется в один процесс за раз
+CHUNK_SIZE = 1 << 20
+
+_cipher: Fernet | None = None
+
+
+def _init_worker(key: str):
+    global _cipher
+    _cipher = Fernet(key)
+
+
+def _decode_chunk(blocks: list[RawBlock]) -> bytes:
+    out = []
+    json_serializer = JsonSerializer()
+    for block in blocks:
+        # Двоичные записи выводятся как JSON
+        serializer = None if block.codec == CODEC_JSON else serializer_for_codec(block.codec)
+        for record in decode_block(block, _cipher):
+            if serializer is not None:
+                record = json_serializer.from_dict(serializer.to_dict(record))
+            out.append(record)
+            out.append(b'\n')
+    return b"".join(out)
+
+
+def _iter_chunks(paths: list[str]):
+    chunk, size = [], 0
+    for path in paths:
+        with open_segment(path) as f:
+            for block in iter_blocks(f):
+                chunk.append(block)
+                size += len(block.payload)
+                if size >= CHUNK_SIZE:
+                    yield chunk
+                    chunk, size = [], 0
+    if chunk:
+        yield chunk
+
+
 if __name__ == "__main__":
-    if len(sys.argv) != 4:
-        print("Usage: python decode.py <key> <file in> <file out>")
+    if len(sys.argv) not in (4, 5):
+        print("Usage: python decode.py <key> <file in> <file out> [workers]")
         sys.exit(1)
 
     key = sys.argv[1]
     file_in = sys.argv[2]
     file_out = sys.argv[3]
-    
-    cipher = Fernet(key)
-
-    with open(file_in, "rb") as f:
-        with open(file_out, "wb") as g:
-            for line in f:
-                g.write(cipher.decrypt(line))
-                g.write(b'\n')
+    workers = int(sys.argv[4]) if len(sys.argv) == 5 else os.cpu_count() or 1
+
+    # Сегментированный журнал читается целиком по манифесту, сжатые сегменты распаковываются на лету
+    paths = journal_files(file_in)
+    if not paths:
+        print(f"Журнал {file_in} не найден")
+        sys.exit(1)
+
+    with open(file_out, "wb") as g, \
+            ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(key,)) as pool:
+        # Держим в работе ограниченное число кусков, чтобы не читать весь файл в память
+        pending = []
+        for chunk in _iter_chunks(paths):
+            pending.append(pool.submit(_decode_chunk, chunk))
+            if len(pending) >= 2 * workers:
+                g.write(pending.pop(0).result())
+
+        for future in pending:
+            g.write(future.result())
@@ -0,0 +1,93 @@
+import argparse
+import datetime
+import os
+import sys
+import time
+
+from cryptography.fernet import Fernet
+
+from src.services.presence import (
+    ONLINE_EXPIRES,
+    OVERLAP_CHUNK_BINS,
+    StatusColumns,
+    daily_heatmap,
+    export_table,
+    heatmap_table,
+    overlap_pairs,
+    user_overlap,
+)
+
+
+def _parse_time(value: str) -> float:
+    """
+    Время в формате unix time или ISO 8601 (без зоны - местное время).
+    """
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.datetime.fromisoformat(value).timestamp()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Аналитика статусов пользователей: сессии, тепловая карта, пересечения (нужен numpy из requirements-optional.txt).")
+    parser.add_argument("journal", help="Журнал статусов (status.jsonl, основной журнал или каталог сегментов) либо файл .npz")
+    parser.add_argument("--key", help="Ключ журнала, если журнал зашифрован")
+    parser.add_argument("--since", type=_parse_time, help="Начало интервала (unix time или ISO 8601)")
+    parser.add_argument("--until", type=_parse_time, help="Конец интервала (unix time или ISO 8601)")
+    parser.add_argument("--users", type=lambda value: [int(item) for item in value.split(",")], help="Id пользователей через запятую")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--cache", help="Сохранить загруженные статусы в .npz для повторного анализа")
+    parser.add_argument("--expires", type=float, default=ONLINE_EXPIRES, help="Максимальный разрыв внутри сессии (сек.)")
+    parser.add_argument("--utc-offset", type=float, default=0.0, help="Часовой пояс тепловой карты (часы)")
+    parser.add_argument(
+        "--bin",
+        type=float,
+        default=300.0,
+        help=f"Шаг времени для пересечений (сек.): меньший шаг точнее, но время расчета растет пропорционально "
+             f"числу интервалов; память не зависит от длины журнала (около top x {OVERLAP_CHUNK_BINS} x 16 байт)",
+    )
+    parser.add_argument(
+        "--top",
+        type=int,
+        default=500,
+        help="Число самых активных пользователей для пересечений: память и время растут как top^2",
+    )
+    parser.add_argument("--out-dir", default=".", help="Каталог результатов")
+    parser.add_argument("--format", choices=("csv", "parquet"), default="csv", help="parquet - пакет pyarrow из requirements-optional.txt")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if args.journal.endswith(".npz"):
+        columns = StatusColumns.load(args.journal)
+    else:
+        columns = StatusColumns.from_journal(args.journal, Fernet(args.key) if args.key else None, args.since, args.until, args.workers)
+        if args.cache:
+            columns.save(args.cache)
+    columns = columns.select(args.since, args.until, args.users)
+    loaded = time.perf_counter()
+    if not len(columns):
+        print("Статусов за указанный интервал нет", file=sys.stderr)
+        return
+
+    sessions = columns.sessions(args.expires)
+    heatmap = daily_heatmap(sessions, args.utc_offset)
+    users, overlap = user_overlap(sessions, args.bin, args.top)
+    pairs = overlap_pairs(users, overlap)
+    analysed = time.perf_counter()
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    for name, table in (("sessions", sessions), ("heatmap", heatmap_table(heatmap)), ("overlap", pairs)):
+        export_table(table, os.path.join(args.out_dir, f"{name}.{args.format}"))
+
+    print(
+        f"Статусов: {len(columns)}, пользователей: {len(set(columns.user_id.tolist()))}, сессий: {len(sessions['start'])}, "
+        f"пар с пересечением: {len(pairs['seconds'])}"
+    )
+    print(
+        f"Загрузка {loaded - started:.3f} сек., анализ {analysed - loaded:.3f} сек., "
+        f"запись {time.perf_counter() - analysed:.3f} сек. -> {args.out_dir}"
+    )
+
+
+if __name__ == "__main__":
+    main()
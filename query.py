@@ -0,0 +1,94 @@
+import argparse
+import datetime
+import io
+import sys
+import time
+
+from cryptography.fernet import Fernet
+
+from src.services.framing import CODEC_JSON, decode_block, iter_blocks
+from src.services.journal_index import has_index, read_index
+from src.services.segments import journal_files, open_segment
+from src.services.serializers import JsonSerializer, serializer_for_codec
+
+
+def _parse_time(value: str) -> float:
+    """
+    Время в формате unix time или ISO 8601 (без зоны - местное время).
+    """
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.datetime.fromisoformat(value).timestamp()
+
+
+def _query_file(path: str, cipher, start, end, peer, out, stats: dict):
+    json_serializer = JsonSerializer()
+    with open_segment(path) as f:
+        for entry in read_index(path):
+            selected = entry.select(start, end, peer)
+            if not selected:
+                continue
+
+            # Смещения в индексе указаны в распакованных данных, для сжатых сегментов seek дочитывает поток
+            f.seek(entry.offset)
+            data = f.read(entry.length)
+            stats["blocks"] += 1
+            stats["bytes"] += len(data)
+
+            records = []
+            for block in iter_blocks(io.BytesIO(data), entry.offset):
+                serializer = None if block.codec == CODEC_JSON else serializer_for_codec(block.codec)
+                for record in decode_block(block, cipher):
+                    records.append((serializer, record))
+
+            for i in selected:
+                serializer, record = records[i]
+                if serializer is not None:
+                    record = json_serializer.from_dict(serializer.to_dict(record))
+                out.write(record)
+                out.write(b"\n")
+                stats["records"] += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Выборка событий журнала по времени и чату через индекс.")
+    parser.add_argument("journal", help="Журнал (например, events.jsonl.enc) или каталог его сегментов")
+    parser.add_argument("--key", help="Ключ журнала, если журнал зашифрован")
+    parser.add_argument("--peer", type=int, help="Помеченный id чата или пользователя")
+    parser.add_argument("--since", type=_parse_time, help="Начало интервала (unix time или ISO 8601)")
+    parser.add_argument("--until", type=_parse_time, help="Конец интервала (unix time или ISO 8601)")
+    parser.add_argument("--out", help="Файл результата (по умолчанию stdout)")
+    args = parser.parse_args()
+
+    cipher = Fernet(args.key) if args.key else None
+    paths = journal_files(args.journal, args.since, args.until)
+    if not paths:
+        print(f"Нет файлов журнала {args.journal} за указанный интервал", file=sys.stderr)
+        return
+
+    stats = {"files": 0, "blocks": 0, "bytes": 0, "records": 0}
+    started = time.perf_counter()
+    out = open(args.out, "wb") if args.out else sys.stdout.buffer
+    try:
+        for path in paths:
+            if not has_index(path):
+                print(f"Нет индекса для {path}, файл пропущен", file=sys.stderr)
+                continue
+            stats["files"] += 1
+            _query_file(path, cipher, args.since, args.until, args.peer, out, stats)
+    finally:
+        if args.out:
+            out.close()
+        else:
+            out.flush()
+
+    print(
+        f"Файлов: {stats['files']}, прочитано пачек: {stats['blocks']} ({stats['bytes']} байт), "
+        f"записей: {stats['records']}, {time.perf_counter() - started:.3f} сек.",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
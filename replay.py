@@ -0,0 +1,153 @@
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from cryptography.fernet import Fernet
+from telethon import utils
+
+from src.services.framing import iter_blocks
+from src.services.replay import apply_user_name, replay_blocks
+from src.services.segments import journal_files, open_segment
+from src.services.snapshot import decode_segment, iter_raw_segments, write_snapshot
+from src.stores.message_store import MessageStore, StoredMessage
+
+# Сколько байт журнала отправляется в один процесс за раз
+CHUNK_SIZE = 1 << 20
+
+_cipher: Fernet | None = None
+
+
+def _init_worker(key: str | None):
+    global _cipher
+    _cipher = Fernet(key) if key else None
+
+
+def _replay_chunk(blocks):
+    return replay_blocks(blocks, _cipher)
+
+
+def _iter_chunks(paths: list[str], stats: dict):
+    chunk, size = [], 0
+    for path in paths:
+        stats["files"] += 1
+        try:
+            with open_segment(path) as f:
+                for block in iter_blocks(f):
+                    chunk.append(block)
+                    size += len(block.payload)
+                    stats["blocks"] += 1
+                    stats["bytes"] += len(block.payload)
+                    if size >= CHUNK_SIZE:
+                        yield chunk
+                        chunk, size = [], 0
+        except (ValueError, EOFError) as e:
+            # Оборванный при сбое хвост: все, что до него, уже в работе
+            print(f"{path}: {e}, остаток файла пропущен", file=sys.stderr)
+    if chunk:
+        yield chunk
+
+
+def _load_base(path: str, cipher: Fernet | None, messages: MessageStore, entities: dict):
+    """
+    Загрузка читаемых сегментов старого (возможно, поврежденного) снимка.
+    """
+    loaded = 0
+    try:
+        for segment in iter_raw_segments(path):
+            chunks, _, _ = decode_segment(segment, cipher)
+            for kind, items in chunks:
+                if kind == "entities":
+                    entities.update((utils.get_peer_id(entity), entity) for entity in items)
+                elif kind == "messages":
+                    messages.load(items)
+            loaded += 1
+    except Exception as e:
+        print(f"Снимок {path} прочитан не полностью ({loaded} сегментов): {e!r}", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Восстановление снимка хранилища (data.raw) из журнала событий.")
+    parser.add_argument("journal", help="Журнал (например, events.jsonl.enc) или каталог его сегментов")
+    parser.add_argument("--key", help="Ключ журнала и снимка, если они зашифрованы")
+    parser.add_argument("--out", help="Файл снимка (по умолчанию data.raw или data.raw.enc рядом с журналом)")
+    parser.add_argument("--base", help="Старый снимок, поверх которого применяется журнал (читаемая часть)")
+    parser.add_argument("--force", action="store_true", help="Перезаписать существующий снимок")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--max-messages", type=int, default=200000, help="Лимит сообщений, как STORE_MAX_MESSAGES")
+    args = parser.parse_args()
+
+    cipher = Fernet(args.key) if args.key else None
+    out = args.out or os.path.join(os.path.dirname(args.journal.rstrip(os.sep)), "data.raw.enc" if cipher else "data.raw")
+    if os.path.exists(out) and not args.force:
+        print(f"Снимок {out} уже существует, укажите --out или --force", file=sys.stderr)
+        sys.exit(1)
+
+    paths = journal_files(args.journal)
+    if not paths:
+        print(f"Журнал {args.journal} не найден", file=sys.stderr)
+        sys.exit(1)
+
+    started = time.perf_counter()
+    messages = MessageStore(max_size=args.max_messages)
+    entities: dict[int, object] = dict()
+    if args.base:
+        _load_base(args.base, cipher, messages, entities)
+
+    stats = {"files": 0, "blocks": 0, "bytes": 0, "records": 0, "messages": 0, "users": 0}
+    apply_seconds = 0.0
+    replay_started = time.perf_counter()
+
+    def apply(ops: list[tuple], records: int):
+        nonlocal apply_seconds
+        apply_started = time.perf_counter()
+        stats["records"] += records
+        batch = []
+        for op in ops:
+            if op[0] == "message":
+                batch.append(StoredMessage(*op[1]))
+            else:
+                # Имя пользователя применяется после сообщений, пришедших раньше него
+                messages.apply(batch)
+                stats["messages"] += len(batch)
+                batch = []
+                apply_user_name(entities, *op[1:])
+                stats["users"] += 1
+        messages.apply(batch)
+        stats["messages"] += len(batch)
+        apply_seconds += time.perf_counter() - apply_started
+
+    # Куски расшифровываются и разбираются параллельно, а применяются строго по порядку
+    with ProcessPoolExecutor(args.workers, initializer=_init_worker, initargs=(args.key,)) as pool:
+        pending = []
+        for chunk in _iter_chunks(paths, stats):
+            pending.append(pool.submit(_replay_chunk, chunk))
+            if len(pending) >= 2 * args.workers:
+                apply(*pending.pop(0).result())
+        for future in pending:
+            apply(*future.result())
+
+    replay_seconds = time.perf_counter() - replay_started
+    write_started = time.perf_counter()
+    dump = {"entities": list(entities.values()), "messages": messages.dump()}
+    write_snapshot(out, dump, cipher)
+    write_seconds = time.perf_counter() - write_started
+
+    print(
+        f"Файлов: {stats['files']}, пачек: {stats['blocks']} ({stats['bytes'] / 2 ** 20:.1f} МБ), "
+        f"записей: {stats['records']}, сообщений применено: {stats['messages']}, имен пользователей: {stats['users']}"
+    )
+    print(
+        f"Журнал за {replay_seconds:.3f} сек.: {stats['records'] / replay_seconds if replay_seconds else 0:.0f} записей/сек., "
+        f"{stats['bytes'] / 2 ** 20 / replay_seconds if replay_seconds else 0:.1f} МБ/сек. "
+        f"(применение {apply_seconds:.3f} сек., {args.workers} процессов)"
+    )
+    print(
+        f"Снимок {out}: {len(dump['entities'])} сущностей, {len(dump['messages'])} сообщений, запись {write_seconds:.3f} сек., "
+        f"всего {time.perf_counter() - started:.3f} сек."
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,28 @@
+import argparse
+
 import gspread
-from oauth2client.client import Credentials
+import requests
+from cryptography.fernet import Fernet
 from oauth2client.service_account import ServiceAccountCredentials
-from datetime import datetime
-import json
+
+from src.services.status_export import JournalTail, SinkRetryableError, StatusExporter, StatusSink, status_row
+
+SHEET_URL = 'https://docs.google.com/spreadsheets/d/1gb6rinB092NgxNgBUdj-cKPNSAPyvRn2u_rRUdFfOLA'
+WORKSHEET_ID = '1995862865'
+# Коды ответов Sheets API, после которых запрос можно повторить (квота и временные сбои)
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
 
 # Инициализация Google Sheets
-def initialize_google_sheet(sheet_name, credentials_file="service_account.json"):
+def initialize_google_sheet(sheet_name, credentials_file="service_account.json", sheet_url=SHEET_URL, worksheet_id=WORKSHEET_ID):
     """
     Инициализация подключения к Google Sheet через gspread.
     
     :param sheet_name: Название Google Таблицы.
     :param credentials_file: Путь к файлу учетных данных Service Account.
+    :param sheet_url: Ссылка на таблицу.
+    :param worksheet_id: Id листа таблицы.
     :return: Объект таблицы (sheet).
     """
-    # try:
     # Указываем области авторизации
     scope = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
     
@@ -24,85 +33,70 @@ def initialize_google_sheet(sheet_name, credentials_file="service_account.json")
     client = gspread.authorize(credentials)
     
     # Открытие таблицы по имени
-    raw_sheet = client.open_by_url('https://docs.google.com/spreadsheets/d/1gb6rinB092NgxNgBUdj-cKPNSAPyvRn2u_rRUdFfOLA')
-    # client.open_by_url(raw_sheet.url)
-    sheet = raw_sheet.get_worksheet_by_id('1995862865')
+    raw_sheet = client.open_by_url(sheet_url)
+    sheet = raw_sheet.get_worksheet_by_id(worksheet_id)
 
     print(raw_sheet.url)
     print("Успешно подключено к Google Sheet.")
     return sheet
-    # except Exception as e:
-    #     print("Ошибка подключения к Google Sheet:", e)
-    #     return None
+
+
+class GoogleSheetSink(StatusSink):
+    def __init__(self, sheet: gspread.worksheet.Worksheet):
+        """
+        Приемник строк статусов в лист Google Таблицы.
+
+        :param sheet: Объект таблицы (sheet) из gspread.
+        """
+        self.sheet = sheet
+
+    def append_rows(self, rows: list[list]):
+        try:
+            self.sheet.append_rows(rows, value_input_option="RAW")
+        except gspread.exceptions.APIError as e:
+            if e.response.status_code not in RETRYABLE_STATUSES:
+                raise
+            retry_after = e.response.headers.get("Retry-After")
+            raise SinkRetryableError(str(e), float(retry_after) if retry_after else None) from e
+        except requests.exceptions.ConnectionError as e:
+            raise SinkRetryableError(str(e)) from e
+
 
 # Функция для обработки и записи статусов в таблицу
 def log_status_to_google_sheet(sheet: gspread.worksheet.Worksheet, events: list[dict]):
     """
-    Записывает информацию о статусе пользователя из события JSON в Google Таблицу.
+    Записывает информацию о статусе пользователя из событий JSON в Google Таблицу.
+    Время строки берется из самого события (см. status_row).
     
     :param sheet: Объект таблицы (sheet) из gspread.
-    :param event: JSON-объект события.
+    :param events: JSON-объекты событий.
     """
+    rows = [row for row in map(status_row, events) if row is not None]
+    if rows:
+        sheet.append_rows(rows)
 
-    rows = []
 
-    for event in events:
-        try:
-            # Получаем данные из JSON
-            user_id = event['user_id']
-            status_type = event['status']['_']
-            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-
-            # Определяем дополнительные детали (например, время `expires`/`was_online`)
-            details = ""
-            if status_type == "UserStatusOnline":
-                details = f"expires: {event['status'].get('expires', 'N/A')}"
-            elif status_type == "UserStatusOffline":
-                details = f"was_online: {event['status'].get('was_online', 'N/A')}"
-
-            # Данные для записи в таблицу
-            row = [timestamp, user_id, status_type, details]
-
-            rows.append(row)
-        except Exception as e:
-            print("Ошибка записи в Google Таблицу:", e)
-
-    sheet.append_rows(rows)
-
-# Пример использования
 if __name__ == "__main__":
-    # Имя Google Таблицы
-    SHEET_NAME = "Telegram Status Logger"
-    CREDENTIALS_FILE = "/Users/ananevn002/Downloads/bauman-help-21dc97a5e5f8.json"
-
-    # Подключаемся к Google Таблице
-    sheet = initialize_google_sheet(SHEET_NAME, CREDENTIALS_FILE)
-
-    # Проверяем, что таблица подключена
-    if sheet:
-        # Пример журнала статусов в JSON формате
-        events = [
-            {"_": "UpdateUserStatus", "user_id": 503697665, "status": {"_": "UserStatusOffline", "was_online": "2025-01-18T20:14:21+00:00"}},
-            {"_": "UpdateUserStatus", "user_id": 503697665, "status": {"_": "UserStatusOnline", "expires": "2025-01-18T20:19:55+00:00"}},
-            {"_": "UpdateUserStatus", "user_id": 6938433068, "status": {"_": "UserStatusOnline", "expires": "2025-01-18T20:20:03+00:00"}},
-            {"_": "UpdateUserStatus", "user_id": 1124038569, "status": {"_": "UserStatusOnline", "expires": "2025-01-18T20:20:04+00:00"}},
-            {"_": "UpdateUserStatus", "user_id": 6938433068, "status": {"_": "UserStatusOffline", "was_online": "2025-01-18T20:15:06+00:00"}},
-            {"_": "UpdateUserStatus", "user_id": 503697665, "status": {"_": "UserStatusOffline", "was_online": "2025-01-18T20:15:18+00:00"}},
-            {"_": "UpdateUserStatus", "user_id": 1062187409, "status": {"_": "UserStatusOnline", "expires": "2025-01-18T20:20:33+00:00"}},
-            {"_": "UpdateUserStatus", "user_id": 1062187409, "status": {"_": "UserStatusOffline", "was_online": "2025-01-18T20:15:39+00:00"}},
-            {"_": "UpdateUserStatus", "user_id": 1424970102, "status": {"_": "UserStatusOnline", "expires": "2025-01-18T20:20:47+00:00"}},
-            {"_": "UpdateUserStatus", "user_id": 1124038569, "status": {"_": "UserStatusOffline", "was_online": "2025-01-18T20:15:55+00:00"}},
-            {"_": "UpdateUserStatus", "user_id": 1062187409, "status": {"_": "UserStatusOnline", "expires": "2025-01-18T20:20:58+00:00"}},
-            {"_": "UpdateUserStatus", "user_id": 1124038569, "status": {"_": "UserStatusOnline", "expires": "2025-01-18T20:20:59+00:00"}},
-            {"_": "UpdateUserStatus", "user_id": 1124038569, "status": {"_": "UserStatusOffline", "was_online": "2025-01-18T20:16:01+00:00"}},
-            {"_": "UpdateUserStatus", "user_id": 963334626, "status": {"_": "UserStatusOnline", "expires": "2025-01-18T20:21:05+00:00"}},
-            {"_": "UpdateUserStatus", "user_id": 1062187409, "status": {"_": "UserStatusOffline", "was_online": "2025-01-18T20:16:15+00:00"}},
-            {"_": "UpdateUserStatus", "user_id": 503697665, "status": {"_": "UserStatusOnline", "expires": "2025-01-18T20:21:26+00:00"}},
-            {"_": "UpdateUserStatus", "user_id": 503697665, "status": {"_": "UserStatusOffline", "was_online": "2025-01-18T20:16:35+00:00"}},
-            {"_": "UpdateUserStatus", "user_id": 963334626, "status": {"_": "UserStatusOffline", "was_online": "2025-01-18T20:16:38+00:00"}},
-            {"_": "UpdateUserStatus", "user_id": 1062187409, "status": {"_": "UserStatusOnline", "expires": "2025-01-18T20:21:54+00:00"}}
-        ]
+    parser = argparse.ArgumentParser(description="Потоковый экспорт статусов пользователей из журнала в Google Таблицу.")
+    parser.add_argument("journal", help="Журнал (например, status.jsonl.enc) или каталог его сегментов")
+    parser.add_argument("credentials", help="Файл учетных данных Service Account")
+    parser.add_argument("--key", help="Ключ журнала, если журнал зашифрован")
+    parser.add_argument("--checkpoint", help="Файл позиции (по умолчанию <journal>.checkpoint)")
+    parser.add_argument("--sheet-url", default=SHEET_URL)
+    parser.add_argument("--worksheet-id", default=WORKSHEET_ID)
+    parser.add_argument("--batch-rows", type=int, default=500, help="Максимальное число строк в одном append_rows")
+    parser.add_argument("--batch-seconds", type=float, default=10.0, help="Максимальная задержка строки перед отправкой")
+    parser.add_argument("--poll-interval", type=float, default=2.0)
+    args = parser.parse_args()
 
-        # Передаем каждое событие в функцию записи
-        # for event in events:
-        log_status_to_google_sheet(sheet, events)
+    sheet = initialize_google_sheet("Telegram Status Logger", args.credentials, args.sheet_url, args.worksheet_id)
+    tail = JournalTail(args.journal, Fernet(args.key) if args.key else None, args.checkpoint)
+    exporter = StatusExporter(
+        tail,
+        GoogleSheetSink(sheet),
+        batch_rows=args.batch_rows,
+        batch_seconds=args.batch_seconds,
+        poll_interval=args.poll_interval,
+    )
+    exporter.run()
+    print("Экспорт остановлен:", exporter.stats())
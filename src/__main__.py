@@ -1,23 +1,101 @@
-import pickle
+import datetime
+import json
+import os
+import sys
+import time
 from telethon import events
 import asyncio
 import signal
 
+from cryptography.fernet import InvalidToken
 from config import AppConfig
 from src.handlers import EventHandlers
 from src.services.crypt import CipherHandler
+from src.services.dispatcher import JournalDispatcher
 from src.log_store import LogStoreManager
-from src.services.tg import TelegramEventListener
+from src.services.forwarder import ForwardBatcher
+from src.services.framing import BlockEncoder
+from src.services.journal import JournalWriter, LineEncoder
+from src.services.metrics import Metrics, MetricsServer
+from src.services.pipeline import EventPipeline
+from src.services.profiler import SamplingProfiler
+from src.services.router import EventRouter, serialize_status
+from src.services.serializers import JsonSerializer, get_serializer
+from src.services.snapshot import decode_segment, iter_raw_segments, write_snapshot
+from src.services.tg import SessionNotAuthorizedError, TelegramEventListener
+from src.stores.sqlite_backend import SqliteBackend
+from src.supervisor import EXIT_NOT_AUTHORIZED
 
 
 class EventLogger(TelegramEventListener):
     def __init__(self, config: AppConfig):
         # Настройка компонентов
+        self._created = time.perf_counter()
+        self._timings: dict[str, float] = dict()
         self._config = config
         self.cipher_handler = CipherHandler(config.journal_key)
-        super().__init__(self._config.tg_api_id, self._config.tg_api_hash)
+
+        # Сессия, журналы и хранилище каждого аккаунта лежат в своем каталоге;
+        # он фиксируется при запуске и не меняется при перечитывании конфигурации
+        self._data_dir = config.data_dir
+        os.makedirs(self._data_dir, exist_ok=True)
+        super().__init__(self._config.tg_api_id, self._config.tg_api_hash, self._data_path(config.session_name))
+
+        # Счетчики событий, время обработчиков и запросов к Telegram
+        self.metrics = Metrics()
+        self.metrics.instrument_client(self._client)
+        self.profiler = SamplingProfiler(config.profile_interval)
+        self.metrics_server = None
+        if config.metrics_port:
+            self.metrics_server = MetricsServer(
+                lambda: self.metrics.render(self.stats()), self.stats, config.metrics_host, config.metrics_port,
+            )
         
-        self.store_manager = LogStoreManager(self._client)
+        # С бэкендом SQLite данные пишутся на диск по мере поступления событий
+        backend = None
+        if config.store_backend == "sqlite":
+            backend = SqliteBackend(self._data_path(config.store_path), self.cipher_handler.cipher)
+
+        self.store_manager = LogStoreManager(
+            self._client,
+            max_messages=config.store_max_messages,
+            max_message_age=config.store_max_message_age,
+            eviction=config.store_eviction,
+            backend=backend,
+            entity_negative_ttl=config.entity_negative_ttl,
+            entity_max_age=config.entity_max_age,
+        )
+
+        # Сырые события фильтруются и раскладываются по журналам до сериализации
+        serializer = get_serializer(config.journal_format)
+        self.journal = self._make_journal("events", serializer)
+        sinks = {"journal": (self.journal, serializer.dumps)}
+        for sink in set(config.journal_routes.values()) - {"journal"}:
+            if sink == "status":
+                sinks[sink] = (self._make_journal(sink, JsonSerializer()), serialize_status)
+            else:
+                sinks[sink] = (self._make_journal(sink, serializer), serializer.dumps)
+        self.journals = [writer for writer, _ in sinks.values()]
+
+        self.router = EventRouter(
+            sinks,
+            routes=config.journal_routes,
+            allow=config.journal_allow,
+            deny=config.journal_deny,
+            deny_peers=config.journal_deny_peers,
+            sample=config.journal_sample,
+            status_dedup=config.status_dedup_window,
+        )
+
+        # Исходящие сообщения в чат журнала отправляются через общую очередь
+        self.dispatcher = JournalDispatcher(
+            self._client,
+            rate=config.dispatch_rate,
+            burst=config.dispatch_burst,
+            edit_interval=config.typing_edit_interval,
+        )
+
+        self.forwarder = ForwardBatcher(self._client, window=config.forward_window)
         
         # Создание обработчиков событий
         self.handlers = EventHandlers(
@@ -25,76 +103,351 @@ class EventLogger(TelegramEventListener):
             self._config,
             self.store_manager,
             self.cipher_handler,
+            self.router,
+            self.dispatcher,
+            self.forwarder,
         )
         
+        # Обработчики с запросами к Telegram выполняются пулом, по порядку внутри каждого чата
+        self.pipeline = EventPipeline(
+            workers=config.pipeline_workers,
+            queue_size=config.pipeline_queue_size,
+            overflow=config.pipeline_overflow,
+        )
+
         # Добавляем обработчики событий в клиент
-        self._client.add_event_handler(self.handlers.all_events_handler, event=events.Raw)
-        self._client.add_event_handler(self.handlers.typing_message_action, event=events.UserUpdate)
-        self._client.add_event_handler(self.handlers.delete_message_action, event=events.MessageDeleted)
-        self._client.add_event_handler(self.handlers.edit_message_action, event=events.MessageEdited)
-        self._client.add_event_handler(self.handlers.new_message_action, event=events.NewMessage)
+        timed = self.metrics.timed
+        self._client.add_event_handler(timed(self.handlers.all_events_handler), event=events.Raw)
+        self._client.add_event_handler(self.pipeline.wrap(timed(self.handlers.typing_message_action)), event=events.UserUpdate)
+        self._client.add_event_handler(self.pipeline.wrap(timed(self.handlers.delete_message_action)), event=events.MessageDeleted)
+        self._client.add_event_handler(self.pipeline.wrap(timed(self.handlers.edit_message_action)), event=events.MessageEdited)
+        self._client.add_event_handler(self.pipeline.wrap(timed(self.handlers.new_message_action)), event=events.NewMessage)
+
+        self._load_task = None
+        self._warmup_task = None
+        self._metrics_task = None
+        self._snapshot_broken = False
+        self._stopping = False
+        self._connect_started = 0.0
 
     async def all_events_handler(self, event):     
         pass
 
-    async def start(self, loop: asyncio.AbstractEventLoop):
+    def _data_path(self, name: str) -> str:
+        return os.path.join(self._data_dir, name)
+
+    def _make_journal(self, name: str, serializer) -> JournalWriter:
+        # Зашифрованный и двоичный журналы пишутся блоками, по одному токену Fernet на пачку
+        cipher = self.cipher_handler.cipher
+        if serializer.binary:
+            path, encoder = f"{name}.bin", BlockEncoder(cipher, serializer.codec)
+        elif cipher is None:
+            path, encoder = f"{name}.jsonl", LineEncoder()
+        else:
+            path, encoder = f"{name}.jsonl", BlockEncoder(cipher, serializer.codec)
+
+        if cipher is not None:
+            path += ".enc"
+
+        return JournalWriter(
+            self._data_path(path),
+            encoder,
+            queue_size=self._config.journal_queue_size,
+            batch_size=self._config.journal_batch_size,
+            flush_interval=self._config.journal_flush_interval,
+            fsync=self._config.journal_fsync,
+            overflow=self._config.journal_overflow,
+            rotate_bytes=self._config.journal_rotate_bytes,
+            rotate_seconds=self._config.journal_rotate_seconds,
+            compress=self._config.journal_compress,
+            index=self._config.journal_index,
+        )
+
+    async def run(self) -> int:
+        """
+        Запуск, работа до SIGINT/SIGTERM (или отключения клиента) и штатная остановка.
+
+        :return: Код завершения процесса.
+        """
+        loop = asyncio.get_running_loop()
+        self._stop_requested = asyncio.Event()
+        loop.add_signal_handler(signal.SIGINT, self._stop_requested.set)
+        loop.add_signal_handler(signal.SIGTERM, self._stop_requested.set)
+        loop.add_signal_handler(signal.SIGHUP, self.reload_config)
+        loop.add_signal_handler(signal.SIGUSR1, self.profile)
+
+        client_task = asyncio.create_task(self.start())
+        stop_task = asyncio.create_task(self._stop_requested.wait())
+        try:
+            await asyncio.wait({client_task, stop_task}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            stop_task.cancel()
+            await self.stop()
+
+        # Клиент завершается после disconnect в stop; ошибка подключения выводится здесь
+        try:
+            await asyncio.wait_for(client_task, 5.0)
+        except asyncio.TimeoutError:
+            pass
+        except SessionNotAuthorizedError as e:
+            print(e)
+            return EXIT_NOT_AUTHORIZED
+        except Exception as e:
+            print(f"Ошибка клиента Telegram: {e!r}")
+        return 0
+
+    async def start(self):
         """
         Метод для запуска клиента Telegram и загрузки данных из хранилища.
         """
-        self._loop = loop
-        loop.add_signal_handler(signal.SIGINT, lambda: asyncio.ensure_future(self.stop()))
+        self._timings["init"] = time.perf_counter() - self._created
+        started = time.perf_counter()
+
+        # Снимок хранилища загружается в фоне, клиент подключается сразу
+        if self.store_manager.persistent:
+            self.store_manager.backend.start()
+            # Снимок, оставшийся от STORE_BACKEND=pickle, один раз переносится в базу
+            if os.path.exists(self._snapshot_path):
+                self._load_task = asyncio.create_task(self.import_snapshot())
+        else:
+            self._load_task = asyncio.create_task(self.load_snapshot())
+
+        for journal in self.journals:
+            await journal.start()
+        self.dispatcher.start()
+        self.pipeline.start()
+
+        if self._config.metrics_interval > 0:
+            self._metrics_task = asyncio.create_task(self._write_metrics_periodically())
+        if self.metrics_server is not None:
+            await self.metrics_server.start()
+
+        self._timings["services"] = time.perf_counter() - started
+        self._connect_started = time.perf_counter()
+
+        # Запускаем Telegram клиент
+        await super().start()
+
+    async def on_started(self):
+        self._timings["connect"] = time.perf_counter() - self._connect_started
+        print("Startup: " + ", ".join(f"{name} {seconds:.3f}s" for name, seconds in self._timings.items()))
+
+        # Прогрев кэша сущностей идет в фоне, события обрабатываются сразу
+        if self._config.warmup:
+            self._warmup_task = asyncio.create_task(self.store_manager.entity_store.warm_up(
+                dialog_limit=self._config.warmup_dialog_limit,
+                participants=self._config.warmup_participants,
+                participants_limit=self._config.warmup_participants_limit,
+                concurrency=self._config.warmup_concurrency,
+            ))
+
+    @property
+    def _snapshot_path(self) -> str:
+        return self._data_path("data.raw" if self.cipher_handler.cipher is None else "data.raw.enc")
+
+    def stats(self) -> dict[str, dict]:
+        """
+        Метрики всех компонентов (их же собирает супервизор из metrics.json).
+        """
+        stats = {
+            "metrics": self.metrics.stats(),
+            "profiler": self.profiler.stats(),
+            "pipeline": self.pipeline.stats(),
+            "handlers": self.handlers.stats(),
+            "router": self.router.stats(),
+            "dispatcher": self.dispatcher.stats(),
+            "forwarder": self.forwarder.stats(),
+            "messages": self.store_manager.message_store.stats(),
+            "entities": self.store_manager.entity_store.stats(),
+        }
+        for journal in self.journals:
+            stats[f"journal:{os.path.basename(journal.path)}"] = journal.stats()
+        if self.store_manager.persistent:
+            stats["backend"] = self.store_manager.backend.stats()
+        return stats
+
+    async def _write_metrics_periodically(self):
+        path = self._data_path("metrics.json")
+        while True:
+            await asyncio.sleep(self._config.metrics_interval)
+            metrics = {"pid": os.getpid(), "time": time.time(), "stats": self.stats()}
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(metrics, f)
+            os.replace(tmp_path, path)
+
+    async def load_snapshot(self):
+        """
+        Потоковая загрузка снимка хранилища по сегментам с отчетом о времени.
+        """
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        read_seconds = decrypt_seconds = unpickle_seconds = apply_seconds = 0.0
+        counts: dict[str, int] = dict()
 
-        # Загружаем данные из локального хранилища
         try:
-            if self.cipher_handler.cipher is None:
-                with open("data.raw", "rb") as f:
-                    data = pickle.load(f)
-            else:
-                with open("data.raw.enc", "rb") as f:
-                    decrypted_data = self.cipher_handler.cipher.decrypt(f.read())
-                    data = pickle.loads(decrypted_data)
+            segments = iter_raw_segments(self._snapshot_path)
+            while True:
+                read_started = time.perf_counter()
+                segment = await loop.run_in_executor(None, next, segments, None)
+                read_seconds += time.perf_counter() - read_started
+                if segment is None:
+                    break
+
+                chunks, decrypt_time, unpickle_time = await loop.run_in_executor(
+                    None, decode_segment, segment, self.cipher_handler.cipher,
+                )
+                decrypt_seconds += decrypt_time
+                unpickle_seconds += unpickle_time
+
+                apply_started = time.perf_counter()
+                for kind, items in chunks:
+                    self.store_manager.load_chunk(kind, items)
+                    counts[kind] = counts.get(kind, 0) + len(items)
+                apply_seconds += time.perf_counter() - apply_started
         except FileNotFoundError:
             print("Store not found!")
-            data = None
+            return
+        except Exception as e:
+            # Недочитанный снимок нельзя перезаписывать при остановке
+            self._snapshot_broken = True
+            print(f"Ошибка загрузки снимка {self._snapshot_path}: {e!r}")
+            return
 
-        # Если данные существовали, загружаем их в хранилище
-        if data is not None:
-            self.store_manager.load(data["entities"], data["messages"])
+        print(
+            f"Snapshot loaded: {counts} in {time.perf_counter() - started:.3f}s "
+            f"(read {read_seconds:.3f}s, decrypt {decrypt_seconds:.3f}s, "
+            f"unpickle {unpickle_seconds:.3f}s, apply {apply_seconds:.3f}s)"
+        )
 
-        # Запускаем Telegram клиент
-        await super().start()
+    async def import_snapshot(self):
+        """
+        Перенос снимка в постоянное хранилище: данные загружаются как обычно и попадают
+        в базу через хранилища. Перенесенный снимок переименовывается в *.imported;
+        если он прочитан не полностью, перенос повторится при следующем запуске.
+        """
+        print(f"Перенос снимка {self._snapshot_path} в {self._data_path(self._config.store_path)}")
+        await self.load_snapshot()
+        if not self._snapshot_broken:
+            os.replace(self._snapshot_path, f"{self._snapshot_path}.imported")
+
+    def profile(self):
+        """
+        Снимает профиль цикла событий за PROFILE_SECONDS (по SIGUSR1), не прерывая работу.
+        """
+        path = self._data_path(f"profile_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.txt")
+        if not self.profiler.start(self._config.profile_seconds, path):
+            print("Профилирование уже идет")
+
+    def reload_config(self):
+        """
+        Перечитывает конфигурацию (по SIGHUP). Идентификаторы чатов применяются сразу,
+        ключи и параметры журнала - после перезапуска.
+        """
+        try:
+            self._config.reload()
+            print("Конфигурация перечитана")
+        except (KeyError, ValueError, RuntimeError, InvalidToken) as e:
+            print(f"Ошибка перечитывания конфигурации, действует прежняя: {e!r}")
 
     async def stop(self):
         """
-        Метод для остановки клиента Telegram и сохранения данных в локальное хранилище.
+        Штатная остановка по порядку: прием событий, обработчики, пересылка и журнал в Telegram
+        (в пределах SHUTDOWN_TIMEOUT), отключение клиента, файлы журналов, сохранение хранилища.
         """
+        if self._stopping:
+            return
+        self._stopping = True
+
         print("Штатное завершение работы EventLogger...")
-        print("Отключение клиента Telegram...")
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self._config.shutdown_timeout
+        remaining = lambda: max(0.0, deadline - loop.time())
+        timings = {}
+
+        if self._warmup_task is not None:
+            self._warmup_task.cancel()
+        if self._metrics_task is not None:
+            self._metrics_task.cancel()
+        if self.metrics_server is not None:
+            await self.metrics_server.stop()
+
+        # Новые события больше не принимаются, уже принятые обрабатываются до конца
+        started = time.perf_counter()
+        await self.pipeline.stop(timeout=remaining())
+        print(f"Pipeline stats: {self.pipeline.stats()}")
+        print(f"Handlers stats: {self.handlers.stats()}")
+        print(f"Metrics: {self.metrics.stats()}")
+        timings["handlers"] = time.perf_counter() - started
+
+        started = time.perf_counter()
         try:
-            await self._client.disconnect()
+            await asyncio.wait_for(self.forwarder.flush(), remaining())
+        except asyncio.TimeoutError:
+            print(f"Не переслано сообщений: {self.forwarder.stats()['pending']}")
+        timings["forwards"] = time.perf_counter() - started
+
+        print("Отправка очереди журнала...")
+        started = time.perf_counter()
+        await self.dispatcher.stop(timeout=remaining())
+        print(f"Dispatcher stats: {self.dispatcher.stats()}")
+        timings["dispatcher"] = time.perf_counter() - started
+
+        print("Отключение клиента Telegram...")
+        started = time.perf_counter()
+        await self._client.disconnect()
+        timings["disconnect"] = time.perf_counter() - started
+
+        # Файлы журналов и хранилище сохраняются всегда, независимо от оставшегося времени
+        print("Запись журнала событий...")
+        started = time.perf_counter()
+        for journal in self.journals:
+            await journal.stop()
+            print(f"Journal {journal.path} stats: {journal.stats()}")
+        print(f"Router stats: {self.router.stats()}")
+        timings["journals"] = time.perf_counter() - started
+
+        print("Сохранение данных в локальное хранилище...")
+        started = time.perf_counter()
+        if self.store_manager.persistent:
+            # Перенос снимка дописывается до закрытия базы
+            if self._load_task is not None:
+                await self._load_task
+            await self.store_manager.backend.stop()
+            print(f"Store stats: {self.store_manager.backend.stats()}")
+        else:
+            # Снимок нельзя перезаписывать, пока он не дочитан
+            if self._load_task is not None:
+                await self._load_task
+
+            path = self._snapshot_path
+            if self._snapshot_broken:
+                path = f"{path}.{int(time.time())}"
 
-            print("Сохранение данных в локальное хранилище...")
             dump_data = self.store_manager.dump()
+            await loop.run_in_executor(None, write_snapshot, path, dump_data, self.cipher_handler.cipher)
+            print(f"Snapshot saved to {path}")
+        timings["store"] = time.perf_counter() - started
 
-            if self.cipher_handler.cipher is None:
-                with open("data.raw", "wb") as f:
-                    pickle.dump(dump_data, f)
-            else:
-                with open("data.raw.enc", "wb") as f:
-                    f.write(self.cipher_handler.cipher.encrypt(pickle.dumps(dump_data)))
-        finally:
-            self._loop.stop()
+        print(
+            "Shutdown: " + ", ".join(f"{name} {seconds:.3f}s" for name, seconds in timings.items())
+            + f", total {sum(timings.values()):.3f}s"
+        )
 
 
-async def main():
+def main():
     # Конфигурация приложения
     config = AppConfig()
-    event_logger = EventLogger(config)
 
-    loop = asyncio.get_event_loop()
-    await event_logger.start(loop)
-    await loop.run_forever()
+    if config.event_loop == "uvloop":
+        try:
+            import uvloop
+            uvloop.install()
+        except ImportError:
+            print("uvloop не установлен, используется стандартный цикл asyncio")
+
+    sys.exit(asyncio.run(EventLogger(config).run()))
 
 # Запуск приложения
 if __name__ == "__main__":
-    asyncio.run(main())
+    main()
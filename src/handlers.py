@@ -1,19 +1,68 @@
+import asyncio
 import datetime
-from telethon import events, types, errors
-from cryptography.fernet import Fernet
+import time
+from typing import Callable
+
+from telethon import events, types, utils
+
+from src.services.dispatcher import PRIORITY_HIGH, JournalDispatcher, pack_lines
+from src.services.forwarder import ForwardBatcher
+from src.services.router import EventRouter
+from src.stores.message_store import StoredMessage, content_fingerprint
+
+# Число id в одной строке списка неизвестных удаленных сообщений
+UNKNOWN_IDS_PER_LINE = 20
+
+
+def entity_text(entity) -> str:
+    """
+    Текстовое представление пользователя, чата или канала для журнала.
+    """
+    if entity is None:
+        return "unknown"
+    if isinstance(entity, types.User):
+        return f"{entity.first_name} {entity.last_name} (@{entity.username}|{entity.id})"
+    if isinstance(entity, types.Channel):
+        return f"#{entity.title} ({entity.id})"
+    return f"\"{entity.title}\" ({entity.id})"
+
 
 class EventHandlers:
-    def __init__(self, client, config, store_manager, cipher_handler):
+    def __init__(
+        self,
+        client,
+        config,
+        store_manager,
+        cipher_handler,
+        router: EventRouter,
+        dispatcher: JournalDispatcher,
+        forwarder: ForwardBatcher,
+    ):
         self._client = client
         self.config = config
         self.store_manager = store_manager
         self.cipher_handler = cipher_handler
+        self._router = router
+        self._dispatcher = dispatcher
+        self._forwarder = forwarder
+
+        # Время последнего обработанного TYPING для пары (пользователь, чат)
+        self._typing_seen: dict[tuple[int, int], float] = dict()
+        # Последняя еще не отправленная в журнал запись по исходному чату (ждет пересылки)
+        self._journal_tails: dict[int, asyncio.Future] = dict()
+        # Правки без изменения содержимого: каждая экономит forward_messages и сообщение в журнал
+        # (оценка сверху - без пропуска они могли бы попасть в общие пачки)
+        self._edits_unchanged = 0
         
-        self._cipher = config.journal_key is not None and Fernet(config.journal_key) or None
-        
-        if self._cipher is  None:
+        if self.cipher_handler.cipher is None:
             print("Warning: encryption doesn't used!")
 
+    def stats(self) -> dict[str, int]:
+        return {
+            "edits_unchanged": self._edits_unchanged,
+            "rpc_saved": 2 * self._edits_unchanged,
+        }
+
     @property
     def _entity_store(self):
         return self.store_manager.entity_store
@@ -22,39 +71,82 @@ class EventHandlers:
     def _message_store(self):
         return self.store_manager.message_store
 
-    async def last_journal_message(self) -> types.Message | None:
-        return (await self._client.get_messages(types.PeerChat(self.config.journal_chat_id), limit=1))[0]
+    @property
+    def _journal_peer(self) -> types.PeerChat:
+        return types.PeerChat(self.config.journal_chat_id)
+
+    @property
+    def _fwd_peer(self) -> types.PeerChannel:
+        return types.PeerChannel(self.config.fwd_chat_id)
+
+    def _fwd_link(self, msg: types.Message | None) -> str | None:
+        return msg and f"https://t.me/c/{self.config.fwd_chat_id}/{msg.id}"
+
+    def _typing_coalesced(self, user_id: int, chat_id: int) -> bool:
+        now = time.monotonic()
+        key = (user_id, chat_id)
+
+        if now - self._typing_seen.get(key, float('-inf')) < self.config.typing_window:
+            return True
+        self._typing_seen[key] = now
+
+        if len(self._typing_seen) > 1000:
+            self._typing_seen = {
+                k: seen for k, seen in self._typing_seen.items()
+                if now - seen < self.config.typing_window
+            }
+        return False
+
+    def _journal_in_order(self, keys: tuple[int, ...], submit: Callable[[], None], after: asyncio.Future | None = None):
+        """
+        Постановка записи в журнал после пересылки after и после всех ранее начатых записей
+        тех же исходных чатов. Очередь чата в EventPipeline не ждет пересылку, поэтому порядок
+        записей одного чата (например, EDIT и следующий за ним REMOVE) сохраняется здесь.
+
+        :param keys: Исходные чаты записи.
+        :param submit: Постановка записи в JournalDispatcher.
+        :param after: Пересылка, результат которой нужен записи.
+        """
+        waits = {self._journal_tails.get(key) for key in keys}
+        waits = [future for future in (*waits, after) if future is not None and not future.done()]
+        if not waits:
+            submit()
+            return
+
+        step = asyncio.gather(*waits, return_exceptions=True)
+        step.add_done_callback(lambda _: submit())
+        for key in keys:
+            self._journal_tails[key] = step
+
+        def release(_):
+            for key in keys:
+                if self._journal_tails.get(key) is step:
+                    del self._journal_tails[key]
+
+        step.add_done_callback(release)
 
     async def typing_message_action(self, event: events.UserUpdate.Event):
         if not isinstance(event.action, types.SendMessageTypingAction):
             return
 
+        if self._typing_coalesced(event.user_id, event.chat_id):
+            return
+
         user: types.User = await self._entity_store.get_user(event.user_id)
-        last_msg: types.Message = await self.last_journal_message()
         
-        chat = await self._entity_store.get_chat(types.PeerChat(event.chat_id))
-        if isinstance(chat, types.User):
+        chat = await self._entity_store.get(event.chat_id)
+        if chat is None or isinstance(chat, types.User):
             chat_text = 'private'
         else:
-            chat_text = f"in \"{chat.title}\" ({chat.id})"
+            chat_text = f"in {entity_text(chat)}"
         
-        msg_text_prefix = f"TYPING from: {user.first_name} {user.last_name} (@{user.username}|{user.id}) {chat_text}"
+        msg_text_prefix = f"TYPING from: {entity_text(user)} {chat_text}"
         msg_text = f"{msg_text_prefix} {datetime.datetime.now().strftime('%H:%M:%S')}"
-        
-        if last_msg and last_msg.message.startswith(msg_text_prefix):
-            await self._client.edit_message(types.PeerChat(self.config.journal_chat_id), last_msg.id, msg_text)
-        elif msg_text != last_msg.message:        
-            await self._client.send_message(types.PeerChat(self.config.journal_chat_id), msg_text)
+
+        self._dispatcher.submit_typing(self._journal_peer, msg_text_prefix, msg_text)
 
     async def all_events_handler(self, event):     
-        if self._cipher is None:
-            with open("events.jsonl", "a") as f:
-                f.write(event.to_json())
-                f.write("\n")     
-        else:
-            with open("events.jsonl.enc", "a") as f:
-                f.write(self._cipher.encrypt(str(event.to_json()).encode()).decode())
-                f.write("\n")
+        await self._router.route(event)
 
     async def new_message_action(self, event: events.newmessage.NewMessage.Event):
         self._message_store.set(event.message)
@@ -64,65 +156,95 @@ class EventHandlers:
 
         message: types.TypeMessage = event.message
 
-        try:
-            msg = await self._client.forward_messages(types.PeerChannel(self.config.fwd_chat_id), message.id, from_peer=message.peer_id)
-        except errors.rpcerrorlist.ChatForwardsRestrictedError as e:
-            msg = (await self._client.get_messages(types.PeerChannel(self.config.fwd_chat_id), limit=1))[0]
-
-        self._message_store.set_fwd_link(message, f"https://t.me/c/{self.config.fwd_chat_id}/{msg.id}")
+        # Пересылка не ждется: следующие сообщения чата попадают в ту же пачку
+        future = self._forwarder.submit(self._fwd_peer, message)
+        future.add_done_callback(
+            lambda f: f.cancelled() or self._message_store.set_fwd_link(message, self._fwd_link(f.result()))
+        )
 
     async def edit_message_action(self, event: types.UpdateEditMessage):
         message = event.message
-        user =  await self._entity_store.get_peer(message.from_id or message.peer_id)
+        preview_msg = await self._message_store.get(message.id, message.peer_id)
+
+        # Реакции, предпросмотр ссылок и т.п. тоже приходят как правка - их не пересылаем
+        if preview_msg is not None and preview_msg.fingerprint == content_fingerprint(message):
+            self._edits_unchanged += 1
+            return
 
-        preview_msg = self._message_store.get(message.id)
-        old_link = self._message_store.get_fwd_link(message.id)
+        user =  await self._entity_store.get_peer(message.from_id or message.peer_id)
+        old_link = preview_msg and preview_msg.fwd_link
         
         self._message_store.set(message)
-        try:
-            msg = await self._client.forward_messages(types.PeerChannel(self.config.fwd_chat_id), message.id, from_peer=message.peer_id)
-            new_link = f"https://t.me/c/{self.config.fwd_chat_id}/{msg.id}"
-        except errors.rpcerrorlist.ChatForwardsRestrictedError as e:
-            new_link = None
 
-        self._message_store.set_fwd_link(message, new_link)
+        # Как и для новых сообщений, пересылка не держит очередь чата; запись в журнал - после нее
+        future = self._forwarder.submit(self._fwd_peer, message)
+        key = utils.get_peer_id(message.peer_id)
+
+        def journal_edit():
+            if future.cancelled():
+                return
+            new_link = self._fwd_link(future.result())
+            self._message_store.set_fwd_link(message, new_link)
 
-        msg_text = f"EDIT from: {user.first_name} {user.last_name} (@{user.username}|{user.id})\n\n" \
-            f"[before]({old_link or ''}): {preview_msg and preview_msg.message or ''}\n\n" \
-            f"[after]({new_link or ''}): {event and message.message or ''}"
+            msg_text = f"EDIT from: {entity_text(user)}\n\n" \
+                f"[before]({old_link or ''}): {preview_msg and preview_msg.text or ''}\n\n" \
+                f"[after]({new_link or ''}): {event and message.message or ''}"
 
-        await self._client.send_message(types.PeerChat(self.config.journal_chat_id), msg_text)
+            self._dispatcher.submit(self._journal_peer, msg_text, keys=(key,))
+
+        self._journal_in_order((key,), journal_edit, future)
         
     async def delete_message_action(self, event: events.MessageDeleted.Event):
-        chat: types.Chat = event.chat
-        
-        preview_msgs_with_links = [
-            (self._message_store.get(msg_id), self._message_store.get_fwd_link(msg_id))
-            for msg_id in event.deleted_ids or []
-        ]
-
-        text = "\n".join(
-            [
-                f"[before]({link}): {msg and msg.message or ''}"
-                for msg, link in preview_msgs_with_links
-            ]
-        )
-        
-        if preview_msgs_with_links[0][0] is not None:
-            if isinstance(preview_msgs_with_links[0][0].peer_id, types.PeerUser):
-                user = await self._entity_store.get_user(preview_msgs_with_links[0][0].peer_id.user_id)
-                user_text = f"{user.first_name} {user.last_name} (@{user.username}|{user.id})"
-            elif isinstance(preview_msgs_with_links[0][0].peer_id, types.PeerChat):            
-                user = await self._entity_store.get_chat(types.PeerChat(preview_msgs_with_links[0][0].peer_id.chat_id))
-                user_text = f"\"{user.title}\" ({user.id})"
-            elif isinstance(preview_msgs_with_links[0][0].peer_id, types.PeerChannel):            
-                user = await self._entity_store.get_chat(types.PeerChat(preview_msgs_with_links[0][0].peer_id.channel_id))
-                user_text = f"#{user.title} ({user.id})"
+        deleted_ids = event.deleted_ids or []
+        if not deleted_ids:
+            return
+
+        # Для каналов и супергрупп Telegram присылает чат, для остальных id уникальны в аккаунте
+        found = await self._message_store.get_many(deleted_ids, event.chat_id)
+
+        # Очистка чата приходит одной пачкой id: группируем по чату и отправителю
+        groups: dict[tuple[int, int], list[StoredMessage]] = dict()
+        unknown = []
+        for msg_id, msg in found.items():
+            if msg is None:
+                unknown.append(msg_id)
             else:
-                user_text = None                
-        else:
-            user_text = None
+                groups.setdefault((msg.peer_id, msg.sender_id or msg.peer_id), []).append(msg)
+
+        peer_ids = list({peer_id for key in groups for peer_id in key})
+        entities = dict(zip(peer_ids, await asyncio.gather(*(self._entity_store.get(peer_id) for peer_id in peer_ids))))
+
+        sections = []
+        for (peer_id, sender_id), msgs in groups.items():
+            chat = entities[peer_id]
+            chat_text = "" if peer_id == sender_id or isinstance(chat, types.User) else f" in {entity_text(chat)}"
+            header = f"REMOVE {len(msgs)} msg from {entity_text(entities[sender_id])}{chat_text}:"
+            sections.append((header, [f"[before]({msg.fwd_link or ''}): {msg.text or ''}" for msg in msgs]))
+        if unknown:
+            header = f"REMOVE {len(unknown)} unknown msg:"
+            lines = [
+                ", ".join(map(str, unknown[i:i + UNKNOWN_IDS_PER_LINE]))
+                for i in range(0, len(unknown), UNKNOWN_IDS_PER_LINE)
+            ]
+            sections.append((header, lines))
+
+        # REMOVE не обгоняет еще не записанные EDIT тех же чатов
+        keys = tuple({peer_id for peer_id, _ in groups} | ({event.chat_id} if event.chat_id else set()))
+
+        threshold = self.config.delete_file_threshold
+        if threshold and len(deleted_ids) > threshold:
+            # Большая пачка - одним файлом вместо десятков сообщений
+            data = "\n\n".join("\n".join([header, *lines]) for header, lines in sections).encode()
+            caption = f"REMOVE {len(deleted_ids)} msg ({len(unknown)} unknown)"
+            filename = f"removed_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
+            self._journal_in_order(keys, lambda: self._dispatcher.submit_file(
+                self._journal_peer, filename, data, caption, PRIORITY_HIGH, keys,
+            ))
+            return
 
-        msg = f"REMOVE msg from {user_text or ''}:\n{text}"
+        def journal_remove():
+            for header, lines in sections:
+                for chunk in pack_lines(header, lines, self._dispatcher.max_length):
+                    self._dispatcher.submit(self._journal_peer, chunk, PRIORITY_HIGH, keys)
 
-        await self._client.send_message(types.PeerChat(self.config.journal_chat_id), msg)
+        self._journal_in_order(keys, journal_remove)
@@ -1,17 +1,44 @@
 
 from src.stores.entities_store import EntityStore
 from src.stores.message_store import MessageStore
+from src.stores.sqlite_backend import SqliteBackend
 
 
 class LogStoreManager:
-    def __init__(self, client):
-        self.entity_store = EntityStore(client)
-        self.message_store = MessageStore()
+    def __init__(
+        self,
+        client,
+        max_messages: int = 200000,
+        max_message_age: float | None = None,
+        eviction: str = "lru",
+        backend: SqliteBackend | None = None,
+        entity_negative_ttl: float = 600.0,
+        entity_max_age: float | None = 86400.0,
+    ):
+        self.backend = backend
+        self.entity_store = EntityStore(client, backend, entity_negative_ttl, entity_max_age)
+        self.message_store = MessageStore(max_messages, max_message_age, eviction, backend)
+
+    @property
+    def persistent(self) -> bool:
+        """
+        True, если данные пишутся на диск по мере поступления и снимок при остановке не нужен.
+        """
+        return self.backend is not None
 
     def load(self, entities, messages):
         self.entity_store.load(entities)
         self.message_store.load(messages)
 
+    def load_chunk(self, kind: str, items: list):
+        """
+        Загрузка одного сегмента снимка поверх уже полученных из событий данных.
+        """
+        if kind == "entities":
+            self.entity_store.load(items, replace=False)
+        elif kind == "messages":
+            self.message_store.load(items, replace=False)
+
     def dump(self):
         return {
             "entities": self.entity_store.dump(),
@@ -1,7 +1,19 @@
 import os
+from dataclasses import dataclass, field
 from cryptography.fernet import Fernet
 from dotenv import load_dotenv
 
+from src.services.options import (
+    COMPRESSION_METHODS,
+    EVENT_LOOPS,
+    JOURNAL_FORMATS,
+    JOURNAL_FSYNC_POLICIES,
+    JOURNAL_OVERFLOW_POLICIES,
+    PIPELINE_OVERFLOW_POLICIES,
+    STORE_BACKENDS,
+    STORE_EVICTION_POLICIES,
+)
+
 
 class EncryptedEnvironment:
     def __init__(self, encryption_key: str):
@@ -44,35 +56,250 @@ class EncryptedEnvironment:
         return self.cipher.decrypt(encrypted_value.encode()).decode()
 
 
+# Переменные, которые задает процессу супервизор (src.supervisor): reload их не перекрывает
+PROCESS_ENV = ("DATA_DIR", "SESSION_NAME", "METRICS_INTERVAL", "ACCOUNT_ENV_FILE")
+
+
+def _env_set(key: str) -> frozenset[str]:
+    return frozenset(item.strip() for item in os.getenv(key, "").split(",") if item.strip())
+
+
+def _env_map(key: str) -> dict[str, str]:
+    """
+    Разбор переменной вида "A:1,B:2" в словарь.
+    """
+    return dict(item.split(":", 1) for item in _env_set(key))
+
+
+def _check_choice(name: str, value, choices):
+    if value not in choices:
+        raise ValueError(f"{name}: недопустимое значение '{value}', ожидается одно из: {', '.join(map(str, choices))}")
+
+
+def _check_min(name: str, value, minimum: float, strict: bool = False):
+    if value is not None and (value <= minimum if strict else value < minimum):
+        raise ValueError(f"{name}: значение {value} должно быть {'больше' if strict else 'не меньше'} {minimum}")
+
+
+@dataclass(frozen=True)
+class ConfigSnapshot:
+    tg_api_id: str
+    tg_api_hash: str
+    journal_key: str | None
+    fwd_chat_id: int
+    journal_chat_id: int
+
+    journal_queue_size: int = 10000
+    journal_batch_size: int = 500
+    journal_flush_interval: float = 1.0
+    journal_fsync: str = "batch"
+    journal_overflow: str = "drop"
+    journal_format: str = "json"
+    journal_rotate_bytes: int = 0
+    journal_rotate_seconds: float = 0.0
+    journal_compress: str | None = None
+    journal_index: bool = False
+
+    typing_window: float = 3.0
+    typing_edit_interval: float = 5.0
+    delete_file_threshold: int = 0
+
+    dispatch_rate: float = 1.0
+    dispatch_burst: int = 5
+
+    forward_window: float = 0.3
+
+    pipeline_workers: int = 4
+    pipeline_queue_size: int = 10000
+    pipeline_overflow: str = "block"
+
+    store_max_messages: int = 200000
+    store_max_message_age: float | None = None
+    store_eviction: str = "lru"
+    store_backend: str = "pickle"
+    store_path: str = "data.sqlite"
+
+    entity_negative_ttl: float = 600.0
+    entity_max_age: float | None = 86400.0
+
+    warmup: bool = False
+    warmup_dialog_limit: int | None = None
+    warmup_participants: bool = False
+    warmup_participants_limit: int | None = 1000
+    warmup_concurrency: int = 4
+
+    journal_routes: dict[str, str] = field(default_factory=dict)
+    journal_allow: frozenset[str] = frozenset()
+    journal_deny: frozenset[str] = frozenset()
+    journal_deny_peers: frozenset[int] = frozenset()
+    journal_sample: dict[str, float] = field(default_factory=dict)
+    status_dedup_window: float = 0.0
+
+    data_dir: str = "."
+    session_name: str = "event_listener"
+    metrics_interval: float = 0.0
+    metrics_host: str = "127.0.0.1"
+    metrics_port: int = 0
+    profile_seconds: float = 30.0
+    profile_interval: float = 0.005
+
+    event_loop: str = "asyncio"
+    shutdown_timeout: float = 30.0
+
+    def __post_init__(self):
+        # Ошибка в значении обнаруживается при чтении конфигурации, а не при первом использовании
+        _check_choice("JOURNAL_FSYNC", self.journal_fsync, JOURNAL_FSYNC_POLICIES)
+        _check_choice("JOURNAL_OVERFLOW", self.journal_overflow, JOURNAL_OVERFLOW_POLICIES)
+        _check_choice("JOURNAL_FORMAT", self.journal_format, JOURNAL_FORMATS)
+        _check_choice("JOURNAL_COMPRESS", self.journal_compress, (None, *COMPRESSION_METHODS))
+        _check_choice("PIPELINE_OVERFLOW", self.pipeline_overflow, PIPELINE_OVERFLOW_POLICIES)
+        _check_choice("STORE_EVICTION", self.store_eviction, STORE_EVICTION_POLICIES)
+        _check_choice("STORE_BACKEND", self.store_backend, STORE_BACKENDS)
+        _check_choice("EVENT_LOOP", self.event_loop, EVENT_LOOPS)
+
+        for name, value in (
+            ("JOURNAL_QUEUE_SIZE", self.journal_queue_size),
+            ("JOURNAL_BATCH_SIZE", self.journal_batch_size),
+            ("JOURNAL_FLUSH_INTERVAL", self.journal_flush_interval),
+            ("DISPATCH_RATE", self.dispatch_rate),
+            ("DISPATCH_BURST", self.dispatch_burst),
+            ("PIPELINE_WORKERS", self.pipeline_workers),
+            ("PIPELINE_QUEUE_SIZE", self.pipeline_queue_size),
+            ("STORE_MAX_MESSAGES", self.store_max_messages),
+            ("STORE_MAX_MESSAGE_AGE", self.store_max_message_age),
+            ("WARMUP_CONCURRENCY", self.warmup_concurrency),
+            ("PROFILE_SECONDS", self.profile_seconds),
+            ("PROFILE_INTERVAL", self.profile_interval),
+        ):
+            _check_min(name, value, 0, strict=True)
+
+        for name, value in (
+            ("JOURNAL_ROTATE_BYTES", self.journal_rotate_bytes),
+            ("JOURNAL_ROTATE_SECONDS", self.journal_rotate_seconds),
+            ("TYPING_WINDOW", self.typing_window),
+            ("TYPING_EDIT_INTERVAL", self.typing_edit_interval),
+            ("DELETE_FILE_THRESHOLD", self.delete_file_threshold),
+            ("FORWARD_WINDOW", self.forward_window),
+            ("ENTITY_NEGATIVE_TTL", self.entity_negative_ttl),
+            ("ENTITY_MAX_AGE", self.entity_max_age),
+            ("STATUS_DEDUP_WINDOW", self.status_dedup_window),
+            ("METRICS_INTERVAL", self.metrics_interval),
+            ("METRICS_PORT", self.metrics_port),
+            ("SHUTDOWN_TIMEOUT", self.shutdown_timeout),
+        ):
+            _check_min(name, value, 0)
+
+        if self.metrics_port > 65535:
+            raise ValueError(f"METRICS_PORT: недопустимый порт {self.metrics_port}")
+        for name, rate in self.journal_sample.items():
+            if not 0 <= rate <= 1:
+                raise ValueError(f"JOURNAL_SAMPLE: доля для {name} должна быть от 0 до 1, получено {rate}")
+
+
 class AppConfig:
     def __init__(self, sec_key: str | None = None):
+        """
+        Конфигурация приложения.
+
+        Зашифрованные значения расшифровываются один раз при создании (и при reload),
+        после чего поля читаются из неизменяемого снимка ConfigSnapshot.
+
+        :param sec_key: Ключ шифрования переменных окружения (по умолчанию SEC_KEY или ввод с клавиатуры).
+        """
         if (sec_key is None):
             sec_key = os.getenv("SEC_KEY") or None
 
         if (sec_key is None):
             sec_key = input("Введите ключ шифрования: ")
 
+        self._process_env = {key: os.environ[key] for key in PROCESS_ENV if key in os.environ}
         self._env_manager = EncryptedEnvironment(sec_key)
-        
-    @property
-    def tg_api_id(self) -> str:
-        return self._env_manager.get_encrypted_env("ENCRYPTED_TG_API_ID")
-
-    @property
-    def tg_api_hash(self) -> str:
-        return self._env_manager.get_encrypted_env("ENCRYPTED_TG_API_HASH")
-    
-    @property
-    def journal_key(self) -> str:
-        return self._env_manager.get_encrypted_env("ENCRYPTED_JOURNAL_KEY")
-    
-    @property
-    def fwd_chat_id(self) -> str:
-        return int(self._env_manager.get_encrypted_env("ENCRYPTED_FWD_MSG_CHAT_ID"))
-    
-    @property
-    def journal_chat_id(self) -> str:
-        return int(self._env_manager.get_encrypted_env("ENCRYPTED_JOURNAL_CHAT_ID"))
+        self._load_account_env()
+        self.snapshot = self._read_snapshot()
+
+    def reload(self) -> ConfigSnapshot:
+        """
+        Перечитывает .env и заново расшифровывает значения.
+        Переменные процесса из PROCESS_ENV, как и при запуске, важнее .env.
+
+        :return: Новый снимок конфигурации.
+        :raises ValueError: Если значение недопустимо; действующий снимок при этом не меняется.
+        """
+        load_dotenv(".env", override=True)
+        os.environ.update(self._process_env)
+        self._load_account_env()
+        self.snapshot = self._read_snapshot()
+        return self.snapshot
+
+    @staticmethod
+    def _load_account_env():
+        # Настройки отдельного аккаунта (см. src.supervisor) перекрывают общий .env
+        account_env = os.getenv("ACCOUNT_ENV_FILE")
+        if account_env:
+            load_dotenv(account_env, override=True)
+
+    def _read_snapshot(self) -> ConfigSnapshot:
+        env = self._env_manager
+        journal_key = os.getenv("ENCRYPTED_JOURNAL_KEY") and env.get_encrypted_env("ENCRYPTED_JOURNAL_KEY")
+
+        return ConfigSnapshot(
+            tg_api_id=env.get_encrypted_env("ENCRYPTED_TG_API_ID"),
+            tg_api_hash=env.get_encrypted_env("ENCRYPTED_TG_API_HASH"),
+            journal_key=journal_key or None,
+            fwd_chat_id=int(env.get_encrypted_env("ENCRYPTED_FWD_MSG_CHAT_ID")),
+            journal_chat_id=int(env.get_encrypted_env("ENCRYPTED_JOURNAL_CHAT_ID")),
+            journal_queue_size=int(os.getenv("JOURNAL_QUEUE_SIZE", 10000)),
+            journal_batch_size=int(os.getenv("JOURNAL_BATCH_SIZE", 500)),
+            journal_flush_interval=float(os.getenv("JOURNAL_FLUSH_INTERVAL", 1.0)),
+            journal_fsync=os.getenv("JOURNAL_FSYNC", "batch"),
+            journal_overflow=os.getenv("JOURNAL_OVERFLOW", "drop"),
+            journal_format=os.getenv("JOURNAL_FORMAT", "json"),
+            journal_rotate_bytes=int(os.getenv("JOURNAL_ROTATE_BYTES", 0)),
+            journal_rotate_seconds=float(os.getenv("JOURNAL_ROTATE_SECONDS", 0)),
+            journal_compress=os.getenv("JOURNAL_COMPRESS") or None,
+            journal_index=os.getenv("JOURNAL_INDEX", "0") == "1",
+            typing_window=float(os.getenv("TYPING_WINDOW", 3.0)),
+            typing_edit_interval=float(os.getenv("TYPING_EDIT_INTERVAL", 5.0)),
+            delete_file_threshold=int(os.getenv("DELETE_FILE_THRESHOLD", 0)),
+            dispatch_rate=float(os.getenv("DISPATCH_RATE", 1.0)),
+            dispatch_burst=int(os.getenv("DISPATCH_BURST", 5)),
+            forward_window=float(os.getenv("FORWARD_WINDOW", 0.3)),
+            pipeline_workers=int(os.getenv("PIPELINE_WORKERS", 4)),
+            pipeline_queue_size=int(os.getenv("PIPELINE_QUEUE_SIZE", 10000)),
+            pipeline_overflow=os.getenv("PIPELINE_OVERFLOW", "block"),
+            store_max_messages=int(os.getenv("STORE_MAX_MESSAGES", 200000)),
+            store_max_message_age=float(os.getenv("STORE_MAX_MESSAGE_AGE")) if os.getenv("STORE_MAX_MESSAGE_AGE") else None,
+            store_eviction=os.getenv("STORE_EVICTION", "lru"),
+            store_backend=os.getenv("STORE_BACKEND", "pickle"),
+            store_path=os.getenv("STORE_PATH", "data.sqlite"),
+            entity_negative_ttl=float(os.getenv("ENTITY_NEGATIVE_TTL", 600.0)),
+            entity_max_age=float(os.getenv("ENTITY_MAX_AGE", 86400.0)) or None,
+            warmup=os.getenv("WARMUP", "0") == "1",
+            warmup_dialog_limit=int(os.getenv("WARMUP_DIALOG_LIMIT", 0)) or None,
+            warmup_participants=os.getenv("WARMUP_PARTICIPANTS", "0") == "1",
+            warmup_participants_limit=int(os.getenv("WARMUP_PARTICIPANTS_LIMIT", 1000)) or None,
+            warmup_concurrency=int(os.getenv("WARMUP_CONCURRENCY", 4)),
+            journal_routes=_env_map("JOURNAL_ROUTES"),
+            journal_allow=_env_set("JOURNAL_ALLOW"),
+            journal_deny=_env_set("JOURNAL_DENY"),
+            journal_deny_peers=frozenset(int(peer) for peer in _env_set("JOURNAL_DENY_PEERS")),
+            journal_sample={name: float(rate) for name, rate in _env_map("JOURNAL_SAMPLE").items()},
+            status_dedup_window=float(os.getenv("STATUS_DEDUP_WINDOW", 0.0)),
+            data_dir=os.getenv("DATA_DIR") or ".",
+            session_name=os.getenv("SESSION_NAME") or "event_listener",
+            metrics_interval=float(os.getenv("METRICS_INTERVAL", 0.0)),
+            metrics_host=os.getenv("METRICS_HOST") or "127.0.0.1",
+            metrics_port=int(os.getenv("METRICS_PORT", 0)),
+            profile_seconds=float(os.getenv("PROFILE_SECONDS", 30.0)),
+            profile_interval=float(os.getenv("PROFILE_INTERVAL", 0.005)),
+            event_loop=os.getenv("EVENT_LOOP", "asyncio"),
+            shutdown_timeout=float(os.getenv("SHUTDOWN_TIMEOUT", 30.0)),
+        )
+
+    def __getattr__(self, name: str):
+        if name == "snapshot":
+            raise AttributeError(name)
+        return getattr(self.snapshot, name)
 
     def __str__(self):
         return (
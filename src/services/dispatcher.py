@@ -0,0 +1,425 @@
+import asyncio
+import heapq
+import io
+import itertools
+import time
+
+from telethon import TelegramClient, errors, utils
+
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+# Максимальная длина текстового сообщения Telegram
+MAX_MESSAGE_LENGTH = 4096
+
+# Повторы отправки после сетевых и прочих не-RPC ошибок
+MAX_RETRIES = 3
+RETRY_DELAY = 2.0
+
+
+def split_text(text: str, limit: int = MAX_MESSAGE_LENGTH) -> list[str]:
+    """
+    Разбивает текст на части не длиннее limit, по возможности по переводам строк.
+    Пустые части (и пустой текст) отбрасываются: Telegram не принимает пустые сообщения.
+    """
+    chunks = []
+    while len(text) > limit:
+        cut = text.rfind("\n", 0, limit)
+        if cut <= 0:
+            cut = limit
+        chunks.append(text[:cut])
+        text = text[cut:].lstrip("\n")
+    chunks.append(text)
+    return [chunk for chunk in chunks if chunk.strip()]
+
+
+def pack_lines(header: str, lines: list[str], limit: int = MAX_MESSAGE_LENGTH) -> list[str]:
+    """
+    Собирает строки в сообщения не длиннее limit, каждое начинается с header.
+    Строка, которая не помещается даже одна, обрезается.
+    """
+    room = limit - len(header) - 1
+    chunks, current, length = [], [], 0
+    for line in lines:
+        if len(line) > room:
+            line = line[:room - 1] + "…"
+        if current and length + 1 + len(line) > room:
+            chunks.append("\n".join([header, *current]))
+            current, length = [], 0
+        length += len(line) + (1 if current else 0)
+        current.append(line)
+    if current:
+        chunks.append("\n".join([header, *current]))
+    return chunks
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        """
+        :param rate: Число отправок в секунду в среднем.
+        :param burst: Максимальное число отправок подряд.
+        """
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+
+    def delay(self, now: float) -> float:
+        """
+        Сколько секунд осталось до появления свободного токена.
+        """
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        return 0.0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+
+    def take(self):
+        self._tokens -= 1
+
+
+class _Job:
+    __slots__ = ("priority", "seq", "text", "prefix", "file", "keys", "attempts")
+
+    def __init__(
+        self,
+        priority: int,
+        seq: int,
+        text: str,
+        prefix: str | None = None,
+        file: tuple[str, bytes] | None = None,
+        keys: tuple[int, ...] = (),
+    ):
+        self.priority = priority
+        self.seq = seq
+        self.text = text
+        # Для TYPING: префикс, по которому решается, редактировать ли последнее сообщение
+        self.prefix = prefix
+        # Для файлов: (имя, содержимое), text - подпись
+        self.file = file
+        # Исходные чаты записи: записи одного чата отправляются в порядке постановки
+        self.keys = keys
+        self.attempts = 0
+
+    def __lt__(self, other: "_Job") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class _ChatQueue:
+    def __init__(self, peer, bucket: TokenBucket):
+        self.peer = peer
+        self.bucket = bucket
+        self.jobs: list[_Job] = []
+        self.typing: dict[str, _Job] = dict()
+        self.blocked_until = 0.0
+        self.last_message: tuple[int, str] | None = None
+        self.last_message_loaded = False
+        self.last_edit = 0.0
+
+
+class JournalDispatcher:
+    def __init__(
+        self,
+        client: TelegramClient,
+        rate: float = 1.0,
+        burst: int = 5,
+        edit_interval: float = 5.0,
+        max_length: int = MAX_MESSAGE_LENGTH,
+    ):
+        """
+        Единая очередь исходящих сообщений журнала.
+
+        Обработчики только ставят строки в очередь и не ждут отправки. Фоновая задача
+        отправляет их с ограничением частоты по каждому чату, объединяет несколько
+        ожидающих строк в одно сообщение и при FloodWait откладывает отправку.
+
+        :param client: Клиент Telegram.
+        :param rate: Средняя частота отправок в один чат (сообщений в секунду).
+        :param burst: Максимальное число отправок в один чат подряд.
+        :param edit_interval: Минимальный интервал (сек.) между редактированиями строки TYPING.
+        :param max_length: Максимальная длина одного сообщения.
+        """
+        self._client = client
+        self.rate = rate
+        self.burst = burst
+        self.edit_interval = edit_interval
+        self.max_length = max_length
+
+        self._chats: dict[int, _ChatQueue] = dict()
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._closing = False
+
+        self._submitted = 0
+        self._sent = 0
+        self._edited = 0
+        self._merged = 0
+        self._coalesced = 0
+        self._failed = 0
+        self._retried = 0
+        self._restarts = 0
+        self._flood_waits = 0
+        self._flood_wait_seconds = 0
+
+    def start(self):
+        self._task = asyncio.create_task(self._serve())
+
+    async def stop(self, timeout: float = 10.0):
+        """
+        Отправка оставшихся сообщений с ограничением по времени.
+
+        :param timeout: Максимальное время (сек.) на отправку очереди.
+        """
+        if self._task is None:
+            return
+
+        self._closing = True
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            print(f"Не отправлено {self.pending()} сообщений журнала")
+        self._task = None
+
+    def submit(self, peer, text: str, priority: int = PRIORITY_NORMAL, keys: tuple[int, ...] = ()):
+        """
+        Постановка текста в очередь на отправку. Не блокирует вызывающего.
+
+        :param peer: Чат назначения.
+        :param text: Текст сообщения.
+        :param priority: Приоритет (меньше - раньше).
+        :param keys: Исходные чаты записи. Ожидающие записи тех же чатов с меньшим приоритетом
+            получают приоритет новой, чтобы она их не обогнала.
+        """
+        chunks = split_text(text, self.max_length)
+        if not chunks:
+            return
+
+        chat = self._chat(peer)
+        self._promote(chat, keys, priority)
+        for chunk in chunks:
+            heapq.heappush(chat.jobs, _Job(priority, next(self._seq), chunk, keys=keys))
+            self._submitted += 1
+        self._wakeup.set()
+
+    def submit_file(
+        self,
+        peer,
+        filename: str,
+        data: bytes,
+        caption: str = "",
+        priority: int = PRIORITY_NORMAL,
+        keys: tuple[int, ...] = (),
+    ):
+        """
+        Постановка файла в очередь на отправку. Файлы не объединяются с текстом.
+
+        :param peer: Чат назначения.
+        :param filename: Имя файла в Telegram.
+        :param data: Содержимое файла.
+        :param caption: Подпись (обрезается до max_length).
+        :param priority: Приоритет (меньше - раньше).
+        :param keys: Исходные чаты записи, см. submit.
+        """
+        chat = self._chat(peer)
+        self._promote(chat, keys, priority)
+        heapq.heappush(chat.jobs, _Job(priority, next(self._seq), caption[:self.max_length], file=(filename, data), keys=keys))
+        self._submitted += 1
+        self._wakeup.set()
+
+    def submit_typing(self, peer, prefix: str, text: str):
+        """
+        Постановка строки TYPING. Если последнее сообщение в чате начинается с prefix,
+        оно будет отредактировано, иначе отправлено новое. Ожидающие строки с тем же
+        префиксом заменяются последней.
+
+        :param peer: Чат назначения.
+        :param prefix: Неизменяемая часть строки (пользователь и чат).
+        :param text: Полный текст строки.
+        """
+        chat = self._chat(peer)
+        job = chat.typing.get(prefix)
+        if job is not None:
+            job.text = text
+            self._coalesced += 1
+            return
+
+        job = _Job(PRIORITY_LOW, next(self._seq), text, prefix)
+        chat.typing[prefix] = job
+        heapq.heappush(chat.jobs, job)
+        self._submitted += 1
+        self._wakeup.set()
+
+    def pending(self) -> int:
+        return sum(len(chat.jobs) for chat in self._chats.values())
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "pending": self.pending(),
+            "submitted": self._submitted,
+            "sent": self._sent,
+            "edited": self._edited,
+            "merged": self._merged,
+            "coalesced": self._coalesced,
+            "failed": self._failed,
+            "retried": self._retried,
+            "restarts": self._restarts,
+            "flood_waits": self._flood_waits,
+            "flood_wait_seconds": self._flood_wait_seconds,
+        }
+
+    def _chat(self, peer) -> _ChatQueue:
+        key = utils.get_peer_id(peer)
+        chat = self._chats.get(key)
+        if chat is None:
+            chat = self._chats[key] = _ChatQueue(peer, TokenBucket(self.rate, self.burst))
+        return chat
+
+    def _promote(self, chat: _ChatQueue, keys: tuple[int, ...], priority: int):
+        if not keys:
+            return
+        promoted = False
+        for job in chat.jobs:
+            if job.priority > priority and any(key in job.keys for key in keys):
+                job.priority = priority
+                promoted = True
+        if promoted:
+            heapq.heapify(chat.jobs)
+
+    def _ready_at(self, chat: _ChatQueue, now: float) -> float:
+        ready = max(chat.blocked_until, now + chat.bucket.delay(now))
+        head = chat.jobs[0]
+        if head.prefix is not None and chat.last_message and chat.last_message[1].startswith(head.prefix):
+            ready = max(ready, chat.last_edit + self.edit_interval)
+        return ready
+
+    async def _serve(self):
+        # Сбой цикла отправки не должен останавливать журнал: очередь сохраняется, цикл перезапускается
+        while True:
+            try:
+                return await self._run()
+            except Exception as e:
+                self._restarts += 1
+                print(f"Сбой отправки журнала, перезапуск: {e!r}")
+                await asyncio.sleep(RETRY_DELAY)
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            now = time.monotonic()
+
+            ready, wait = None, None
+            for chat in self._chats.values():
+                if not chat.jobs:
+                    continue
+                at = self._ready_at(chat, now)
+                if at <= now:
+                    ready = chat
+                    break
+                wait = at - now if wait is None else min(wait, at - now)
+
+            if ready is not None:
+                await self._dispatch(ready)
+                continue
+
+            if self._closing and wait is None:
+                return
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _dispatch(self, chat: _ChatQueue):
+        job = heapq.heappop(chat.jobs)
+        batch = [job]
+
+        if job.prefix is not None:
+            chat.typing.pop(job.prefix, None)
+        elif job.file is None:
+            # Объединяем следующие текстовые строки, пока помещаемся в одно сообщение
+            length = len(job.text)
+            while chat.jobs and chat.jobs[0].prefix is None and chat.jobs[0].file is None \
+                    and length + 2 + len(chat.jobs[0].text) <= self.max_length:
+                batch.append(heapq.heappop(chat.jobs))
+                length += 2 + len(batch[-1].text)
+            self._merged += len(batch) - 1
+
+        chat.bucket.take()
+        try:
+            if job.prefix is not None:
+                await self._send_typing(chat, job)
+            elif job.file is not None:
+                await self._send_file(chat, job)
+            else:
+                text = "\n\n".join(item.text for item in batch)
+                msg = await self._client.send_message(chat.peer, text)
+                chat.last_message = (msg.id, text)
+                self._sent += 1
+        except errors.FloodWaitError as e:
+            self._flood_waits += 1
+            self._flood_wait_seconds += e.seconds
+            chat.blocked_until = time.monotonic() + e.seconds
+            self._requeue(chat, batch)
+            print(f"FloodWait {e.seconds} сек. для журнала {utils.get_peer_id(chat.peer)}")
+        except errors.RPCError as e:
+            self._failed += len(batch)
+            print(f"Ошибка отправки в журнал: {e}")
+        except Exception as e:
+            # Сетевые и прочие ошибки: несколько повторов с паузой, затем сообщения отбрасываются
+            for item in batch:
+                item.attempts += 1
+            attempts = max(item.attempts for item in batch)
+            if attempts > MAX_RETRIES:
+                self._failed += len(batch)
+                print(f"Ошибка отправки в журнал, {len(batch)} сообщений отброшено: {e!r}")
+                return
+            self._retried += len(batch)
+            chat.blocked_until = time.monotonic() + RETRY_DELAY * attempts
+            self._requeue(chat, batch)
+            print(f"Ошибка отправки в журнал, повтор {attempts}/{MAX_RETRIES}: {e!r}")
+
+    def _requeue(self, chat: _ChatQueue, batch: list[_Job]):
+        for item in batch:
+            if item.prefix is not None:
+                if item.prefix in chat.typing:
+                    continue
+                chat.typing[item.prefix] = item
+            heapq.heappush(chat.jobs, item)
+
+    async def _send_file(self, chat: _ChatQueue, job: _Job):
+        filename, data = job.file
+        buffer = io.BytesIO(data)
+        buffer.name = filename
+        msg = await self._client.send_file(chat.peer, buffer, caption=job.text)
+        chat.last_message = (msg.id, job.text)
+        self._sent += 1
+
+    async def _send_typing(self, chat: _ChatQueue, job: _Job):
+        if not chat.last_message_loaded:
+            chat.last_message_loaded = True
+            if chat.last_message is None:
+                messages = await self._client.get_messages(chat.peer, limit=1)
+                if messages:
+                    chat.last_message = (messages[0].id, messages[0].message or '')
+
+        if chat.last_message and chat.last_message[1].startswith(job.prefix):
+            await self._client.edit_message(chat.peer, chat.last_message[0], job.text)
+            chat.last_message = (chat.last_message[0], job.text)
+            chat.last_edit = time.monotonic()
+            self._edited += 1
+        elif chat.last_message is None or job.text != chat.last_message[1]:
+            msg = await self._client.send_message(chat.peer, job.text)
+            chat.last_message = (msg.id, job.text)
+            self._sent += 1
+
+
+__all__ = [
+    'JournalDispatcher',
+    'PRIORITY_HIGH',
+    'PRIORITY_LOW',
+    'PRIORITY_NORMAL',
+    'pack_lines',
+    'split_text',
+]
@@ -0,0 +1,130 @@
+import asyncio
+
+from telethon import TelegramClient, errors, types, utils
+
+
+class _Batch:
+    __slots__ = ("to_peer", "from_peer", "ids", "futures", "task")
+
+    def __init__(self, to_peer, from_peer):
+        self.to_peer = to_peer
+        self.from_peer = from_peer
+        self.ids: list[int] = []
+        self.futures: list[asyncio.Future] = []
+        self.task: asyncio.Task | None = None
+
+
+class ForwardBatcher:
+    def __init__(self, client: TelegramClient, window: float = 0.3, max_batch: int = 100):
+        """
+        Пересылка сообщений пачками.
+
+        Сообщения из одного чата, пришедшие в пределах окна window, пересылаются
+        одним вызовом forward_messages; каждый вызывающий получает свою копию.
+
+        :param client: Клиент Telegram.
+        :param window: Время (сек.) накопления пачки.
+        :param max_batch: Максимальное число сообщений в одном вызове (ограничение Telegram - 100).
+        """
+        self._client = client
+        self.window = window
+        self.max_batch = max_batch
+
+        self._pending: dict[tuple[int, int], _Batch] = dict()
+        # Пачки, пересылка которых уже идет
+        self._flushing: set[asyncio.Task] = set()
+
+        self._forwarded = 0
+        self._batches = 0
+        self._restricted = 0
+        self._failed = 0
+
+    async def forward(self, to_peer, message: types.Message) -> types.Message | None:
+        """
+        Пересылка сообщения в составе ближайшей пачки.
+
+        :param to_peer: Чат, куда пересылается сообщение.
+        :param message: Исходное сообщение.
+        :return: Пересланное сообщение или None, если переслать не удалось.
+        """
+        return await self.submit(to_peer, message)
+
+    def submit(self, to_peer, message: types.Message) -> asyncio.Future:
+        """
+        Добавление сообщения в ближайшую пачку без ожидания пересылки.
+
+        :return: Future с пересланным сообщением (или None), см. forward.
+        """
+        key = (utils.get_peer_id(to_peer), utils.get_peer_id(message.peer_id))
+        batch = self._pending.get(key)
+        if batch is None:
+            batch = self._pending[key] = _Batch(to_peer, message.peer_id)
+            batch.task = asyncio.create_task(self._flush_later(key, batch))
+
+        future = asyncio.get_running_loop().create_future()
+        batch.ids.append(message.id)
+        batch.futures.append(future)
+
+        if len(batch.ids) >= self.max_batch:
+            batch.task.cancel()
+            self._pending.pop(key, None)
+            batch.task = asyncio.create_task(self._flush(batch))
+
+        return future
+
+    async def flush(self):
+        """
+        Немедленная пересылка всех накопленных пачек и ожидание уже начатых пересылок.
+        """
+        batches = list(self._pending.values())
+        self._pending.clear()
+        for batch in batches:
+            batch.task.cancel()
+        await asyncio.gather(*self._flushing, *(self._flush(batch) for batch in batches))
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "pending": sum(len(batch.ids) for batch in self._pending.values()),
+            "forwarded": self._forwarded,
+            "batches": self._batches,
+            "restricted": self._restricted,
+            "failed": self._failed,
+        }
+
+    async def _flush_later(self, key: tuple[int, int], batch: _Batch):
+        await asyncio.sleep(self.window)
+        if self._pending.get(key) is batch:
+            del self._pending[key]
+        await self._flush(batch)
+
+    async def _flush(self, batch: _Batch):
+        task = asyncio.current_task()
+        self._flushing.add(task)
+        self._batches += 1
+        try:
+            result = await self._client.forward_messages(batch.to_peer, batch.ids, from_peer=batch.from_peer)
+
+            # forward_messages возвращает список в порядке переданных id (None для непересланных)
+            for future, msg in zip(batch.futures, result):
+                if msg is not None:
+                    self._forwarded += 1
+                if not future.done():
+                    future.set_result(msg)
+        except errors.rpcerrorlist.ChatForwardsRestrictedError:
+            self._restricted += len(batch.ids)
+        except asyncio.CancelledError:
+            for future in batch.futures:
+                future.cancel()
+            raise
+        except Exception as e:
+            print(f"Ошибка пересылки {len(batch.ids)} сообщений: {e!r}")
+            self._failed += len(batch.ids)
+        finally:
+            self._flushing.discard(task)
+            # Ни один вызывающий не остается без ответа: непересланные получают None
+            for future in batch.futures:
+                if not future.done():
+                    future.set_result(None)
+
+
+__all__ = ['ForwardBatcher']
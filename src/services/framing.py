@@ -0,0 +1,221 @@
+import struct
+from typing import BinaryIO, Iterator, NamedTuple
+
+from cryptography.fernet import Fernet
+
+
+# Заголовок блока: magic, версия, флаги, кодек записей, число записей, длина полезной нагрузки
+BLOCK_MAGIC = b"TGJB"
+BLOCK_VERSION = 1
+BLOCK_HEADER = struct.Struct(">4sBBBII")
+
+FLAG_ENCRYPTED = 0x01
+# Не записывается в файл: так помечаются строки старого формата (один токен Fernet или JSON на строку)
+FLAG_LINE = 0x80
+
+CODEC_JSON = 0
+
+
+class RawBlock(NamedTuple):
+    offset: int
+    flags: int
+    codec: int
+    count: int
+    payload: bytes
+
+
+def encode_block(records: list[bytes], cipher: Fernet | None = None, codec: int = CODEC_JSON) -> bytes:
+    """
+    Упаковка пачки записей в один блок.
+
+    Полезная нагрузка блока состоит из индекса (длины записей) и самих записей;
+    при наличии шифра она целиком шифруется одним токеном Fernet.
+
+    :param records: Записи журнала.
+    :param cipher: Шифр Fernet или None для блока без шифрования.
+    :param codec: Идентификатор формата записей внутри блока.
+    :return: Байты блока вместе с заголовком.
+    """
+    index = struct.pack(f">{len(records)}I", *(len(record) for record in records))
+    payload = index + b"".join(records)
+
+    flags = 0
+    if cipher is not None:
+        payload = cipher.encrypt(payload)
+        flags |= FLAG_ENCRYPTED
+
+    header = BLOCK_HEADER.pack(BLOCK_MAGIC, BLOCK_VERSION, flags, codec, len(records), len(payload))
+    return header + payload
+
+
+def decode_block(block: RawBlock, cipher: Fernet | None = None) -> list[bytes]:
+    """
+    Распаковка блока (или строки старого формата) в список записей.
+
+    :param block: Блок, прочитанный через iter_blocks.
+    :param cipher: Шифр Fernet, если журнал зашифрован.
+    :return: Записи блока.
+    """
+    if block.flags & FLAG_LINE:
+        return [cipher.decrypt(block.payload) if cipher is not None else block.payload]
+
+    payload = block.payload
+    if block.flags & FLAG_ENCRYPTED:
+        if cipher is None:
+            raise ValueError(f"Блок по смещению {block.offset} зашифрован, а ключ не задан.")
+        payload = cipher.decrypt(payload)
+
+    lengths = struct.unpack_from(f">{block.count}I", payload)
+    records = []
+    position = 4 * block.count
+    for length in lengths:
+        records.append(payload[position:position + length])
+        position += length
+    return records
+
+
+class _PushbackReader:
+    def __init__(self, f: BinaryIO, offset: int = 0):
+        self._f = f
+        self._pending = b""
+        self.offset = offset
+
+    def read(self, size: int) -> bytes:
+        data = self._pending[:size]
+        self._pending = self._pending[size:]
+        if len(data) < size:
+            data += self._f.read(size - len(data))
+        self.offset += len(data)
+        return data
+
+    def readline(self) -> bytes:
+        index = self._pending.find(b"\n")
+        if index >= 0:
+            line, self._pending = self._pending[:index + 1], self._pending[index + 1:]
+        else:
+            line, self._pending = self._pending + self._f.readline(), b""
+        self.offset += len(line)
+        return line
+
+    def unread(self, data: bytes):
+        self._pending = data + self._pending
+        self.offset -= len(data)
+
+
+def iter_blocks(f: BinaryIO, offset: int = 0) -> Iterator[RawBlock]:
+    """
+    Потоковое чтение блоков журнала без загрузки файла целиком.
+
+    Строки старого формата (по одной записи на строку) возвращаются как блоки
+    с флагом FLAG_LINE, поэтому файлы со смешанным содержимым тоже читаются.
+    Перемотка не нужна, поэтому подходят и потоки распаковки.
+
+    :param f: Файл, открытый в двоичном режиме.
+    :param offset: Текущая позиция в файле (для смещений в RawBlock).
+    """
+    reader = _PushbackReader(f, offset)
+    while True:
+        offset = reader.offset
+        head = reader.read(BLOCK_HEADER.size)
+        if not head:
+            return
+
+        if head.startswith(BLOCK_MAGIC):
+            if len(head) < BLOCK_HEADER.size:
+                raise ValueError(f"Обрезанный заголовок блока по смещению {offset}.")
+            _, version, flags, codec, count, length = BLOCK_HEADER.unpack(head)
+            if version != BLOCK_VERSION:
+                raise ValueError(f"Неизвестная версия блока {version} по смещению {offset}.")
+            payload = reader.read(length)
+            if len(payload) < length:
+                raise ValueError(f"Обрезанный блок по смещению {offset}.")
+            yield RawBlock(offset, flags, codec, count, payload)
+        else:
+            reader.unread(head)
+            line = reader.readline().rstrip(b"\r\n")
+            if line:
+                yield RawBlock(offset, FLAG_LINE, CODEC_JSON, 1, line)
+
+
+def complete_blocks(data: bytes, offset: int = 0) -> tuple[list[RawBlock], int]:
+    """
+    Целые блоки и строки из начала data за один проход, без копирования в поток.
+
+    Нужна при чтении файла, в который еще идет запись: оборванный хвост
+    остается на следующее чтение.
+
+    :param data: Прочитанные байты (bytes или bytearray).
+    :param offset: Позиция начала data в файле (для смещений в RawBlock).
+    :return: Блоки и длина разобранной части data.
+    """
+    blocks = []
+    view = memoryview(data)
+    position = 0
+    while position < len(data):
+        if data.startswith(BLOCK_MAGIC, position) or BLOCK_MAGIC.startswith(data[position:position + len(BLOCK_MAGIC)]):
+            if len(data) - position < BLOCK_HEADER.size:
+                break
+            _, version, flags, codec, count, length = BLOCK_HEADER.unpack_from(data, position)
+            if version != BLOCK_VERSION:
+                raise ValueError(f"Неизвестная версия блока {version} по смещению {offset + position}.")
+            end = position + BLOCK_HEADER.size + length
+            if len(data) < end:
+                break
+            blocks.append(RawBlock(offset + position, flags, codec, count, bytes(view[position + BLOCK_HEADER.size:end])))
+            position = end
+        else:
+            end = data.find(b"\n", position)
+            if end < 0:
+                break
+            line = bytes(view[position:end]).rstrip(b"\r")
+            if line:
+                blocks.append(RawBlock(offset + position, FLAG_LINE, CODEC_JSON, 1, line))
+            position = end + 1
+    return blocks, position
+
+
+def iter_records(f: BinaryIO, cipher: Fernet | None = None) -> Iterator[bytes]:
+    """
+    Потоковое чтение всех записей журнала по порядку.
+
+    :param f: Файл журнала, открытый в двоичном режиме.
+    :param cipher: Шифр Fernet, если журнал зашифрован.
+    """
+    for block in iter_blocks(f):
+        yield from decode_block(block, cipher)
+
+
+def iter_codec_records(f: BinaryIO, cipher: Fernet | None = None) -> Iterator[tuple[int, bytes]]:
+    """
+    То же, что iter_records, но вместе с кодеком каждой записи.
+    """
+    for block in iter_blocks(f):
+        for record in decode_block(block, cipher):
+            yield block.codec, record
+
+
+class BlockEncoder:
+    def __init__(self, cipher: Fernet | None = None, codec: int = CODEC_JSON):
+        """
+        Кодирование пачки записей журнала в один (зашифрованный) блок.
+
+        :param cipher: Шифр Fernet или None.
+        :param codec: Идентификатор формата записей внутри блока.
+        """
+        self.cipher = cipher
+        self.codec = codec
+
+    def __call__(self, records: list[bytes]) -> bytes:
+        return encode_block(records, self.cipher, self.codec)
+
+
+__all__ = [
+    'BlockEncoder',
+    'RawBlock',
+    'complete_blocks',
+    'decode_block',
+    'encode_block',
+    'iter_blocks',
+    'iter_codec_records',
+    'iter_records',
+]
@@ -0,0 +1,378 @@
+import asyncio
+import datetime
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from cryptography.fernet import Fernet
+
+from src.services.journal_index import encode_entry, index_path
+from src.services.metrics import Histogram
+from src.services.options import JOURNAL_FSYNC_POLICIES, JOURNAL_OVERFLOW_POLICIES
+from src.services.segments import COMPRESSION_SUFFIXES, SegmentManifest, compress_file, segments_dir
+
+
+_STOP = object()
+
+
+class LineEncoder:
+    def __init__(self, cipher: Fernet | None = None):
+        """
+        Кодирование пачки записей журнала в строки (по одной записи на строку).
+
+        :param cipher: Шифр Fernet. Если задан, каждая строка шифруется отдельным токеном.
+        """
+        self.cipher = cipher
+
+    def __call__(self, records: list[bytes]) -> bytes:
+        if self.cipher is None:
+            return b"".join(record + b"\n" for record in records)
+        return b"".join(self.cipher.encrypt(record) + b"\n" for record in records)
+
+
+class JournalWriter:
+    FSYNC_POLICIES = JOURNAL_FSYNC_POLICIES
+    OVERFLOW_POLICIES = JOURNAL_OVERFLOW_POLICIES
+
+    def __init__(
+        self,
+        path: str,
+        encoder: Callable[[list[bytes]], bytes] | None = None,
+        queue_size: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 1.0,
+        fsync: str = "batch",
+        fsync_interval: float = 5.0,
+        overflow: str = "drop",
+        rotate_bytes: int = 0,
+        rotate_seconds: float = 0.0,
+        compress: str | None = None,
+        index: bool = False,
+    ):
+        """
+        Фоновая запись журнала событий пачками через ограниченную очередь.
+
+        Обработчики только кладут записи в очередь, а фоновая задача собирает их
+        в пачки и пишет в один постоянно открытый файл в отдельном потоке.
+
+        При включенной ротации журнал пишется сегментами в каталог path.segments
+        (см. SegmentManifest), закрытые сегменты сжимаются в фоне.
+
+        :param path: Путь к файлу журнала.
+        :param encoder: Функция, превращающая пачку записей в байты для записи в файл.
+        :param queue_size: Максимальное число записей, ожидающих записи.
+        :param batch_size: Число записей, при котором пачка пишется сразу.
+        :param flush_interval: Максимальное время (сек.) ожидания записи в очереди.
+        :param fsync: Политика fsync: "none", "batch" (после каждой пачки) или "periodic".
+        :param fsync_interval: Интервал (сек.) между fsync для политики "periodic".
+        :param overflow: Поведение при переполнении очереди: "drop" (отбросить запись) или "block" (ждать места).
+        :param rotate_bytes: Размер сегмента, после которого начинается новый (0 - без ограничения).
+        :param rotate_seconds: Время жизни сегмента в секундах (0 - без ограничения).
+        :param compress: Сжатие закрытых сегментов: "gzip", "zstd" или None.
+        :param index: Вести рядом с каждым файлом журнала индекс (file.idx) со смещениями пачек,
+            временем и чатами записей (см. journal_index).
+        """
+        if fsync not in self.FSYNC_POLICIES:
+            raise ValueError(f"Неизвестная политика fsync: '{fsync}'")
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise ValueError(f"Неизвестная политика переполнения: '{overflow}'")
+        if compress is not None and compress not in COMPRESSION_SUFFIXES:
+            raise ValueError(f"Неизвестный метод сжатия: '{compress}'")
+
+        self.path = path
+        self.encoder = encoder or LineEncoder()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.overflow = overflow
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+        self.compress = compress
+        self.index = index
+
+        self._manifest: SegmentManifest | None = None
+        self._segment: dict | None = None
+        self._compressor: ThreadPoolExecutor | None = None
+        self._compressed = 0
+
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="journal")
+        self._file = None
+        self._index_file = None
+        self._offset = 0
+        self._task: asyncio.Task | None = None
+        self._closing = False
+        self._last_fsync = 0.0
+
+        self._max_depth = 0
+        self._written = 0
+        self._dropped = 0
+        self._blocked = 0
+        self._batches = 0
+        self._bytes = 0
+        self._last_batch_seconds = 0.0
+        # Время записи пачки (сериализация в потоке, запись и fsync)
+        self.batch_seconds = Histogram()
+
+    async def start(self):
+        """
+        Открытие файла журнала и запуск фоновой задачи записи.
+        """
+        loop = asyncio.get_running_loop()
+        if self.rotating:
+            await loop.run_in_executor(self._executor, self._open_segments)
+        else:
+            await loop.run_in_executor(self._executor, self._open, self.path)
+        self._task = asyncio.create_task(self._run())
+
+    @property
+    def rotating(self) -> bool:
+        return bool(self.rotate_bytes or self.rotate_seconds)
+
+    @property
+    def current_path(self) -> str:
+        """
+        Файл, в который сейчас пишется журнал.
+        """
+        if self._segment is None:
+            return self.path
+        return os.path.join(self._manifest.directory, self._segment["name"])
+
+    async def put(self, record: bytes, peers: list[int] = ()) -> bool:
+        """
+        Добавление записи в очередь журнала.
+
+        :param record: Запись (одно событие) в виде байтов.
+        :param peers: Помеченные id чатов и пользователей события (для индекса).
+        :return: False, если запись была отброшена из-за переполнения или остановки.
+        """
+        # После остановки или сбоя фоновой задачи очередь никто не разбирает
+        if self._closing or self._task is None or self._task.done():
+            self._dropped += 1
+            return False
+
+        item = (record, time.time(), list(peers))
+        if self._queue.full():
+            if self.overflow == "drop":
+                self._dropped += 1
+                return False
+            self._blocked += 1
+            await self._queue.put(item)
+        else:
+            self._queue.put_nowait(item)
+
+        self._max_depth = max(self._max_depth, self._queue.qsize())
+        return True
+
+    async def stop(self):
+        """
+        Запись всех оставшихся в очереди событий и закрытие файла журнала.
+        """
+        if self._task is None:
+            return
+
+        self._closing = True
+        try:
+            self._queue.put_nowait(_STOP)
+        except asyncio.QueueFull:
+            # Очередь полна: ждем места, но не дольше, чем живет фоновая задача
+            put = asyncio.create_task(self._queue.put(_STOP))
+            await asyncio.wait({put, self._task}, return_when=asyncio.FIRST_COMPLETED)
+            put.cancel()
+
+        try:
+            await self._task
+        except Exception as e:
+            lost = 0
+            while not self._queue.empty():
+                lost += self._queue.get_nowait() is not _STOP
+            self._dropped += lost
+            print(f"Сбой записи журнала {self.path}, потеряно {lost} записей: {e!r}")
+        self._task = None
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._finish)
+        self._executor.shutdown(wait=True)
+        if self._compressor is not None:
+            await loop.run_in_executor(None, self._compressor.shutdown, True)
+
+    def stats(self) -> dict[str, int | float]:
+        return {
+            "queue_depth": self._queue.qsize(),
+            "queue_max_depth": self._max_depth,
+            "written": self._written,
+            "dropped": self._dropped,
+            "blocked": self._blocked,
+            "batches": self._batches,
+            "bytes": self._bytes,
+            "last_batch_seconds": self._last_batch_seconds,
+            "batch_seconds_p99": self.batch_seconds.quantile(0.99) if self.batch_seconds.count else 0.0,
+            "segments": len(self._manifest.segments) if self._manifest is not None else 0,
+            "compressed": self._compressed,
+        }
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+
+        while not stopping:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.flush_interval
+
+            while len(batch) < self.batch_size and batch[-1] is not _STOP:
+                try:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+
+                timeout = deadline - loop.time()
+                if timeout <= 0 or self._closing:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            if batch[-1] is _STOP:
+                stopping = True
+                batch.pop()
+
+            if batch:
+                try:
+                    await loop.run_in_executor(self._executor, self._write_batch, batch)
+                except Exception as e:
+                    # Пачка теряется, но журнал продолжает писаться
+                    self._dropped += len(batch)
+                    print(f"Ошибка записи журнала {self.path}: {e!r}")
+
+    def _write_batch(self, batch: list[tuple[bytes, float, list[int]]]):
+        started = time.perf_counter()
+        data = self.encoder([record for record, _, _ in batch])
+        if self._segment is not None and self._should_rotate():
+            self._rotate()
+        self._file.write(data)
+        self._file.flush()
+
+        # Индекс пишется после данных: после сбоя в нем может не хватать последней пачки, но не наоборот
+        if self._index_file is not None:
+            times = [ts for _, ts, _ in batch]
+            peers = [peers for _, _, peers in batch]
+            self._index_file.write(encode_entry(self._offset, len(data), times, peers))
+            self._index_file.flush()
+        self._offset += len(data)
+
+        if self.fsync == "batch":
+            self._fsync()
+        elif self.fsync == "periodic" and time.monotonic() - self._last_fsync >= self.fsync_interval:
+            self._fsync()
+            self._last_fsync = time.monotonic()
+
+        self._written += len(batch)
+        self._batches += 1
+        self._bytes += len(data)
+        self._last_batch_seconds = time.perf_counter() - started
+        self.batch_seconds.observe(self._last_batch_seconds)
+
+        if self._segment is not None:
+            self._segment["records"] += len(batch)
+            self._segment["bytes"] += len(data)
+            self._segment["end"] = time.time()
+
+    def _should_rotate(self) -> bool:
+        if self.rotate_bytes and self._segment["bytes"] >= self.rotate_bytes:
+            return True
+        return bool(self.rotate_seconds) and time.time() - self._segment["start"] >= self.rotate_seconds
+
+    def _open_segments(self):
+        os.makedirs(segments_dir(self.path), exist_ok=True)
+        self._manifest = SegmentManifest(segments_dir(self.path))
+        if self.compress is not None:
+            self._compressor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="journal-compress")
+
+        # Сегменты, оставшиеся после прошлого запуска, закрываются и сжимаются
+        for segment in list(self._manifest.segments):
+            if segment["end"] is None:
+                segment_path = os.path.join(self._manifest.directory, segment["name"])
+                end = os.path.getmtime(segment_path) if os.path.exists(segment_path) else segment["start"]
+                self._manifest.update(segment["name"], end=end)
+            self._schedule_compression(segment["name"])
+
+        self._open_segment()
+
+    def _open_segment(self):
+        now = datetime.datetime.now()
+        base = os.path.basename(self.path)
+        stem, dot, suffix = base.partition(".")
+        name = f"{stem}-{now.strftime('%Y%m%dT%H%M%S%f')}{dot}{suffix}"
+
+        self._segment = self._manifest.add(name, now.timestamp())
+        self._open(os.path.join(self._manifest.directory, name))
+
+    def _rotate(self):
+        self._close()
+        self._finish_segment()
+        self._schedule_compression(self._segment["name"])
+        self._open_segment()
+
+    def _schedule_compression(self, name: str):
+        if self._compressor is None or name.endswith(tuple(COMPRESSION_SUFFIXES.values())):
+            return
+        self._compressor.submit(self._compress_segment, name)
+
+    def _compress_segment(self, name: str):
+        path = os.path.join(self._manifest.directory, name)
+        if not os.path.exists(path):
+            return
+        try:
+            target = compress_file(path, self.compress)
+        except (OSError, RuntimeError) as e:
+            print(f"Ошибка сжатия сегмента {path}: {e}")
+            return
+        self._manifest.update(name, name=os.path.basename(target))
+        self._compressed += 1
+
+    def _open(self, path: str):
+        self._file = open(path, "ab")
+        self._offset = self._file.tell()
+        if self.index:
+            self._index_file = open(index_path(path), "ab")
+
+    def _fsync(self):
+        os.fsync(self._file.fileno())
+        if self._index_file is not None:
+            os.fsync(self._index_file.fileno())
+
+    def _close(self):
+        if self._file is None:
+            return
+        self._file.flush()
+        if self._index_file is not None:
+            self._index_file.flush()
+        if self.fsync != "none":
+            self._fsync()
+        self._file.close()
+        self._file = None
+        if self._index_file is not None:
+            self._index_file.close()
+            self._index_file = None
+
+    def _finish(self):
+        self._close()
+        if self._segment is not None:
+            self._finish_segment()
+            self._segment = None
+
+    def _finish_segment(self):
+        segment = self._segment
+        self._manifest.update(
+            segment["name"],
+            end=segment["end"] or time.time(),
+            records=segment["records"],
+            bytes=segment["bytes"],
+        )
+
+
+__all__ = ['JournalWriter', 'LineEncoder']
@@ -0,0 +1,77 @@
+import json
+import os
+from typing import Iterator, NamedTuple
+
+from src.services.segments import COMPRESSION_SUFFIXES
+
+
+INDEX_SUFFIX = ".idx"
+
+
+class IndexEntry(NamedTuple):
+    """
+    Одна пачка журнала: байтовый диапазон в файле и время/чаты каждой записи пачки.
+    """
+    offset: int
+    length: int
+    times: list[float]
+    peers: list[list[int]]
+
+    def select(self, start: float | None = None, end: float | None = None, peer: int | None = None) -> list[int]:
+        """
+        Номера записей пачки, подходящих под интервал и чат.
+        """
+        if start is not None and self.times[-1] < start:
+            return []
+        if end is not None and self.times[0] > end:
+            return []
+
+        selected = []
+        for i, (ts, peers) in enumerate(zip(self.times, self.peers)):
+            if start is not None and ts < start:
+                continue
+            if end is not None and ts > end:
+                continue
+            if peer is not None and peer not in peers:
+                continue
+            selected.append(i)
+        return selected
+
+
+def index_path(path: str) -> str:
+    """
+    Путь к индексу файла журнала. Для сжатого сегмента индекс общий с несжатым,
+    смещения в нем указаны в распакованных данных.
+    """
+    for suffix in COMPRESSION_SUFFIXES.values():
+        if path.endswith(suffix):
+            path = path[:-len(suffix)]
+            break
+    return path + INDEX_SUFFIX
+
+
+def encode_entry(offset: int, length: int, times: list[float], peers: list[list[int]]) -> bytes:
+    entry = {"o": offset, "n": length, "t": [round(ts, 3) for ts in times], "p": peers}
+    return json.dumps(entry, separators=(",", ":")).encode() + b"\n"
+
+
+def read_index(path: str) -> Iterator[IndexEntry]:
+    """
+    Чтение индекса файла журнала. Оборванная последняя строка (после сбоя) пропускается.
+
+    :param path: Путь к файлу журнала (не к индексу).
+    """
+    with open(index_path(path), "rb") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            yield IndexEntry(entry["o"], entry["n"], entry["t"], entry["p"])
+
+
+def has_index(path: str) -> bool:
+    return os.path.exists(index_path(path))
+
+
+__all__ = ['INDEX_SUFFIX', 'IndexEntry', 'encode_entry', 'has_index', 'index_path', 'read_index']
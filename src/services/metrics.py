@@ -0,0 +1,261 @@
+import asyncio
+import collections
+import functools
+import json
+import logging
+import re
+import time
+from typing import Awaitable, Callable
+
+from telethon import errors, utils
+
+
+# Границы корзин гистограмм задержек (сек.)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "count", "sum")
+
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        """
+        Гистограмма с фиксированными корзинами: observe - O(число корзин), без хранения значений.
+        """
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            i = len(self.buckets)
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """
+        Оценка квантиля сверху: граница корзины, в которую он попал.
+        """
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def stats(self) -> dict[str, int | float]:
+        return {
+            "count": self.count,
+            "avg": self.sum / self.count if self.count else 0.0,
+            "p50": self.quantile(0.5) if self.count else 0.0,
+            "p99": self.quantile(0.99) if self.count else 0.0,
+        }
+
+
+class _FloodLogHandler(logging.Handler):
+    """
+    FloodWait, который Telethon пережидает сам (до flood_sleep_threshold), виден только в его логе.
+    """
+
+    def __init__(self, metrics: "Metrics"):
+        super().__init__(logging.INFO)
+        self._metrics = metrics
+
+    def emit(self, record: logging.LogRecord):
+        # _fmt_flood: ('Sleeping%s for %ds (%s) on %s flood wait', early, seconds, timedelta, request)
+        if isinstance(record.msg, str) and record.msg.startswith("Sleeping") and len(record.args) == 4:
+            self._metrics.flood_wait(record.args[3], record.args[1])
+
+
+class Metrics:
+    def __init__(self):
+        """
+        Счетчики и гистограммы горячих путей: события по типам, время обработчиков,
+        вызовы API Telegram по методам и FloodWait. Остальные метрики компоненты
+        отдают через свои stats().
+        """
+        self.events: collections.Counter[str] = collections.Counter()
+        self.handlers: dict[str, Histogram] = collections.defaultdict(Histogram)
+        self.handler_errors: collections.Counter[str] = collections.Counter()
+        self.rpc: dict[str, Histogram] = collections.defaultdict(Histogram)
+        self.rpc_errors: collections.Counter[str] = collections.Counter()
+        self.flood_waits: collections.Counter[str] = collections.Counter()
+        self.flood_wait_seconds: collections.Counter[str] = collections.Counter()
+
+    def timed(self, handler: Callable[[object], Awaitable], name: str | None = None) -> Callable[[object], Awaitable]:
+        """
+        Обертка обработчика: число событий по типу и гистограмма времени обработки.
+
+        :param handler: Обработчик события.
+        :param name: Имя в метриках (по умолчанию имя обработчика).
+        """
+        name = name or handler.__name__
+        histogram = self.handlers[name]
+
+        @functools.wraps(handler)
+        async def call(event):
+            self.events[type(event).__name__] += 1
+            started = time.perf_counter()
+            try:
+                return await handler(event)
+            except Exception:
+                self.handler_errors[name] += 1
+                raise
+            finally:
+                histogram.observe(time.perf_counter() - started)
+
+        return call
+
+    def instrument_client(self, client):
+        """
+        Учет всех запросов клиента Telethon (включая внутренние, например get_entity)
+        по типу запроса: число, время и FloodWait.
+        """
+        call = client._call
+
+        async def timed_call(sender, request, *args, **kwargs):
+            method = "+".join(type(r).__name__ for r in request) if utils.is_list_like(request) else type(request).__name__
+            started = time.perf_counter()
+            try:
+                return await call(sender, request, *args, **kwargs)
+            except errors.FloodWaitError as e:
+                self.flood_wait(method, e.seconds)
+                raise
+            except errors.RPCError:
+                self.rpc_errors[method] += 1
+                raise
+            finally:
+                self.rpc[method].observe(time.perf_counter() - started)
+
+        client._call = timed_call
+
+        logger = logging.getLogger("telethon.client.users")
+        if logger.getEffectiveLevel() > logging.INFO:
+            logger.setLevel(logging.INFO)
+        logger.addHandler(_FloodLogHandler(self))
+
+    def flood_wait(self, method: str, seconds: int):
+        self.flood_waits[method] += 1
+        self.flood_wait_seconds[method] += seconds
+
+    def stats(self) -> dict[str, dict]:
+        return {
+            "events": dict(self.events),
+            "handlers": {
+                name: {**histogram.stats(), "errors": self.handler_errors[name]}
+                for name, histogram in self.handlers.items()
+            },
+            "rpc": {
+                method: {
+                    **histogram.stats(),
+                    "errors": self.rpc_errors[method],
+                    "flood_waits": self.flood_waits[method],
+                    "flood_wait_seconds": self.flood_wait_seconds[method],
+                }
+                for method, histogram in self.rpc.items()
+            },
+            "flood_wait_seconds": sum(self.flood_wait_seconds.values()),
+        }
+
+    def render(self, stats: dict[str, dict], prefix: str = "tg_listener") -> str:
+        """
+        Текстовый формат Prometheus: гистограммы со всеми корзинами, остальные
+        числовые значения stats() - как gauge с метками по вложенным ключам.
+        """
+        lines = []
+        for family, label, histograms in (("handler_seconds", "handler", self.handlers), ("rpc_seconds", "method", self.rpc)):
+            name = f"{prefix}_{family}"
+            lines.append(f"# TYPE {name} histogram")
+            for key, histogram in histograms.items():
+                seen = 0
+                for bound, count in zip((*histogram.buckets, "+Inf"), histogram.counts):
+                    seen += count
+                    lines.append(f'{name}_bucket{{{label}="{key}",le="{bound}"}} {seen}')
+                lines.append(f'{name}_sum{{{label}="{key}"}} {histogram.sum}')
+                lines.append(f'{name}_count{{{label}="{key}"}} {histogram.count}')
+
+        for section, values in stats.items():
+            for path, value in _flatten(values):
+                labels = ",".join(f'{label}="{key}"' for label, key in zip(("key", "subkey"), path[:-1]))
+                name = f"{prefix}_{_metric_name(section)}_{_metric_name(path[-1])}"
+                lines.append(f"{name}{{{labels}}} {value}" if labels else f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _flatten(values, path: tuple = ()):
+    if isinstance(values, dict):
+        for key, value in values.items():
+            yield from _flatten(value, (*path, str(key)))
+    elif isinstance(values, (int, float)) and not isinstance(values, bool) and path:
+        yield path, values
+
+
+def _metric_name(name: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+
+class MetricsServer:
+    def __init__(self, render: Callable[[], str], stats: Callable[[], dict], host: str = "127.0.0.1", port: int = 9464):
+        """
+        Локальный HTTP-сервер метрик: GET /metrics - текст Prometheus, GET /stats - JSON.
+
+        :param render: Функция, возвращающая текст метрик.
+        :param stats: Функция, возвращающая метрики в виде словаря.
+        :param host: Адрес (по умолчанию только локальный).
+        :param port: Порт.
+        """
+        self._render = render
+        self._stats = stats
+        self.host = host
+        self.port = port
+        self._server: asyncio.AbstractServer | None = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        print(f"Метрики: http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = await asyncio.wait_for(reader.readline(), 5.0)
+            # Заголовки запроса не нужны, но дочитываются, чтобы клиент не получил RST
+            while (await asyncio.wait_for(reader.readline(), 5.0)).strip():
+                pass
+            parts = request.decode("latin-1").split()
+            path = parts[1].split("?", 1)[0] if len(parts) > 1 else ""
+
+            if path == "/metrics":
+                status, content_type, body = "200 OK", "text/plain; version=0.0.4", self._render()
+            elif path == "/stats":
+                status, content_type, body = "200 OK", "application/json", json.dumps(self._stats(), default=str)
+            else:
+                status, content_type, body = "404 Not Found", "text/plain", "not found\n"
+
+            data = body.encode()
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode() + data
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+__all__ = [
+    'Histogram',
+    'LATENCY_BUCKETS',
+    'Metrics',
+    'MetricsServer',
+]
@@ -0,0 +1,28 @@
+# Допустимые значения настроек. Модуль без зависимостей: его импортируют и
+# конфигурация (проверка значений при чтении), и компоненты, которые эти значения принимают.
+
+JOURNAL_FSYNC_POLICIES = ("none", "batch", "periodic")
+JOURNAL_OVERFLOW_POLICIES = ("drop", "block")
+# Имена сериализаторов (serializers.get_serializer)
+JOURNAL_FORMATS = ("json", "tl", "msgpack")
+# Методы сжатия сегментов (ключи segments.COMPRESSION_SUFFIXES)
+COMPRESSION_METHODS = ("gzip", "zstd")
+
+PIPELINE_OVERFLOW_POLICIES = ("block", "drop", "drop_oldest")
+
+STORE_EVICTION_POLICIES = ("lru", "age")
+STORE_BACKENDS = ("pickle", "sqlite")
+
+EVENT_LOOPS = ("asyncio", "uvloop")
+
+
+__all__ = [
+    'COMPRESSION_METHODS',
+    'EVENT_LOOPS',
+    'JOURNAL_FORMATS',
+    'JOURNAL_FSYNC_POLICIES',
+    'JOURNAL_OVERFLOW_POLICIES',
+    'PIPELINE_OVERFLOW_POLICIES',
+    'STORE_BACKENDS',
+    'STORE_EVICTION_POLICIES',
+]
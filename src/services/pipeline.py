@@ -0,0 +1,205 @@
+import asyncio
+import collections
+import time
+from typing import Awaitable, Callable, Hashable
+
+from src.services.options import PIPELINE_OVERFLOW_POLICIES
+
+
+class _Job:
+    __slots__ = ("handler", "event", "enqueued_at")
+
+    def __init__(self, handler, event, enqueued_at: float):
+        self.handler = handler
+        self.event = event
+        self.enqueued_at = enqueued_at
+
+
+def event_chat_key(event) -> Hashable:
+    """
+    Ключ очереди события - id чата. События без чата (например, удаление
+    в личных чатах и обычных группах) попадают в общую очередь None.
+    """
+    return getattr(event, "chat_id", None)
+
+
+class EventPipeline:
+    OVERFLOW_POLICIES = PIPELINE_OVERFLOW_POLICIES
+
+    def __init__(
+        self,
+        workers: int = 4,
+        queue_size: int = 10000,
+        overflow: str = "block",
+        latency_window: int = 1000,
+    ):
+        """
+        Очереди событий по чатам и пул асинхронных обработчиков.
+
+        Обработчик Telethon только кладет событие в очередь своего чата, а ввод-вывод
+        (пересылка, отправка, запросы сущностей) выполняют workers задач. События
+        одного чата обрабатываются строго по порядку и по одному, разные чаты - параллельно.
+
+        :param workers: Число одновременно обрабатываемых событий (и чатов).
+        :param queue_size: Максимальное число ожидающих событий во всех очередях.
+        :param overflow: Поведение при переполнении: "block" (ждать места, как раньше
+            тормозя прием обновлений), "drop" (отбросить новое событие) или
+            "drop_oldest" (отбросить самое старое событие того же чата).
+        :param latency_window: Число последних событий для расчета задержки в очереди.
+        """
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise ValueError(f"Неизвестная политика переполнения: '{overflow}'")
+
+        self.workers = workers
+        self.queue_size = queue_size
+        self.overflow = overflow
+
+        self._chats: dict[Hashable, collections.deque[_Job]] = dict()
+        # Чаты, у которых есть события и которые сейчас никто не обрабатывает
+        self._ready: asyncio.Queue = asyncio.Queue()
+        self._space = asyncio.Condition()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._tasks: list[asyncio.Task] = []
+        self._closing = False
+        self._pending = 0
+
+        self._latencies: collections.deque[float] = collections.deque(maxlen=latency_window)
+        self._max_pending = 0
+        self._submitted = 0
+        self._processed = 0
+        self._dropped = 0
+        self._blocked = 0
+        self._failed = 0
+        self._handler_seconds = 0.0
+
+    def start(self):
+        """
+        Запуск задач-обработчиков.
+        """
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def wrap(
+        self,
+        handler: Callable[[object], Awaitable],
+        key: Callable[[object], Hashable] = event_chat_key,
+    ) -> Callable[[object], Awaitable]:
+        """
+        Обертка над обработчиком для регистрации в Telethon: событие ставится в очередь.
+
+        :param handler: Обработчик события.
+        :param key: Функция, возвращающая ключ очереди (чат) события.
+        """
+        async def enqueue(event):
+            await self.submit(key(event), handler, event)
+
+        enqueue.__name__ = getattr(handler, "__name__", "enqueue")
+        return enqueue
+
+    async def submit(self, key: Hashable, handler: Callable[[object], Awaitable], event) -> bool:
+        """
+        Постановка события в очередь чата key.
+
+        :return: False, если событие отброшено.
+        """
+        if self._closing:
+            self._dropped += 1
+            return False
+
+        if self._pending >= self.queue_size:
+            if self.overflow == "drop":
+                self._dropped += 1
+                return False
+            if self.overflow == "drop_oldest" and self._chats.get(key):
+                self._chats[key].popleft()
+                self._pending -= 1
+                self._dropped += 1
+            else:
+                self._blocked += 1
+                async with self._space:
+                    await self._space.wait_for(lambda: self._pending < self.queue_size or self._closing)
+                if self._closing:
+                    self._dropped += 1
+                    return False
+
+        jobs = self._chats.get(key)
+        if jobs is None:
+            jobs = self._chats[key] = collections.deque()
+            self._ready.put_nowait(key)
+        jobs.append(_Job(handler, event, time.monotonic()))
+
+        self._pending += 1
+        self._submitted += 1
+        self._max_pending = max(self._max_pending, self._pending)
+        self._idle.clear()
+        return True
+
+    async def stop(self, timeout: float = 10.0):
+        """
+        Прекращение приема событий и обработка уже принятых с ограничением по времени.
+
+        :param timeout: Максимальное время (сек.) на обработку очередей.
+        """
+        self._closing = True
+        async with self._space:
+            self._space.notify_all()
+
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            print(f"Не обработано {self._pending} событий")
+
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> dict[str, int | float]:
+        latencies = sorted(self._latencies)
+        percentile = lambda p: latencies[min(len(latencies) - 1, int(p * len(latencies)))] if latencies else 0.0
+        return {
+            "pending": self._pending,
+            "max_pending": self._max_pending,
+            "chats": len(self._chats),
+            "submitted": self._submitted,
+            "processed": self._processed,
+            "dropped": self._dropped,
+            "blocked": self._blocked,
+            "failed": self._failed,
+            "queue_latency_p50": percentile(0.5),
+            "queue_latency_p99": percentile(0.99),
+            "queue_latency_max": latencies[-1] if latencies else 0.0,
+            "handler_seconds_avg": self._handler_seconds / self._processed if self._processed else 0.0,
+        }
+
+    async def _worker(self):
+        while True:
+            key = await self._ready.get()
+            jobs = self._chats[key]
+            job = jobs.popleft()
+            self._pending -= 1
+            self._latencies.append(time.monotonic() - job.enqueued_at)
+            async with self._space:
+                self._space.notify()
+
+            started = time.monotonic()
+            try:
+                await job.handler(job.event)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._failed += 1
+                print(f"Ошибка обработки {type(job.event).__name__}: {e!r}")
+            self._handler_seconds += time.monotonic() - started
+            self._processed += 1
+
+            # Чат возвращается в конец очереди готовых, чтобы один активный чат не занимал обработчик
+            if jobs:
+                self._ready.put_nowait(key)
+            else:
+                del self._chats[key]
+                if not self._chats:
+                    self._idle.set()
+
+
+__all__ = ['EventPipeline', 'event_chat_key']
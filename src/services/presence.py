@@ -0,0 +1,380 @@
+import csv
+import datetime
+import json
+import re
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator
+
+from cryptography.fernet import Fernet
+
+from src.services.framing import CODEC_JSON, RawBlock, decode_block, iter_blocks
+from src.services.segments import journal_files, open_segment
+from src.services.serializers import serializer_for_codec
+from src.services.status_export import ONLINE_EXPIRES
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+STATE_OFFLINE = 0
+STATE_ONLINE = 1
+# Recently, LastWeek, Empty и т.п. - время последнего входа скрыто
+STATE_HIDDEN = 2
+
+# Сколько байт журнала разбирается за раз (и отправляется в один процесс)
+CHUNK_SIZE = 1 << 20
+# Сколько интервалов пересечений обрабатывается за раз (ограничивает память user_overlap)
+OVERLAP_CHUNK_BINS = 4096
+
+_JSON_TYPE = re.compile(rb'\{"_": ?"(\w+)"')
+
+
+def _is_status(record: bytes) -> bool:
+    match = _JSON_TYPE.match(record)
+    return match is not None and match.group(1) == b"UpdateUserStatus"
+
+
+def _iter_chunks(paths: list[str]) -> Iterator[list[RawBlock]]:
+    chunk, size = [], 0
+    for path in paths:
+        with open_segment(path) as f:
+            for block in iter_blocks(f):
+                chunk.append(block)
+                size += len(block.payload)
+                if size >= CHUNK_SIZE:
+                    yield chunk
+                    chunk, size = [], 0
+    if chunk:
+        yield chunk
+
+
+def _status_points(blocks: list[RawBlock], cipher: Fernet | None = None):
+    """
+    Статусы из куска журнала: массив строк (id пользователя, время, состояние).
+    """
+    points = []
+    serializers = {}
+    for block in blocks:
+        records = decode_block(block, cipher)
+        if block.codec == CODEC_JSON:
+            # Нужные записи блока разбираются одним вызовом json.loads
+            records = [record for record in records if _is_status(record)]
+            events = json.loads(b"[" + b",".join(records) + b"]") if records else []
+        else:
+            serializer = serializers.get(block.codec) or serializers.setdefault(block.codec, serializer_for_codec(block.codec))
+            events = [serializer.to_dict(record) for record in records]
+        points.extend(filter(None, map(status_point, events)))
+    return np.array(points, dtype=np.float64).reshape(-1, 3)
+
+
+def _require_numpy():
+    if np is None:
+        raise RuntimeError("Для аналитики статусов установите пакет numpy")
+
+
+def _timestamp(value) -> float | None:
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value)
+    return value.timestamp()
+
+
+def status_point(event: dict) -> tuple[int, float, int] | None:
+    """
+    (id пользователя, время, состояние) для записи UpdateUserStatus.
+
+    Время - момент получения ("date" в журнале статусов). В основном журнале его нет:
+    тогда для офлайна берется was_online, для онлайна - expires минус ONLINE_EXPIRES.
+    """
+    if event.get("_") != "UpdateUserStatus":
+        return None
+
+    status = event["status"]
+    status_type = status.get("_")
+    timestamp = _timestamp(event.get("date"))
+    if status_type == "UserStatusOnline":
+        state = STATE_ONLINE
+        if timestamp is None and status.get("expires") is not None:
+            timestamp = _timestamp(status["expires"]) - ONLINE_EXPIRES
+    elif status_type == "UserStatusOffline":
+        state = STATE_OFFLINE
+        if timestamp is None:
+            timestamp = _timestamp(status.get("was_online"))
+    else:
+        state = STATE_HIDDEN
+
+    if timestamp is None:
+        return None
+    return event["user_id"], timestamp, state
+
+
+class StatusColumns:
+    __slots__ = ("user_id", "ts", "state")
+
+    def __init__(self, user_id, ts, state):
+        """
+        История статусов в виде столбцов NumPy, отсортированных по (пользователь, время).
+
+        :param user_id: Id пользователей (int64).
+        :param ts: Время, unix time (float64).
+        :param state: STATE_OFFLINE, STATE_ONLINE или STATE_HIDDEN (int8).
+        """
+        _require_numpy()
+        order = np.lexsort((ts, user_id))
+        self.user_id = np.asarray(user_id, dtype=np.int64)[order]
+        self.ts = np.asarray(ts, dtype=np.float64)[order]
+        self.state = np.asarray(state, dtype=np.int8)[order]
+
+    def __len__(self) -> int:
+        return len(self.ts)
+
+    @classmethod
+    def from_journal(
+        cls,
+        path: str,
+        cipher: Fernet | None = None,
+        start: float | None = None,
+        end: float | None = None,
+        workers: int = 1,
+    ) -> "StatusColumns":
+        """
+        Загрузка статусов из журнала (status.jsonl или основного журнала, включая сегменты).
+
+        Записи остальных типов отбрасываются по типу без разбора JSON. При workers > 1
+        куски журнала расшифровываются и разбираются в отдельных процессах.
+
+        :param path: Журнал или каталог его сегментов.
+        :param cipher: Шифр Fernet, если журнал зашифрован.
+        :param start: Начало интервала (unix time).
+        :param end: Конец интервала (unix time).
+        :param workers: Число процессов.
+        """
+        _require_numpy()
+        chunks = _iter_chunks(journal_files(path, start, end))
+        parts = []
+        if workers <= 1:
+            parts = [_status_points(blocks, cipher) for blocks in chunks]
+        else:
+            with ProcessPoolExecutor(workers) as pool:
+                # Держим в работе ограниченное число кусков, чтобы не читать весь журнал в память
+                pending = []
+                for blocks in chunks:
+                    pending.append(pool.submit(_status_points, blocks, cipher))
+                    if len(pending) >= 2 * workers:
+                        parts.append(pending.pop(0).result())
+                parts.extend(future.result() for future in pending)
+
+        points = np.concatenate(parts) if parts else np.empty((0, 3))
+        columns = cls(points[:, 0].astype(np.int64), points[:, 1], points[:, 2].astype(np.int8))
+        return columns.select(start, end)
+
+    @classmethod
+    def load(cls, path: str) -> "StatusColumns":
+        """
+        Загрузка из файла .npz, сохраненного save.
+        """
+        _require_numpy()
+        with np.load(path) as data:
+            return cls(data["user_id"], data["ts"], data["state"])
+
+    def save(self, path: str):
+        """
+        Сохранение столбцов в .npz, чтобы повторный анализ не разбирал журнал.
+        """
+        np.savez(path, user_id=self.user_id, ts=self.ts, state=self.state)
+
+    def select(self, start: float | None = None, end: float | None = None, users=None) -> "StatusColumns":
+        """
+        Подмножество по интервалу времени и списку пользователей.
+        """
+        mask = np.ones(len(self), dtype=bool)
+        if start is not None:
+            mask &= self.ts >= start
+        if end is not None:
+            mask &= self.ts < end
+        if users is not None:
+            mask &= np.isin(self.user_id, np.asarray(list(users), dtype=np.int64))
+        if mask.all():
+            return self
+        return StatusColumns(self.user_id[mask], self.ts[mask], self.state[mask])
+
+    def sessions(self, expires: float = ONLINE_EXPIRES) -> dict[str, "np.ndarray"]:
+        """
+        Сессии онлайн: подряд идущие статусы онлайн одного пользователя с промежутками
+        не больше expires. Сессия заканчивается следующим статусом пользователя, но не
+        позже чем через expires после последнего онлайн (пропущенный офлайн).
+
+        :return: Столбцы user_id, start, end, duration.
+        """
+        user, ts, online = self.user_id, self.ts, self.state == STATE_ONLINE
+        count = len(ts)
+        if not count:
+            empty = np.empty(0)
+            return {"user_id": empty.astype(np.int64), "start": empty, "end": empty, "duration": empty}
+
+        same_user = user[1:] == user[:-1]
+        # Онлайн, продолжающий сессию: предыдущий статус того же пользователя - онлайн и недавно
+        continues = np.zeros(count, dtype=bool)
+        continues[1:] = online[1:] & online[:-1] & same_user & (ts[1:] - ts[:-1] <= expires)
+        starts = np.flatnonzero(online & ~continues)
+        ends_run = np.ones(count, dtype=bool)
+        ends_run[:-1] = ~continues[1:]
+        lasts = np.flatnonzero(online & ends_run)
+
+        following = np.minimum(lasts + 1, count - 1)
+        has_following = (lasts + 1 < count) & (user[following] == user[lasts])
+        end = np.where(has_following, np.minimum(ts[following], ts[lasts] + expires), ts[lasts] + expires)
+        start = ts[starts]
+        return {"user_id": user[starts], "start": start, "end": end, "duration": end - start}
+
+
+def daily_heatmap(sessions: dict[str, "np.ndarray"], utc_offset: float = 0.0, per_user: bool = False):
+    """
+    Секунды онлайн по дням недели (0 - понедельник) и часам суток.
+
+    Каждая сессия делится на куски по границам часов, куски суммируются в ячейки через bincount.
+
+    :param sessions: Результат StatusColumns.sessions.
+    :param utc_offset: Смещение часового пояса (часы).
+    :param per_user: Вернуть (id пользователей, массив пользователи x 7 x 24) вместо общего 7 x 24.
+    """
+    _require_numpy()
+    offset = utc_offset * 3600
+    start = sessions["start"] + offset
+    end = sessions["end"] + offset
+
+    first_hour = np.floor(start / 3600).astype(np.int64)
+    last_hour = np.ceil(end / 3600).astype(np.int64) - 1
+    pieces = np.maximum(last_hour - first_hour + 1, 1)
+
+    # Кусок сессии на каждый затронутый час
+    owner = np.repeat(np.arange(len(start)), pieces)
+    hour = np.repeat(first_hour, pieces) + (np.arange(pieces.sum()) - np.repeat(np.cumsum(pieces) - pieces, pieces))
+    seconds = np.minimum(end[owner], (hour + 1) * 3600.0) - np.maximum(start[owner], hour * 3600.0)
+
+    # 1970-01-01 - четверг (3)
+    cell = ((hour // 24 + 3) % 7) * 24 + hour % 24
+    if not per_user:
+        return np.bincount(cell, weights=seconds, minlength=7 * 24).reshape(7, 24)
+
+    users, index = np.unique(sessions["user_id"], return_inverse=True)
+    grid = np.bincount(index[owner] * 7 * 24 + cell, weights=seconds, minlength=len(users) * 7 * 24)
+    return users, grid.reshape(len(users), 7, 24)
+
+
+def user_overlap(
+    sessions: dict[str, "np.ndarray"],
+    bin_seconds: float = 300.0,
+    top: int = 500,
+    chunk_bins: int = OVERLAP_CHUNK_BINS,
+):
+    """
+    Совместное время онлайн для top самых активных пользователей.
+
+    Время делится на интервалы bin_seconds. Интервалы обрабатываются окнами по chunk_bins:
+    в каждом окне матрица присутствия (пользователи x интервалы) строится разностным массивом,
+    а попарное пересечение - одним матричным умножением. Память - около top x chunk_bins x 16 байт
+    независимо от длины журнала.
+
+    :return: (id пользователей, матрица секунд совместного онлайн; на диагонали - время онлайн пользователя).
+    """
+    _require_numpy()
+    users, index = np.unique(sessions["user_id"], return_inverse=True)
+    if not len(users):
+        return users, np.zeros((0, 0))
+
+    total = np.bincount(index, weights=sessions["duration"])
+    chosen = np.argsort(total)[::-1][:top]
+    position = np.full(len(users), -1)
+    position[chosen] = np.arange(len(chosen))
+    rows = position[index]
+    keep = rows >= 0
+    rows = rows[keep]
+
+    origin = sessions["start"].min()
+    first = ((sessions["start"][keep] - origin) // bin_seconds).astype(np.int64)
+    last = np.maximum(np.ceil((sessions["end"][keep] - origin) / bin_seconds).astype(np.int64), first + 1)
+
+    overlap = np.zeros((len(chosen), len(chosen)))
+    span = int(last.max())
+    for window_start in range(0, span, chunk_bins):
+        window_end = min(window_start + chunk_bins, span)
+        hit = (first < window_end) & (last > window_start)
+        delta = np.zeros((len(chosen), window_end - window_start + 1), dtype=np.int32)
+        np.add.at(delta, (rows[hit], np.maximum(first[hit], window_start) - window_start), 1)
+        np.add.at(delta, (rows[hit], np.minimum(last[hit], window_end) - window_start), -1)
+        presence = (np.cumsum(delta[:, :-1], axis=1) > 0).astype(np.float32)
+        overlap += presence @ presence.T
+
+    return users[chosen], overlap * bin_seconds
+
+
+def overlap_pairs(users, overlap) -> dict[str, "np.ndarray"]:
+    """
+    Пары пользователей с ненулевым совместным онлайн: user_a, user_b, seconds, jaccard.
+    """
+    _require_numpy()
+    a, b = np.triu_indices(len(users), k=1)
+    seconds = overlap[a, b]
+    nonzero = seconds > 0
+    a, b, seconds = a[nonzero], b[nonzero], seconds[nonzero]
+    union = overlap[a, a] + overlap[b, b] - seconds
+    order = np.argsort(seconds)[::-1]
+    return {
+        "user_a": users[a][order],
+        "user_b": users[b][order],
+        "seconds": seconds[order],
+        "jaccard": (seconds / union)[order],
+    }
+
+
+def heatmap_table(heatmap) -> dict[str, "np.ndarray"]:
+    """
+    Тепловая карта 7 x 24 в виде столбцов weekday, hour, seconds.
+    """
+    _require_numpy()
+    weekday, hour = np.divmod(np.arange(7 * 24), 24)
+    return {"weekday": weekday, "hour": hour, "seconds": np.asarray(heatmap).reshape(-1)}
+
+
+def export_table(table: dict[str, "np.ndarray"], path: str):
+    """
+    Запись столбцов в CSV или, для путей *.parquet, в Parquet (нужен pyarrow).
+    """
+    if path.endswith(".parquet"):
+        if pyarrow is None:
+            raise RuntimeError("Для формата Parquet установите пакет pyarrow")
+        pyarrow.parquet.write_table(pyarrow.table(table), path)
+        return
+
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(table.keys())
+        writer.writerows(zip(*(column.tolist() for column in table.values())))
+
+
+__all__ = [
+    'ONLINE_EXPIRES',
+    'OVERLAP_CHUNK_BINS',
+    'STATE_HIDDEN',
+    'STATE_OFFLINE',
+    'STATE_ONLINE',
+    'StatusColumns',
+    'daily_heatmap',
+    'export_table',
+    'heatmap_table',
+    'overlap_pairs',
+    'status_point',
+    'user_overlap',
+]
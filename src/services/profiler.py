@@ -0,0 +1,88 @@
+import collections
+import os
+import sys
+import threading
+import time
+
+
+class SamplingProfiler:
+    def __init__(self, interval: float = 0.005, top: int = 20):
+        """
+        Выборочный профилировщик потока цикла событий: отдельный поток с периодом
+        interval снимает стек и считает одинаковые стеки. Работает только во время
+        профилирования и не требует перезапуска.
+
+        Результат - файл в свернутом формате (стек через ";" и число выборок),
+        пригодный для flamegraph.pl и speedscope, и список самых частых функций в выводе.
+
+        :param interval: Период выборки (сек.).
+        :param top: Сколько самых частых функций печатать.
+        """
+        self.interval = interval
+        self.top = top
+        self._thread: threading.Thread | None = None
+        self._profiles = 0
+        self._samples = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds: float, path: str, thread_id: int | None = None) -> bool:
+        """
+        Запуск профилирования в фоне.
+
+        :param seconds: Длительность.
+        :param path: Файл результата.
+        :param thread_id: Поток (по умолчанию текущий).
+        :return: False, если профилирование уже идет.
+        """
+        if self.running:
+            return False
+
+        thread_id = thread_id or threading.get_ident()
+        self._thread = threading.Thread(target=self._sample, args=(thread_id, seconds, path), name="profiler", daemon=True)
+        self._thread.start()
+        print(f"Профилирование {seconds:g} сек. -> {path}")
+        return True
+
+    def stats(self) -> dict[str, int | bool]:
+        return {
+            "running": self.running,
+            "profiles": self._profiles,
+            "samples": self._samples,
+        }
+
+    def _sample(self, thread_id: int, seconds: float, path: str):
+        stacks: collections.Counter[str] = collections.Counter()
+        functions: collections.Counter[str] = collections.Counter()
+        deadline = time.monotonic() + seconds
+        samples = 0
+
+        while time.monotonic() < deadline:
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:
+                break
+
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            del frame
+            stacks[";".join(reversed(names))] += 1
+            functions[names[0]] += 1
+            samples += 1
+            time.sleep(self.interval)
+
+        with open(path, "w") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+        self._profiles += 1
+        self._samples += samples
+        lines = [f"  {count / samples:6.1%} {name}" for name, count in functions.most_common(self.top)] if samples else []
+        print("\n".join([f"Профиль сохранен в {path}: {samples} выборок, чаще всего выполняются:", *lines]))
+
+
+__all__ = ['SamplingProfiler']
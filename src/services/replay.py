@@ -0,0 +1,98 @@
+import re
+
+from cryptography.fernet import Fernet
+from telethon import types
+
+from src.services.framing import CODEC_JSON, RawBlock, decode_block
+from src.services.serializers import serializer_for_codec
+from src.stores.message_store import StoredMessage
+
+
+# Обновления, из которых восстанавливается хранилище
+MESSAGE_UPDATES = frozenset(("UpdateNewMessage", "UpdateNewChannelMessage", "UpdateEditMessage", "UpdateEditChannelMessage"))
+SHORT_UPDATES = frozenset(("UpdateShortMessage", "UpdateShortChatMessage"))
+ENTITY_UPDATES = frozenset(("UpdateUserName",))
+REPLAY_UPDATES = MESSAGE_UPDATES | SHORT_UPDATES | ENTITY_UPDATES
+
+# Тип JSON-записи без разбора всей записи (to_json пишет "_" первым ключом)
+_JSON_TYPE = re.compile(rb'\{"_": ?"(\w+)"')
+
+
+def replay_op(data: dict) -> tuple | None:
+    """
+    Действие над хранилищем для одной записи журнала (словаря обновления).
+
+    :return: ("message", StoredMessage.to_tuple()), ("user", id, имя, фамилия, username) или None.
+    """
+    name = data.get("_")
+    if name in MESSAGE_UPDATES:
+        message = data["message"]
+        # Служебные сообщения (MessageService) в хранилище не попадают, как и в обработчиках
+        if message.get("_") != "Message":
+            return None
+        return "message", StoredMessage.from_dict(message).to_tuple()
+
+    if name == "UpdateShortMessage":
+        message = {"peer_id": {"_": "PeerUser", "user_id": data["user_id"]}, **data}
+        return "message", StoredMessage.from_dict(message).to_tuple()
+
+    if name == "UpdateShortChatMessage":
+        message = {
+            **data,
+            "peer_id": {"_": "PeerChat", "chat_id": data["chat_id"]},
+            "from_id": {"_": "PeerUser", "user_id": data["from_id"]},
+        }
+        return "message", StoredMessage.from_dict(message).to_tuple()
+
+    if name == "UpdateUserName":
+        usernames = [item["username"] for item in data.get("usernames") or [] if item.get("active", True)]
+        return "user", data["user_id"], data.get("first_name"), data.get("last_name"), usernames[0] if usernames else None
+
+    return None
+
+
+def replay_blocks(blocks: list[RawBlock], cipher: Fernet | None = None) -> tuple[list[tuple], int]:
+    """
+    Расшифровка блоков и выбор действий над хранилищем (выполняется в процессах-обработчиках).
+
+    JSON-записи ненужных типов (статусы, набор текста и т.п.) отбрасываются по типу,
+    без разбора всей записи.
+
+    :return: Действия в порядке журнала и общее число записей.
+    """
+    ops = []
+    records = 0
+    serializers = {}
+    for block in blocks:
+        serializer = serializers.get(block.codec) or serializers.setdefault(block.codec, serializer_for_codec(block.codec))
+        for record in decode_block(block, cipher):
+            records += 1
+            if block.codec == CODEC_JSON:
+                match = _JSON_TYPE.match(record)
+                if match is None or match.group(1).decode() not in REPLAY_UPDATES:
+                    continue
+            op = replay_op(serializer.to_dict(record))
+            if op is not None:
+                ops.append(op)
+    return ops, records
+
+
+def apply_user_name(entities: dict[int, object], user_id: int, first_name: str | None, last_name: str | None, username: str | None):
+    """
+    Обновление имени пользователя в сущностях по ключу - помеченному id.
+    Неизвестный пользователь добавляется с одним только именем.
+    """
+    user = entities.get(user_id)
+    if not isinstance(user, types.User):
+        user = entities[user_id] = types.User(id=user_id)
+    user.first_name = first_name
+    user.last_name = last_name
+    user.username = username
+
+
+__all__ = [
+    'REPLAY_UPDATES',
+    'apply_user_name',
+    'replay_blocks',
+    'replay_op',
+]
@@ -0,0 +1,140 @@
+import json
+import random
+import time
+from typing import Callable
+
+from telethon import types, utils
+
+from src.services.journal import JournalWriter
+
+
+def serialize_json(update) -> bytes:
+    return update.to_json().encode()
+
+
+def serialize_status(update) -> bytes:
+    """
+    Компактная запись UpdateUserStatus с временем получения события.
+    Остальные обновления сериализуются как обычно.
+    """
+    if not isinstance(update, types.UpdateUserStatus):
+        return serialize_json(update)
+
+    status = update.status
+    record = {"_": type(update).__name__, "user_id": update.user_id, "status": {"_": type(status).__name__}, "date": int(time.time())}
+    if isinstance(status, types.UserStatusOnline):
+        record["status"]["expires"] = int(status.expires.timestamp())
+    elif isinstance(status, types.UserStatusOffline):
+        record["status"]["was_online"] = int(status.was_online.timestamp())
+    return json.dumps(record, separators=(",", ":")).encode()
+
+
+def update_peers(update) -> list[int]:
+    """
+    Помеченные id чатов и пользователей, к которым относится обновление.
+    """
+    peers = []
+    message = getattr(update, "message", None)
+    if message is not None and getattr(message, "peer_id", None) is not None:
+        peers.append(utils.get_peer_id(message.peer_id))
+    peer = getattr(update, "peer", None)
+    if isinstance(peer, (types.PeerUser, types.PeerChat, types.PeerChannel)):
+        peers.append(utils.get_peer_id(peer))
+    if getattr(update, "user_id", None) is not None:
+        peers.append(update.user_id)
+    if getattr(update, "chat_id", None) is not None:
+        peers.append(utils.get_peer_id(types.PeerChat(update.chat_id)))
+    if getattr(update, "channel_id", None) is not None:
+        peers.append(utils.get_peer_id(types.PeerChannel(update.channel_id)))
+    return peers
+
+
+class EventRouter:
+    def __init__(
+        self,
+        sinks: dict[str, tuple[JournalWriter, Callable[[object], bytes]]],
+        routes: dict[str, str] | None = None,
+        allow: set[str] | None = None,
+        deny: set[str] | None = None,
+        deny_peers: set[int] | None = None,
+        sample: dict[str, float] | None = None,
+        status_dedup: float = 0.0,
+        default_sink: str = "journal",
+    ):
+        """
+        Фильтрация и маршрутизация сырых обновлений до сериализации.
+
+        :param sinks: Журналы по именам: (JournalWriter, функция сериализации).
+        :param routes: Имя журнала по типу обновления (например, {"UpdateUserStatus": "status"}).
+        :param allow: Если задан, пишутся только обновления этих типов.
+        :param deny: Типы обновлений, которые не пишутся.
+        :param deny_peers: Помеченные id чатов и пользователей, обновления которых не пишутся.
+        :param sample: Доля записываемых обновлений по типу (0..1).
+        :param status_dedup: Окно (сек.), в котором повторный статус пользователя того же вида отбрасывается.
+        :param default_sink: Журнал для типов без маршрута.
+        """
+        self.sinks = sinks
+        self.routes = routes or dict()
+        self.allow = allow or set()
+        self.deny = deny or set()
+        self.deny_peers = deny_peers or set()
+        self.sample = sample or dict()
+        self.status_dedup = status_dedup
+        self.default_sink = default_sink
+
+        self._last_status: dict[int, tuple[str, float]] = dict()
+
+        self._routed: dict[str, int] = {name: 0 for name in sinks}
+        self._denied = 0
+        self._sampled = 0
+        self._deduplicated = 0
+
+    async def route(self, update) -> bool:
+        """
+        :return: True, если обновление записано в один из журналов.
+        """
+        name = type(update).__name__
+
+        if (self.allow and name not in self.allow) or name in self.deny:
+            self._denied += 1
+            return False
+
+        if self.deny_peers and not self.deny_peers.isdisjoint(update_peers(update)):
+            self._denied += 1
+            return False
+
+        rate = self.sample.get(name)
+        if rate is not None and random.random() >= rate:
+            self._sampled += 1
+            return False
+
+        if self.status_dedup and isinstance(update, types.UpdateUserStatus) and self._is_repeated_status(update):
+            self._deduplicated += 1
+            return False
+
+        sink = self.routes.get(name, self.default_sink)
+        writer, serialize = self.sinks[sink]
+        self._routed[sink] += 1
+        peers = update_peers(update) if writer.index else ()
+        return await writer.put(serialize(update), peers)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            **{f"routed_{name}": count for name, count in self._routed.items()},
+            "denied": self._denied,
+            "sampled": self._sampled,
+            "deduplicated": self._deduplicated,
+        }
+
+    def _is_repeated_status(self, update: types.UpdateUserStatus) -> bool:
+        now = time.monotonic()
+        status = type(update.status).__name__
+        last = self._last_status.get(update.user_id)
+        if last is not None and last[0] == status and now - last[1] < self.status_dedup:
+            return True
+
+        self._last_status[update.user_id] = (status, now)
+        return False
+
+
+__all__ = ['EventRouter', 'serialize_json', 'serialize_status', 'update_peers']
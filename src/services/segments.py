@@ -0,0 +1,145 @@
+import gzip
+import json
+import os
+import shutil
+import threading
+from typing import BinaryIO
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+COMPRESSION_SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+
+
+def segments_dir(path: str) -> str:
+    """
+    Каталог сегментов журнала path (например, events.jsonl.enc.segments).
+    """
+    return f"{path}.segments"
+
+
+def open_segment(path: str) -> BinaryIO:
+    """
+    Открытие сегмента (или обычного файла журнала) для чтения с распаковкой на лету.
+    """
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError("Для чтения .zst установите пакет zstandard")
+        return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+    return open(path, "rb")
+
+
+def compress_file(path: str, method: str) -> str:
+    """
+    Сжатие закрытого сегмента. Исходный файл удаляется после успешной записи.
+
+    :return: Путь к сжатому файлу.
+    """
+    target = path + COMPRESSION_SUFFIXES[method]
+    tmp_target = f"{target}.tmp"
+    with open(path, "rb") as src:
+        if method == "gzip":
+            with gzip.open(tmp_target, "wb", compresslevel=6) as dst:
+                shutil.copyfileobj(src, dst, 1 << 20)
+        else:
+            if zstandard is None:
+                raise RuntimeError("Для сжатия zstd установите пакет zstandard")
+            with open(tmp_target, "wb") as raw:
+                with zstandard.ZstdCompressor(level=9).stream_writer(raw, closefd=False) as dst:
+                    shutil.copyfileobj(src, dst, 1 << 20)
+
+    with open(tmp_target, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_target, target)
+    os.remove(path)
+    return target
+
+
+class SegmentManifest:
+    def __init__(self, directory: str):
+        """
+        Список сегментов журнала с временными диапазонами (manifest.json в каталоге сегментов).
+
+        Каждая запись: name, start, end (unix time первой и последней записи, end = None
+        для открытого сегмента), records, bytes.
+
+        :param directory: Каталог сегментов.
+        """
+        self.directory = directory
+        self.path = os.path.join(directory, "manifest.json")
+        self._lock = threading.Lock()
+        try:
+            with open(self.path) as f:
+                self.segments: list[dict] = json.load(f)["segments"]
+        except FileNotFoundError:
+            self.segments = []
+
+    def add(self, name: str, start: float) -> dict:
+        with self._lock:
+            segment = {"name": name, "start": start, "end": None, "records": 0, "bytes": 0}
+            self.segments.append(segment)
+            self._save()
+            return segment
+
+    def update(self, segment_name: str, **fields):
+        with self._lock:
+            for segment in self.segments:
+                if segment["name"] == segment_name:
+                    segment.update(fields)
+            self._save()
+
+    def select(self, start: float | None = None, end: float | None = None) -> list[str]:
+        """
+        Пути сегментов, пересекающихся с интервалом [start, end], по порядку.
+        """
+        with self._lock:
+            segments = list(self.segments)
+
+        paths = []
+        for segment in segments:
+            if start is not None and segment["end"] is not None and segment["end"] < start:
+                continue
+            if end is not None and segment["start"] > end:
+                continue
+            paths.append(os.path.join(self.directory, segment["name"]))
+        return paths
+
+    def _save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"segments": self.segments}, f, indent=1)
+        os.replace(tmp_path, self.path)
+
+
+def journal_files(path: str, start: float | None = None, end: float | None = None) -> list[str]:
+    """
+    Файлы журнала path по порядку: сегменты из манифеста, если журнал сегментирован,
+    затем сам файл path, если он есть (записи до включения ротации).
+
+    :param path: Путь к журналу (например, events.jsonl.enc) или к каталогу сегментов.
+    :param start: Начало интересующего интервала (unix time).
+    :param end: Конец интересующего интервала (unix time).
+    """
+    if os.path.isdir(path):
+        return SegmentManifest(path).select(start, end)
+
+    files = []
+    if os.path.isdir(segments_dir(path)):
+        files.extend(SegmentManifest(segments_dir(path)).select(start, end))
+    if os.path.exists(path):
+        files.insert(0, path)
+    return files
+
+
+__all__ = [
+    'SegmentManifest',
+    'compress_file',
+    'journal_files',
+    'open_segment',
+    'segments_dir',
+]
@@ -0,0 +1,117 @@
+import base64
+import datetime
+import json
+
+from telethon.extensions import BinaryReader
+
+from src.services.framing import CODEC_JSON
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+CODEC_TL = 2
+CODEC_MSGPACK = 3
+
+
+def _json_default(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    if isinstance(value, bytes):
+        return base64.b64encode(value).decode()
+    raise TypeError(f"Not JSON serializable: {type(value).__name__}")
+
+
+def _msgpack_default(value):
+    if isinstance(value, datetime.datetime):
+        return int(value.timestamp())
+    raise TypeError(f"Not msgpack serializable: {type(value).__name__}")
+
+
+class JsonSerializer:
+    name = "json"
+    codec = CODEC_JSON
+    binary = False
+
+    def dumps(self, update) -> bytes:
+        return update.to_json().encode()
+
+    def to_dict(self, record: bytes) -> dict:
+        return json.loads(record)
+
+    def from_dict(self, data: dict) -> bytes:
+        return json.dumps(data, default=_json_default).encode()
+
+
+class TLSerializer:
+    """
+    Сырые байты TL-объекта (как их передает Telegram) - самый компактный и быстрый вариант.
+    """
+    name = "tl"
+    codec = CODEC_TL
+    binary = True
+
+    def dumps(self, update) -> bytes:
+        return bytes(update)
+
+    def loads(self, record: bytes):
+        with BinaryReader(record) as reader:
+            return reader.tgread_object()
+
+    def to_dict(self, record: bytes) -> dict:
+        return self.loads(record).to_dict()
+
+    def from_dict(self, data: dict) -> bytes:
+        raise ValueError("TL-записи можно получить только из TL-записей")
+
+
+class MsgpackSerializer:
+    name = "msgpack"
+    codec = CODEC_MSGPACK
+    binary = True
+
+    def __init__(self):
+        if msgpack is None:
+            raise RuntimeError("Для формата msgpack установите пакет msgpack")
+
+    def dumps(self, update) -> bytes:
+        return self.from_dict(update.to_dict())
+
+    def to_dict(self, record: bytes) -> dict:
+        return msgpack.unpackb(record, strict_map_key=False)
+
+    def from_dict(self, data: dict) -> bytes:
+        return msgpack.packb(data, default=_msgpack_default)
+
+
+_SERIALIZERS = {
+    JsonSerializer.name: JsonSerializer,
+    TLSerializer.name: TLSerializer,
+    MsgpackSerializer.name: MsgpackSerializer,
+}
+_CODECS = {cls.codec: cls for cls in _SERIALIZERS.values()}
+
+
+def get_serializer(name: str):
+    if name not in _SERIALIZERS:
+        raise ValueError(f"Неизвестный формат журнала: '{name}'")
+    return _SERIALIZERS[name]()
+
+
+def serializer_for_codec(codec: int):
+    if codec not in _CODECS:
+        raise ValueError(f"Неизвестный кодек записей: {codec}")
+    return _CODECS[codec]()
+
+
+__all__ = [
+    'CODEC_MSGPACK',
+    'CODEC_TL',
+    'JsonSerializer',
+    'MsgpackSerializer',
+    'TLSerializer',
+    'get_serializer',
+    'serializer_for_codec',
+]
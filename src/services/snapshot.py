@@ -0,0 +1,77 @@
+import os
+import pickle
+import time
+from typing import Iterator
+
+from cryptography.fernet import Fernet
+
+from src.services.framing import BLOCK_MAGIC, RawBlock, decode_block, encode_block, iter_blocks
+
+
+CODEC_PICKLE = 1
+
+
+def write_snapshot(path: str, data: dict[str, list], cipher: Fernet | None = None, chunk_size: int = 10000):
+    """
+    Запись снимка хранилища сегментами.
+
+    Каждый сегмент - отдельный блок (см. framing) с куском одного из списков,
+    поэтому снимок можно читать и расшифровывать по частям. Файл заменяется атомарно.
+
+    :param path: Путь к файлу снимка.
+    :param data: Списки записей по видам, например {"entities": [...], "messages": [...]}.
+    :param cipher: Шифр Fernet или None.
+    :param chunk_size: Число записей в одном сегменте.
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        for kind, items in data.items():
+            for start in range(0, len(items), chunk_size):
+                record = pickle.dumps((kind, items[start:start + chunk_size]))
+                f.write(encode_block([record], cipher, CODEC_PICKLE))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def iter_raw_segments(path: str) -> Iterator[RawBlock | bytes]:
+    """
+    Потоковое чтение сегментов снимка без расшифровки.
+
+    Для снимка старого формата (один pickle или один токен Fernet) возвращает
+    содержимое файла целиком одним элементом типа bytes.
+    """
+    with open(path, "rb") as f:
+        head = f.read(len(BLOCK_MAGIC))
+        if not head:
+            # Снимок пустого хранилища
+            return
+        if head != BLOCK_MAGIC:
+            f.seek(0)
+            yield f.read()
+            return
+        f.seek(0)
+        yield from iter_blocks(f)
+
+
+def decode_segment(segment: RawBlock | bytes, cipher: Fernet | None = None) -> tuple[list[tuple[str, list]], float, float]:
+    """
+    Расшифровка и десериализация одного сегмента.
+
+    :return: Список пар (вид, записи) и время расшифровки и десериализации в секундах.
+    """
+    started = time.perf_counter()
+    if isinstance(segment, bytes):
+        raw = cipher.decrypt(segment) if cipher is not None else segment
+        decrypted = time.perf_counter()
+        data = pickle.loads(raw)
+        chunks = [("entities", data["entities"]), ("messages", data["messages"])]
+    else:
+        records = decode_block(segment, cipher)
+        decrypted = time.perf_counter()
+        chunks = [pickle.loads(record) for record in records]
+
+    return chunks, decrypted - started, time.perf_counter() - decrypted
+
+
+__all__ = ['decode_segment', 'iter_raw_segments', 'write_snapshot']
@@ -0,0 +1,315 @@
+import datetime
+import json
+import os
+import random
+import time
+from abc import ABC, abstractmethod
+from typing import Iterator
+
+from cryptography.fernet import Fernet
+
+from src.services.framing import complete_blocks, decode_block
+from src.services.segments import COMPRESSION_SUFFIXES, journal_files, open_segment
+from src.services.serializers import serializer_for_codec
+
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+READ_SIZE = 4 << 20
+
+# Telegram выставляет expires статуса онлайн примерно на 5 минут вперед
+ONLINE_EXPIRES = 300.0
+
+
+class SinkRetryableError(Exception):
+    def __init__(self, message: str, retry_after: float | None = None):
+        """
+        Временная ошибка приемника (квота, сетевой сбой): пачку нужно отправить повторно.
+
+        :param retry_after: Рекомендуемая пауза (сек.), если приемник ее сообщил.
+        """
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class StatusSink(ABC):
+    """
+    Приемник строк статусов. Реализации: GoogleSheetSink (sheet_maker.py) и MemorySink.
+    """
+
+    @abstractmethod
+    def append_rows(self, rows: list[list]):
+        """
+        Добавление строк одной пачкой. При временной ошибке - SinkRetryableError.
+        """
+
+
+class MemorySink(StatusSink):
+    def __init__(self, failures: int = 0):
+        """
+        Приемник в памяти для проверки экспорта без Google Sheets.
+
+        :param failures: Сколько первых вызовов завершатся SinkRetryableError (имитация квоты).
+        """
+        self.rows: list[list] = []
+        self.calls = 0
+        self.failures = failures
+
+    def append_rows(self, rows: list[list]):
+        self.calls += 1
+        if self.failures > 0:
+            self.failures -= 1
+            raise SinkRetryableError("Quota exceeded (fake)")
+        self.rows.extend(rows)
+
+
+def _as_datetime(value) -> datetime.datetime | None:
+    if value is None:
+        return None
+    if isinstance(value, datetime.datetime):
+        return value
+    if isinstance(value, (int, float)):
+        return datetime.datetime.fromtimestamp(value, tz=datetime.timezone.utc)
+    return datetime.datetime.fromisoformat(value)
+
+
+def status_row(event: dict) -> list | None:
+    """
+    Строка таблицы для события UpdateUserStatus (время, id пользователя, статус, детали).
+
+    Время берется из самого события: время получения ("date" в записях журнала статусов),
+    иначе was_online для UserStatusOffline и expires минус ONLINE_EXPIRES для UserStatusOnline.
+    Для прочих записей возвращается None.
+    """
+    if event.get("_") != "UpdateUserStatus":
+        return None
+
+    status = event["status"]
+    status_type = status["_"]
+    details = ""
+    if status_type == "UserStatusOnline":
+        details = f"expires: {_format_time(status.get('expires'))}"
+    elif status_type == "UserStatusOffline":
+        details = f"was_online: {_format_time(status.get('was_online'))}"
+
+    timestamp = event.get("date")
+    if timestamp is None and status_type == "UserStatusOffline":
+        timestamp = status.get("was_online")
+    elif timestamp is None and status_type == "UserStatusOnline" and status.get("expires") is not None:
+        timestamp = _as_datetime(status["expires"]) - datetime.timedelta(seconds=ONLINE_EXPIRES)
+    return [_format_time(timestamp), event["user_id"], status_type, details]
+
+
+def _format_time(value) -> str:
+    moment = _as_datetime(value)
+    if moment is None:
+        return "N/A"
+    return moment.astimezone().strftime(TIME_FORMAT)
+
+
+def _base_name(path: str) -> str:
+    name = os.path.basename(path)
+    for suffix in COMPRESSION_SUFFIXES.values():
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+
+class JournalTail:
+    def __init__(self, path: str, cipher: Fernet | None = None, checkpoint_path: str | None = None):
+        """
+        Чтение журнала с места последней остановки, в том числе пока в него идет запись.
+
+        Позиция чтения (файл и смещение) хранится в памяти, а в файл checkpoint
+        попадает только через commit, т.е. после того, как прочитанное обработано.
+
+        :param path: Журнал (или каталог его сегментов).
+        :param cipher: Шифр Fernet, если журнал зашифрован.
+        :param checkpoint_path: Файл позиции (по умолчанию path.checkpoint).
+        """
+        self.path = path
+        self.cipher = cipher
+        self.checkpoint_path = checkpoint_path or f"{path.rstrip(os.sep)}.checkpoint"
+
+        self.file: str | None = None
+        self.offset = 0
+        try:
+            with open(self.checkpoint_path) as f:
+                checkpoint = json.load(f)
+            self.file, self.offset = checkpoint["file"], checkpoint["offset"]
+        except FileNotFoundError:
+            pass
+        self._cursor = (self.file, self.offset)
+
+    def read(self) -> Iterator[tuple[str, int, list[dict]]]:
+        """
+        Новые записи журнала по блокам: (файл, смещение после блока, записи в виде словарей).
+        """
+        paths = journal_files(self.path)
+        names = [_base_name(path) for path in paths]
+
+        file, offset = self._cursor
+        position = names.index(file) if file in names else 0
+        offset = offset if file in names else 0
+
+        for i in range(position, len(paths)):
+            name = names[i]
+            for end, records in self._read_file(paths[i], offset):
+                self._cursor = (name, end)
+                yield name, end, records
+            offset = 0
+
+    def commit(self, file: str, offset: int):
+        """
+        Надежное сохранение позиции: запись во временный файл, fsync и атомарная замена.
+        """
+        self.file, self.offset = file, offset
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"file": file, "offset": offset}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def _read_file(self, path: str, offset: int) -> Iterator[tuple[int, list[dict]]]:
+        serializers = {}
+        with open_segment(path) as f:
+            f.seek(offset)
+            # В буфере только еще не разобранный хвост: прочитанные целые блоки из него удаляются
+            buffer = bytearray()
+            while chunk := f.read(READ_SIZE):
+                buffer += chunk
+                # Оборванный хвост (пачка, которая еще пишется) остается на следующее чтение
+                blocks, length = complete_blocks(buffer, offset)
+                del buffer[:length]
+                # Конец блока - начало следующего, для последнего - конец целых данных
+                ends = [block.offset for block in blocks[1:]] + [offset + length]
+                offset += length
+                for block, end in zip(blocks, ends):
+                    serializer = serializers.get(block.codec) or serializers.setdefault(block.codec, serializer_for_codec(block.codec))
+                    yield end, [serializer.to_dict(record) for record in decode_block(block, self.cipher)]
+
+
+class StatusExporter:
+    def __init__(
+        self,
+        tail: JournalTail,
+        sink: StatusSink,
+        batch_rows: int = 500,
+        batch_seconds: float = 10.0,
+        poll_interval: float = 2.0,
+        max_backoff: float = 120.0,
+    ):
+        """
+        Потоковый экспорт статусов пользователей из журнала в приемник (Google Sheets).
+
+        Строки копятся в пачку и отправляются, когда набралось batch_rows строк или
+        самой старой строке пачки больше batch_seconds. После успешной отправки
+        сохраняется позиция в журнале, поэтому после перезапуска ничего не теряется
+        (при сбое между отправкой и сохранением позиции пачка может повториться).
+
+        :param tail: Источник записей журнала.
+        :param sink: Приемник строк.
+        :param batch_rows: Максимальный размер пачки.
+        :param batch_seconds: Максимальное время ожидания строки в пачке.
+        :param poll_interval: Пауза между проверками журнала на новые записи.
+        :param max_backoff: Максимальная пауза между повторами при ошибках квоты.
+        """
+        self.tail = tail
+        self.sink = sink
+        self.batch_rows = batch_rows
+        self.batch_seconds = batch_seconds
+        self.poll_interval = poll_interval
+        self.max_backoff = max_backoff
+
+        self._rows: list[list] = []
+        self._first_row_at = 0.0
+        self._position: tuple[str, int] | None = None
+
+        self._exported = 0
+        self._batches = 0
+        self._retries = 0
+
+    def run_once(self) -> int:
+        """
+        Обработка всего, что появилось в журнале с прошлого раза.
+
+        :return: Число прочитанных блоков.
+        """
+        blocks = 0
+        for name, offset, records in self.tail.read():
+            blocks += 1
+            for record in records:
+                row = status_row(record)
+                if row is None:
+                    continue
+                if not self._rows:
+                    self._first_row_at = time.monotonic()
+                self._rows.append(row)
+            self._position = (name, offset)
+
+            if len(self._rows) >= self.batch_rows:
+                self.flush()
+
+        if self._rows and time.monotonic() - self._first_row_at >= self.batch_seconds:
+            self.flush()
+        elif not self._rows and self._position is not None:
+            # В прочитанном не было статусов - позицию можно сдвинуть без отправки
+            self.tail.commit(*self._position)
+            self._position = None
+        return blocks
+
+    def run(self):
+        """
+        Бесконечное слежение за журналом. Остановка - KeyboardInterrupt, остаток пачки отправляется.
+        """
+        try:
+            while True:
+                if not self.run_once():
+                    time.sleep(self.poll_interval)
+        except KeyboardInterrupt:
+            self.flush()
+
+    def flush(self):
+        """
+        Отправка накопленной пачки с повторами при временных ошибках и сохранение позиции.
+        """
+        if self._rows:
+            self._append_with_retry(self._rows)
+            self._exported += len(self._rows)
+            self._batches += 1
+            self._rows = []
+        if self._position is not None:
+            self.tail.commit(*self._position)
+            self._position = None
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "pending": len(self._rows),
+            "exported": self._exported,
+            "batches": self._batches,
+            "retries": self._retries,
+        }
+
+    def _append_with_retry(self, rows: list[list]):
+        delay = 1.0
+        while True:
+            try:
+                self.sink.append_rows(rows)
+                return
+            except SinkRetryableError as e:
+                self._retries += 1
+                pause = e.retry_after if e.retry_after is not None else delay * random.uniform(0.5, 1.0)
+                print(f"Приемник недоступен ({e}), повтор через {pause:.1f} сек.")
+                time.sleep(pause)
+                delay = min(delay * 2, self.max_backoff)
+
+
+__all__ = [
+    'JournalTail',
+    'ONLINE_EXPIRES',
+    'MemorySink',
+    'SinkRetryableError',
+    'StatusExporter',
+    'StatusSink',
+    'status_row',
+]
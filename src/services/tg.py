@@ -1,8 +1,15 @@
+import sys
 from abc import abstractmethod, ABC
 
 from telethon import TelegramClient, events
 
 
+class SessionNotAuthorizedError(RuntimeError):
+    """
+    Сессия не авторизована, а ввести номер телефона и код негде (нет терминала).
+    """
+
+
 class TelegramEventListener(ABC):
     def __init__(self, api_id, api_hash, session_name='event_listener'):
         """
@@ -24,13 +31,28 @@ class TelegramEventListener(ABC):
     async def all_events_handler(event):
         pass
 
+    async def on_started(self):
+        """
+        Вызывается после подключения клиента, до ожидания событий.
+        Долгие операции здесь следует запускать отдельными задачами.
+        """
+
     async def start(self):
         """
         Запуск клиента Telegram и его выполнение до отключения.
         """
         print("Запуск клиента Telegram...")
+        if not sys.stdin.isatty():
+            # Без терминала вход невозможен: input() в client.start() сразу завершится EOFError
+            await self._client.connect()
+            if not await self._client.is_user_authorized():
+                raise SessionNotAuthorizedError(
+                    "Сессия Telegram не авторизована. "
+                    "Выполните вход один раз в терминале (python -m src с теми же DATA_DIR и SESSION_NAME)"
+                )
         await self._client.start()
         await self.setup_handlers()
+        await self.on_started()
 
         print("Клиент успешно запущен. Ожидание событий...")
         await self._client.run_until_disconnected()
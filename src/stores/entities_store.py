@@ -1,41 +1,194 @@
-from telethon import TelegramClient
+import asyncio
+import time
+
+from telethon import TelegramClient, errors, utils
 from telethon.types import *
 
 
 class EntityStore:
-    def __init__(self, client: TelegramClient):
+    def __init__(self, client: TelegramClient, backend=None, negative_ttl: float = 600.0, max_age: float | None = 86400.0):
+        """
+        Кэш сущностей (пользователей, чатов, каналов) с ключом по помеченному id (utils.get_peer_id).
+
+        :param client: Клиент Telegram.
+        :param backend: Постоянное хранилище (SqliteBackend) или None.
+        :param negative_ttl: Время (сек.), в течение которого не повторяется запрос ненайденной сущности.
+        :param max_age: Возраст (сек.), после которого сущность обновляется в фоне (None - никогда).
+        """
         self._client = client
-        self._entities: dict[int, User] = dict()
-        
-    async def get(self, entity: int) -> TLObject:
-        return self._entities.get(entity) or await self._fetch(entity)
-              
-    async def get_user(self, user_id: int) -> User:
+        self._backend = backend
+        self.negative_ttl = negative_ttl
+        self.max_age = max_age
+
+        self._entities: dict[int, TLObject] = dict()
+        self._fetched: dict[int, float] = dict()
+        self._missing: dict[int, float] = dict()
+        self._inflight: dict[int, asyncio.Task] = dict()
+
+        self._hits = 0
+        self._misses = 0
+        self._negative_hits = 0
+        self._deduplicated = 0
+        self._fetches = 0
+        self._fetch_errors = 0
+
+    async def get(self, entity: int) -> TLObject | None:
+        """
+        :param entity: Помеченный id (положительный для пользователей).
+        :return: Сущность или None, если получить ее не удалось.
+        """
+        cached = self._entities.get(entity)
+        if cached is None and self._backend is not None:
+            stored = await self._backend.get_entity(entity)
+            if stored is not None:
+                # Время получения берется из базы: устаревшая на диске сущность обновится
+                cached, fetched = stored
+                self._remember(entity, cached, persist=False, fetched=fetched)
+
+        # После неудачного запроса сущность не запрашивается повторно в течение negative_ttl
+        failed = self._missing.get(entity, 0) > time.monotonic()
+
+        if cached is not None:
+            self._hits += 1
+            if self.max_age is not None and not failed and time.time() - self._fetched.get(entity, 0) > self.max_age:
+                self._refresh(entity)
+            return cached
+
+        if failed:
+            self._negative_hits += 1
+            return None
+
+        self._misses += 1
+        return await asyncio.shield(self._fetch_once(entity))
+
+    async def get_user(self, user_id: int) -> User | None:
         return await self.get(user_id)
-              
+
     async def get_peer(self, peer: PeerChat | PeerUser | PeerChannel):
-        if isinstance(peer, PeerUser):
-            return await self.get_user(peer.user_id)
-        elif isinstance(peer, PeerChat):
-            return await self.get_chat(peer)
-    
-    async def get_chat(self, chat: PeerChat) -> Chat:
-        return await self.get(chat.chat_id)
-    
-    async def _fetch(self, user_id: int) -> User:
-        user = await self._client.get_entity(user_id)
-        self._entities[user_id] = user
-        return user
-    
+        return await self.get(utils.get_peer_id(peer))
+
+    async def get_chat(self, chat: PeerChat | PeerChannel) -> Chat | Channel | None:
+        return await self.get(utils.get_peer_id(chat))
+
+    async def warm_up(
+        self,
+        dialog_limit: int | None = None,
+        participants: bool = False,
+        participants_limit: int | None = 1000,
+        concurrency: int = 4,
+    ) -> int:
+        """
+        Массовое заполнение кэша из списка диалогов и, по желанию, участников групп.
+
+        :param dialog_limit: Максимальное число диалогов (None - все).
+        :param participants: Загружать ли участников групп.
+        :param participants_limit: Максимальное число участников одной группы.
+        :param concurrency: Сколько групп загружается одновременно.
+        :return: Число полученных сущностей.
+        """
+        started = time.perf_counter()
+        count = 0
+        groups = []
+
+        # iter_dialogs сам запрашивает диалоги страницами по 100
+        async for dialog in self._client.iter_dialogs(limit=dialog_limit):
+            self._remember(utils.get_peer_id(dialog.entity), dialog.entity)
+            count += 1
+            if participants and dialog.is_group:
+                groups.append(dialog.entity)
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def load_participants(chat) -> int:
+            loaded = 0
+            async with semaphore:
+                try:
+                    async for user in self._client.iter_participants(chat, limit=participants_limit):
+                        self._remember(user.id, user)
+                        loaded += 1
+                except errors.RPCError as e:
+                    print(f"Warm-up: participants of {chat.id} not loaded: {e}")
+            return loaded
+
+        count += sum(await asyncio.gather(*(load_participants(chat) for chat in groups)))
+
+        print(f"Warm-up: {count} entities from {len(groups)} groups in {time.perf_counter() - started:.3f}s")
+        return count
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "entities": len(self._entities),
+            "negative": len(self._missing),
+            "inflight": len(self._inflight),
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": self._hits / (self._hits + self._misses) if self._hits + self._misses else 0.0,
+            "negative_hits": self._negative_hits,
+            "deduplicated": self._deduplicated,
+            "fetches": self._fetches,
+            "fetch_errors": self._fetch_errors,
+        }
+
+    def _refresh(self, key: int):
+        # Фоновое обновление: задача хранится в _inflight, ее ошибка выводится, а не теряется
+        if key in self._inflight:
+            return
+        self._fetch_once(key).add_done_callback(self._refresh_done)
+
+    @staticmethod
+    def _refresh_done(task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Entity refresh failed: {task.exception()!r}")
+
+    def _fetch_once(self, key: int) -> asyncio.Task:
+        # Одновременные запросы одной сущности ждут один и тот же вызов get_entity
+        task = self._inflight.get(key)
+        if task is not None:
+            self._deduplicated += 1
+            return task
+
+        task = self._inflight[key] = asyncio.create_task(self._fetch(key))
+        task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return task
+
+    async def _fetch(self, key: int) -> TLObject | None:
+        self._fetches += 1
+        try:
+            entity = await self._client.get_entity(utils.get_peer(key))
+        except (ValueError, errors.RPCError) as e:
+            self._fetch_errors += 1
+            self._missing[key] = time.monotonic() + self.negative_ttl
+            print(f"Entity {key} not found: {e}")
+            # При неудачном обновлении оставляем устаревшую копию
+            return self._entities.get(key)
+        except Exception:
+            # Сетевые и прочие ошибки передаются вызывающему, но повтор тоже откладывается
+            self._fetch_errors += 1
+            self._missing[key] = time.monotonic() + self.negative_ttl
+            raise
+
+        self._missing.pop(key, None)
+        self._remember(key, entity)
+        return entity
+
+    def _remember(self, key: int, entity: TLObject, persist: bool = True, fetched: float | None = None):
+        self._entities[key] = entity
+        self._fetched[key] = fetched or time.time()
+        if persist and self._backend is not None:
+            self._backend.put_entity(key, entity, self._fetched[key])
+
     def dump(self) -> list[User]:
         dump = list(self._entities.values())
         print(f"Dump {len(dump)} entities")
         return dump
-    
-    def load(self, entities: list[TLObject]) -> list[TLObject]:
+
+    def load(self, entities: list[TLObject], replace: bool = True):
         for entity in entities:
-            self._entities[entity.id] = entity
-        
+            key = utils.get_peer_id(entity)
+            if not replace and key in self._entities:
+                continue
+            self._remember(key, entity)
+
         print(f"Load {len(entities)} entities")
 
 __all__ = ['EntityStore']
@@ -1,31 +1,364 @@
-from telethon.tl.types import Message
+import datetime
+import hashlib
+import heapq
+import json
+import math
+import sys
+import time
+from collections import OrderedDict
+
+from telethon import utils
+from telethon.tl.types import (
+    Message,
+    MessageMediaDocument,
+    MessageMediaPhoto,
+    MessageMediaWebPage,
+    PeerChannel,
+    PeerChat,
+    PeerUser,
+)
+
+from src.services.options import STORE_EVICTION_POLICIES
+
+
+def content_fingerprint(msg: Message) -> int:
+    """
+    Отпечаток содержимого сообщения: текст, разметка и id фото/документа.
+
+    Реакции, предпросмотр ссылок и прочие метаданные в отпечаток не входят,
+    поэтому правка только метаданных его не меняет.
+    """
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update((msg.message or '').encode())
+    for entity in msg.entities or ():
+        digest.update(bytes(entity))
+
+    media = msg.media
+    if isinstance(media, MessageMediaPhoto) and media.photo is not None:
+        digest.update(b"photo%d" % media.photo.id)
+    elif isinstance(media, MessageMediaDocument) and media.document is not None:
+        digest.update(b"document%d" % media.document.id)
+    elif media is not None and not isinstance(media, MessageMediaWebPage):
+        digest.update(type(media).__name__.encode())
+
+    # Знаковое 64-битное число помещается в INTEGER SQLite
+    return int.from_bytes(digest.digest(), "big", signed=True)
+
+
+class StoredMessage:
+    __slots__ = ("peer_id", "id", "text", "sender_id", "date", "fwd_link", "fingerprint")
+
+    def __init__(
+        self,
+        peer_id: int,
+        id: int,
+        text: str,
+        sender_id: int | None,
+        date: int,
+        fwd_link: str | None = None,
+        fingerprint: int | None = None,
+    ):
+        """
+        Компактная запись о сообщении вместо полного объекта Telethon.
+
+        :param peer_id: Помеченный id чата (utils.get_peer_id).
+        :param id: Id сообщения в чате.
+        :param text: Текст сообщения.
+        :param sender_id: Помеченный id отправителя.
+        :param date: Время сообщения (unix timestamp).
+        :param fwd_link: Ссылка на пересланную копию.
+        :param fingerprint: Отпечаток содержимого (content_fingerprint), None - неизвестен.
+        """
+        self.peer_id = peer_id
+        self.id = id
+        self.text = text
+        self.sender_id = sender_id
+        self.date = date
+        self.fwd_link = fwd_link
+        self.fingerprint = fingerprint
+
+    @property
+    def peer(self):
+        return utils.get_peer(self.peer_id)
+
+    @classmethod
+    def from_message(cls, msg: Message, fwd_link: str | None = None) -> "StoredMessage":
+        return cls(
+            utils.get_peer_id(msg.peer_id),
+            msg.id,
+            msg.message or '',
+            msg.sender_id,
+            int(msg.date.timestamp()) if msg.date else 0,
+            fwd_link,
+            content_fingerprint(msg),
+        )
+
+    @classmethod
+    def from_dict(cls, data: dict, fwd_link: str | None = None) -> "StoredMessage":
+        """
+        Запись из словаря Message.to_dict() / to_json() (например, из журнала событий).
+        """
+        peer_id = _peer_id_from_dict(data["peer_id"])
+        sender_id = _peer_id_from_dict(data["from_id"]) if data.get("from_id") else peer_id
+
+        date = data.get("date")
+        if isinstance(date, str):
+            date = datetime.datetime.fromisoformat(date)
+        if isinstance(date, datetime.datetime):
+            date = int(date.timestamp())
+
+        return cls(peer_id, data["id"], data.get("message") or '', sender_id, date or 0, fwd_link)
+
+    def to_tuple(self) -> tuple:
+        return (self.peer_id, self.id, self.text, self.sender_id, self.date, self.fwd_link, self.fingerprint)
+
+
+def _peer_id_from_dict(peer: dict) -> int:
+    if peer["_"] == "PeerUser":
+        return utils.get_peer_id(PeerUser(peer["user_id"]))
+    elif peer["_"] == "PeerChat":
+        return utils.get_peer_id(PeerChat(peer["chat_id"]))
+    return utils.get_peer_id(PeerChannel(peer["channel_id"]))
+
 
 class MessageStore:
-    def __init__(self):
-        self._messages: dict[int, tuple[Message, str | None]] = dict()
-        
-    def get(self, msg_id: int) -> Message | None:
-        return self._messages.get(msg_id, (None, None))[0]
-
-    def get_fwd_link(self, msg_id: int) -> str | None:
-        return self._messages.get(msg_id, (None, None))[1]
-    
-    def set(self, msg: Message):
-        self._messages[msg.id] = (msg, None)
-    
-    def set_fwd_link(self, msg: Message, link: str):
-        self._messages[msg.id] = (msg, link)
-    
-    def dump(self) -> list[Message]:
-        dump = [(i[0].to_json(), i[1]) for i in list(self._messages.values())]
+    EVICTION_POLICIES = STORE_EVICTION_POLICIES
+
+    def __init__(self, max_size: int = 200000, max_age: float | None = None, eviction: str = "lru", backend=None):
+        """
+        Хранилище последних сообщений с ключом (чат, id сообщения).
+
+        Id сообщений в личных чатах и обычных группах общие для всего аккаунта,
+        поэтому для них ведется дополнительный индекс по одному id: в событии
+        удаления Telegram не присылает чат.
+
+        :param max_size: Максимальное число хранимых сообщений.
+        :param max_age: Максимальный возраст сообщения (сек.) для вытеснения по возрасту.
+        :param eviction: Политика вытеснения: "lru" (давно не использованные) или "age" (самые старые).
+        :param backend: Постоянное хранилище (SqliteBackend). Память тогда служит кэшем перед ним.
+        """
+        if eviction not in self.EVICTION_POLICIES:
+            raise ValueError(f"Неизвестная политика вытеснения: '{eviction}'")
+
+        self.max_size = max_size
+        self.max_age = max_age
+        self.eviction = eviction
+        self._backend = backend
+
+        self._messages: OrderedDict[tuple[int, int], StoredMessage] = OrderedDict()
+        self._by_id: dict[int, int] = dict()
+        # Для вытеснения по дате (max_age или eviction="age"): куча (дата, ключ); записи удаленных
+        # и измененных сообщений отбрасываются при извлечении, а при разрастании куча пересобирается
+        self._by_date: list[tuple[int, tuple[int, int]]] = []
+        self._dated = max_age is not None or eviction == "age"
+
+        self._hits = 0
+        self._misses = 0
+        self._evicted = 0
+
+    async def get(self, msg_id: int, peer=None) -> StoredMessage | None:
+        """
+        Поиск сообщения в памяти, затем (если есть) в постоянном хранилище.
+
+        :param msg_id: Id сообщения.
+        :param peer: Чат (TL peer или помеченный id). Обязателен для каналов и супергрупп.
+        """
+        key = self._key(msg_id, peer)
+        record = key and self._messages.get(key)
+        if record is None:
+            self._misses += 1
+            if self._backend is None:
+                return None
+
+            if peer is None:
+                record = await self._backend.get_message_by_id(msg_id)
+            else:
+                record = await self._backend.get_message(key[0], msg_id)
+            return record and self._cache(record)
+
+        self._hits += 1
+        if self.eviction == "lru":
+            self._messages.move_to_end(key)
+        return record
+
+    async def get_many(self, msg_ids: list[int], peer=None) -> dict[int, StoredMessage | None]:
+        """
+        Поиск нескольких сообщений: сначала в памяти, остальные - одним запросом к бэкенду.
+
+        :param msg_ids: Id сообщений.
+        :param peer: Чат (TL peer или помеченный id). Обязателен для каналов и супергрупп.
+        :return: Сообщения по id (None для неизвестных) в порядке msg_ids.
+        """
+        found: dict[int, StoredMessage | None] = dict()
+        missing = []
+        for msg_id in msg_ids:
+            key = self._key(msg_id, peer)
+            record = key and self._messages.get(key)
+            if record is None:
+                missing.append(msg_id)
+                continue
+            self._hits += 1
+            if self.eviction == "lru":
+                self._messages.move_to_end(key)
+            found[msg_id] = record
+
+        self._misses += len(missing)
+        loaded = dict()
+        if missing and self._backend is not None:
+            peer_id = None if peer is None else (peer if isinstance(peer, int) else utils.get_peer_id(peer))
+            loaded = await self._backend.get_messages(peer_id, missing)
+            loaded = {msg_id: self._cache(record, evict=False) for msg_id, record in loaded.items()}
+            self.evict()
+
+        return {msg_id: found.get(msg_id) or loaded.get(msg_id) for msg_id in msg_ids}
+
+    async def get_fwd_link(self, msg_id: int, peer=None) -> str | None:
+        record = await self.get(msg_id, peer)
+        return record and record.fwd_link
+
+    def set(self, msg: Message) -> StoredMessage:
+        return self._put(StoredMessage.from_message(msg))
+
+    def set_fwd_link(self, msg: Message, link: str | None) -> StoredMessage:
+        """
+        Сохранение ссылки на пересланную копию. Меняется только ссылка: пересылка завершается
+        позже, и к этому времени в хранилище может быть более новая (отредактированная) версия.
+        """
+        record = self._messages.get((utils.get_peer_id(msg.peer_id), msg.id))
+        if record is None:
+            return self._put(StoredMessage.from_message(msg, link))
+        record.fwd_link = link
+        return self._put(record)
+
+    def apply(self, records: list[StoredMessage]):
+        """
+        Применение записей по порядку (восстановление из журнала событий): более поздняя
+        версия сообщения заменяет прежнюю, ссылка на пересланную копию сохраняется.
+        """
+        for record in records:
+            previous = self._messages.get((record.peer_id, record.id))
+            if previous is not None and record.fwd_link is None:
+                record.fwd_link = previous.fwd_link
+            self._put(record, evict=False)
+        self.evict()
+
+    def evict(self):
+        """
+        Вытеснение сообщений сверх лимита размера и возраста.
+        """
+        while len(self._messages) > self.max_size:
+            self._pop_oldest()
+
+        if self.max_age is not None:
+            deadline = time.time() - self.max_age
+            while self._pop_by_date(deadline):
+                pass
+
+        if self._dated and len(self._by_date) > 2 * len(self._messages) + 1024:
+            self._by_date = [(record.date, key) for key, record in self._messages.items()]
+            heapq.heapify(self._by_date)
+
+    def stats(self) -> dict[str, int]:
+        size = sys.getsizeof(self._messages) + sys.getsizeof(self._by_id)
+        for record in self._messages.values():
+            size += sys.getsizeof(record) + sys.getsizeof(record.text) + (record.fwd_link and sys.getsizeof(record.fwd_link) or 0)
+
+        return {
+            "messages": len(self._messages),
+            "approx_bytes": size,
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": self._hits / (self._hits + self._misses) if self._hits + self._misses else 0.0,
+            "evicted": self._evicted,
+        }
+
+    def dump(self) -> list[tuple]:
+        dump = [record.to_tuple() for record in self._messages.values()]
         print(f"Dump {len(dump)} messages")
-        
+
         return dump
-    
-    def load(self, entities: list[tuple[Message, str | None]]):
-        for msg in self._messages.values():
-            self._messages[msg[0].id] = msg
 
-        print(f"Load {len(entities)} messages")
+    def load(self, messages: list[tuple], replace: bool = True):
+        """
+        :param messages: Записи из dump() (или старого формата).
+        :param replace: Заменять ли уже имеющиеся сообщения (False - при фоновой загрузке,
+            чтобы снимок не затирал более свежие данные из событий).
+        """
+        skipped = 0
+        for item in messages:
+            if isinstance(item[0], str):
+                # Старый формат: (Message.to_json(), ссылка)
+                try:
+                    record = StoredMessage.from_dict(json.loads(item[0]), item[1])
+                except (KeyError, ValueError):
+                    skipped += 1
+                    continue
+            else:
+                record = StoredMessage(*item)
+
+            if not replace and (record.peer_id, record.id) in self._messages:
+                skipped += 1
+                continue
+            self._put(record, evict=False)
+        self.evict()
+
+        print(f"Load {len(messages) - skipped} messages")
+
+    def _key(self, msg_id: int, peer) -> tuple[int, int] | None:
+        if peer is None:
+            peer_id = self._by_id.get(msg_id)
+            return peer_id is not None and (peer_id, msg_id) or None
+        return (peer if isinstance(peer, int) else utils.get_peer_id(peer), msg_id)
+
+    def _put(self, record: StoredMessage, evict: bool = True, persist: bool = True) -> StoredMessage:
+        if persist and self._backend is not None:
+            self._backend.put_message(record)
+
+        key = (record.peer_id, record.id)
+        previous = self._messages.get(key)
+        self._messages[key] = record
+        if self.eviction == "lru":
+            self._messages.move_to_end(key)
+        if self._dated and (previous is None or previous.date != record.date):
+            heapq.heappush(self._by_date, (record.date, key))
+        if utils.resolve_id(record.peer_id)[1] is not PeerChannel:
+            self._by_id[record.id] = record.peer_id
+
+        if evict:
+            self.evict()
+        return record
+
+    def _cache(self, record: StoredMessage, evict: bool = True) -> StoredMessage:
+        # Пока шло чтение с диска, в память могла попасть более новая версия из событий
+        current = self._messages.get((record.peer_id, record.id))
+        return current if current is not None else self._put(record, evict=evict, persist=False)
+
+    def _pop_oldest(self):
+        if self.eviction == "age":
+            self._pop_by_date(math.inf)
+        else:
+            self._remove(next(iter(self._messages)))
+
+    def _pop_by_date(self, deadline: float) -> bool:
+        """
+        Удаление самого старого по дате сообщения, если оно старше deadline.
+
+        :return: False, если таких сообщений нет.
+        """
+        while self._by_date and self._by_date[0][0] < deadline:
+            date, key = heapq.heappop(self._by_date)
+            record = self._messages.get(key)
+            if record is not None and record.date == date:
+                self._remove(key)
+                return True
+        return False
+
+    def _remove(self, key: tuple[int, int]):
+        peer_id, msg_id = key
+        del self._messages[key]
+        if self._by_id.get(msg_id) == peer_id:
+            del self._by_id[msg_id]
+        self._evicted += 1
+
 
-__all__ = ['MessageStore']
+__all__ = ['MessageStore', 'StoredMessage', 'content_fingerprint']
@@ -0,0 +1,307 @@
+import asyncio
+import pickle
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from cryptography.fernet import Fernet
+
+from src.stores.message_store import StoredMessage
+
+
+# Помеченные id каналов и супергрупп начинаются с -100...
+_CHANNEL_ID_BOUND = -1000000000000
+# Ограничение числа параметров в одном запросе SQLite
+_QUERY_CHUNK = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    peer_id INTEGER NOT NULL,
+    msg_id INTEGER NOT NULL,
+    text BLOB,
+    sender_id INTEGER,
+    date INTEGER,
+    fwd_link TEXT,
+    fingerprint INTEGER,
+    PRIMARY KEY (peer_id, msg_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS messages_msg_id ON messages (msg_id);
+CREATE TABLE IF NOT EXISTS entities (
+    id INTEGER PRIMARY KEY,
+    data BLOB NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+
+class SqliteBackend:
+    def __init__(self, path: str, cipher: Fernet | None = None, flush_interval: float = 1.0, batch_size: int = 1000):
+        """
+        Постоянное хранилище сообщений и сущностей в SQLite (режим WAL).
+
+        Записи накапливаются в памяти и пишутся пачками в отдельном потоке;
+        чтение учитывает еще не записанные изменения, а запросы к базе идут в том же потоке,
+        не блокируя цикл событий.
+
+        :param path: Путь к файлу базы.
+        :param cipher: Шифр Fernet для текста сообщений и сущностей (None - без шифрования).
+        :param flush_interval: Интервал (сек.) фоновой записи.
+        :param batch_size: Число изменений, при котором запись начинается сразу.
+        """
+        self.path = path
+        self.cipher = cipher
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+
+        self._reader = self._connect()
+        self._reader.executescript(_SCHEMA)
+        self._migrate()
+        self._writer: sqlite3.Connection | None = None
+
+        self._lock = threading.Lock()
+        self._messages: dict[tuple[int, int], StoredMessage] = dict()
+        # Сущности вместе со временем получения из Telegram (updated_at)
+        self._entities: dict[int, tuple[object, float]] = dict()
+        self._writing_messages: dict[tuple[int, int], StoredMessage] = dict()
+        self._writing_entities: dict[int, tuple[object, float]] = dict()
+        # Те же несохраненные сообщения личных чатов и обычных групп по одному id
+        self._messages_by_id: dict[int, StoredMessage] = dict()
+        self._writing_by_id: dict[int, StoredMessage] = dict()
+
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._closing = False
+
+        self._flushes = 0
+        self._rows_written = 0
+        self._errors = 0
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Запись оставшихся изменений и закрытие базы.
+        """
+        if self._task is not None:
+            self._closing = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._flush)
+        await loop.run_in_executor(self._executor, self._close_writer)
+        self._executor.shutdown(wait=True)
+        self._reader.close()
+
+    def put_message(self, record: StoredMessage):
+        with self._lock:
+            self._messages[(record.peer_id, record.id)] = record
+            if record.peer_id > _CHANNEL_ID_BOUND:
+                self._messages_by_id[record.id] = record
+        self._notify()
+
+    def put_entity(self, key: int, entity, updated_at: float | None = None):
+        """
+        :param updated_at: Время получения сущности из Telegram (по умолчанию текущее).
+        """
+        with self._lock:
+            self._entities[key] = (entity, updated_at or time.time())
+        self._notify()
+
+    async def get_message(self, peer_id: int, msg_id: int) -> StoredMessage | None:
+        key = (peer_id, msg_id)
+        with self._lock:
+            record = self._messages.get(key) or self._writing_messages.get(key)
+        if record is not None:
+            return record
+
+        row = await self._read(
+            "SELECT peer_id, msg_id, text, sender_id, date, fwd_link, fingerprint FROM messages WHERE peer_id = ? AND msg_id = ?",
+            key,
+        )
+        return row and self._row_to_message(row[0])
+
+    async def get_message_by_id(self, msg_id: int) -> StoredMessage | None:
+        """
+        Поиск сообщения по одному id среди личных чатов и обычных групп.
+        """
+        with self._lock:
+            record = self._messages_by_id.get(msg_id) or self._writing_by_id.get(msg_id)
+        if record is not None:
+            return record
+
+        row = await self._read(
+            "SELECT peer_id, msg_id, text, sender_id, date, fwd_link, fingerprint FROM messages "
+            "WHERE msg_id = ? AND peer_id > ? ORDER BY date DESC LIMIT 1",
+            (msg_id, _CHANNEL_ID_BOUND),
+        )
+        return row and self._row_to_message(row[0])
+
+    async def get_messages(self, peer_id: int | None, msg_ids: list[int]) -> dict[int, StoredMessage]:
+        """
+        Поиск нескольких сообщений одним запросом на каждые _QUERY_CHUNK id.
+
+        :param peer_id: Чат или None для поиска среди личных чатов и обычных групп.
+        :return: Найденные сообщения по id.
+        """
+        found: dict[int, StoredMessage] = dict()
+        with self._lock:
+            for msg_id in msg_ids:
+                if peer_id is None:
+                    record = self._messages_by_id.get(msg_id) or self._writing_by_id.get(msg_id)
+                else:
+                    record = self._messages.get((peer_id, msg_id)) or self._writing_messages.get((peer_id, msg_id))
+                if record is not None:
+                    found[msg_id] = record
+
+        missing = [msg_id for msg_id in msg_ids if msg_id not in found]
+        if missing:
+            rows = await asyncio.get_running_loop().run_in_executor(self._executor, self._select_messages, peer_id, missing)
+            # При совпадении id в разных чатах остается самое новое (как в get_message_by_id)
+            for row in rows:
+                found[row[1]] = self._row_to_message(row)
+        return found
+
+    async def get_entity(self, key: int) -> tuple[object, float] | None:
+        """
+        :return: Сущность и время ее получения из Telegram или None.
+        """
+        with self._lock:
+            stored = self._entities.get(key) or self._writing_entities.get(key)
+        if stored is not None:
+            return stored
+
+        row = await self._read("SELECT data, updated_at FROM entities WHERE id = ?", (key,))
+        return row and (pickle.loads(self._decrypt(row[0][0])), row[0][1])
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            pending = len(self._messages) + len(self._entities)
+        return {
+            "pending": pending,
+            "flushes": self._flushes,
+            "rows_written": self._rows_written,
+            "errors": self._errors,
+        }
+
+    async def _read(self, query: str, params: tuple) -> list[tuple]:
+        # Чтение идет в потоке записи: соединение _reader используется только из него
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._select, query, params)
+
+    def _select(self, query: str, params: tuple) -> list[tuple]:
+        return self._reader.execute(query, params).fetchall()
+
+    def _select_messages(self, peer_id: int | None, msg_ids: list[int]) -> list[tuple]:
+        rows = []
+        for start in range(0, len(msg_ids), _QUERY_CHUNK):
+            chunk = msg_ids[start:start + _QUERY_CHUNK]
+            placeholders = ",".join("?" * len(chunk))
+            if peer_id is None:
+                query, params = f"peer_id > ? AND msg_id IN ({placeholders}) ORDER BY date", (_CHANNEL_ID_BOUND, *chunk)
+            else:
+                query, params = f"peer_id = ? AND msg_id IN ({placeholders})", (peer_id, *chunk)
+            rows += self._select(
+                "SELECT peer_id, msg_id, text, sender_id, date, fwd_link, fingerprint FROM messages WHERE " + query,
+                params,
+            )
+        return rows
+
+    def _notify(self):
+        if len(self._messages) + len(self._entities) >= self.batch_size:
+            self._wakeup.set()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await loop.run_in_executor(self._executor, self._flush)
+            except Exception as e:
+                # Цикл записи продолжается: иначе put_* копили бы изменения, которые уже не сохранятся
+                self._errors += 1
+                print(f"Ошибка записи в {self.path}: {e!r}")
+
+    def _flush(self):
+        with self._lock:
+            if not self._messages and not self._entities:
+                return
+
+        if self._writer is None:
+            self._writer = self._connect()
+
+        with self._lock:
+            self._writing_messages, self._messages = self._messages, dict()
+            self._writing_entities, self._entities = self._entities, dict()
+            self._writing_by_id, self._messages_by_id = self._messages_by_id, dict()
+
+        try:
+            with self._writer:
+                self._writer.executemany(
+                    "INSERT OR REPLACE INTO messages (peer_id, msg_id, text, sender_id, date, fwd_link, fingerprint) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [
+                        (r.peer_id, r.id, self._encrypt(r.text.encode()), r.sender_id, r.date, r.fwd_link, r.fingerprint)
+                        for r in self._writing_messages.values()
+                    ],
+                )
+                self._writer.executemany(
+                    "INSERT OR REPLACE INTO entities (id, data, updated_at) VALUES (?, ?, ?)",
+                    [
+                        (key, self._encrypt(pickle.dumps(entity)), updated_at)
+                        for key, (entity, updated_at) in self._writing_entities.items()
+                    ],
+                )
+        except sqlite3.Error:
+            # Возвращаем несохраненные изменения в очередь, не затирая более новые.
+            # Прочие ошибки (например, pickle сущности) при повторе не исчезнут: такая пачка теряется
+            with self._lock:
+                self._messages = {**self._writing_messages, **self._messages}
+                self._entities = {**self._writing_entities, **self._entities}
+                self._messages_by_id = {**self._writing_by_id, **self._messages_by_id}
+            raise
+        finally:
+            rows = len(self._writing_messages) + len(self._writing_entities)
+            with self._lock:
+                self._writing_messages, self._writing_entities, self._writing_by_id = dict(), dict(), dict()
+
+        self._flushes += 1
+        self._rows_written += rows
+
+    def _close_writer(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def _migrate(self):
+        # Базы, созданные до появления отпечатков содержимого
+        columns = {row[1] for row in self._reader.execute("PRAGMA table_info(messages)")}
+        if "fingerprint" not in columns:
+            with self._reader:
+                self._reader.execute("ALTER TABLE messages ADD COLUMN fingerprint INTEGER")
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def _row_to_message(self, row) -> StoredMessage:
+        peer_id, msg_id, text, sender_id, date, fwd_link, fingerprint = row
+        return StoredMessage(peer_id, msg_id, self._decrypt(text).decode(), sender_id, date, fwd_link, fingerprint)
+
+    def _encrypt(self, data: bytes) -> bytes:
+        return self.cipher.encrypt(data) if self.cipher is not None else data
+
+    def _decrypt(self, data: bytes) -> bytes:
+        return self.cipher.decrypt(data) if self.cipher is not None else data
+
+
+__all__ = ['SqliteBackend']
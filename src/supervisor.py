@@ -0,0 +1,231 @@
+"""
+Запуск нескольких аккаунтов: по одному процессу слушателя (python -m src) на аккаунт.
+
+    python -m src.supervisor accounts.json
+
+accounts.json - список аккаунтов:
+
+    [
+        {"name": "main", "env_file": "accounts/main.env"},
+        {"name": "second", "env_file": "accounts/second.env", "env": {"JOURNAL_FORMAT": "tl"}}
+    ]
+
+env_file (необязательный) перекрывает общий .env, в нем задаются ENCRYPTED_TG_API_ID и т.п.
+Каждый процесс получает свой каталог данных (data_dir, по умолчанию accounts/<name>)
+с сессией, журналами, снимком хранилища, логом listener.log и метриками metrics.json.
+
+Процессы запускаются без терминала, поэтому сессию аккаунта нужно создать заранее,
+выполнив вход вручную: DATA_DIR=accounts/main SESSION_NAME=main python -m src
+"""
+import asyncio
+import json
+import os
+import signal
+import sys
+import time
+
+
+# Код завершения слушателя, у которого нет авторизованной сессии: перезапуск бесполезен
+EXIT_NOT_AUTHORIZED = 78
+
+
+class ListenerProcess:
+    def __init__(self, name: str, data_dir: str, env: dict[str, str]):
+        """
+        Процесс слушателя одного аккаунта.
+
+        :param name: Имя аккаунта.
+        :param data_dir: Каталог данных аккаунта.
+        :param env: Переменные окружения процесса (поверх окружения супервизора).
+        """
+        self.name = name
+        self.data_dir = data_dir
+        self.env = env
+
+        self.session_path = os.path.join(data_dir, f"{env['SESSION_NAME']}.session")
+
+        self.process: asyncio.subprocess.Process | None = None
+        self.started_at = 0.0
+        self.restarts = 0
+        self.last_exit_code: int | None = None
+
+    async def start(self):
+        os.makedirs(self.data_dir, exist_ok=True)
+        with open(os.path.join(self.data_dir, "listener.log"), "ab") as log:
+            self.process = await asyncio.create_subprocess_exec(
+                sys.executable, "-m", "src",
+                env={**os.environ, **self.env},
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=log,
+                stderr=log,
+                # Отдельная группа: Ctrl+C из терминала получает только супервизор
+                start_new_session=True,
+            )
+        self.started_at = time.monotonic()
+        print(f"[{self.name}] запущен, pid {self.process.pid}")
+
+    @property
+    def running(self) -> bool:
+        return self.process is not None and self.process.returncode is None
+
+    def metrics(self) -> dict:
+        """
+        Состояние процесса и последние метрики, записанные им в metrics.json.
+        """
+        metrics = {
+            "pid": self.process.pid if self.running else None,
+            "uptime": time.monotonic() - self.started_at if self.running else 0.0,
+            "restarts": self.restarts,
+            "last_exit_code": self.last_exit_code,
+        }
+        try:
+            with open(os.path.join(self.data_dir, "metrics.json")) as f:
+                metrics.update(json.load(f))
+        except (FileNotFoundError, ValueError):
+            pass
+        return metrics
+
+
+class Supervisor:
+    def __init__(
+        self,
+        accounts: list[dict],
+        restart_delay: float = 1.0,
+        max_restart_delay: float = 60.0,
+        metrics_interval: float = 10.0,
+        stop_timeout: float = 30.0,
+        metrics_path: str = "supervisor_metrics.json",
+    ):
+        """
+        Запуск процессов слушателей, перезапуск упавших и сбор их метрик.
+
+        Упавший процесс перезапускается с экспоненциально растущей паузой; если он
+        проработал дольше max_restart_delay, пауза сбрасывается.
+
+        :param accounts: Список аккаунтов (name, env_file, env, data_dir).
+        :param restart_delay: Начальная пауза перед перезапуском.
+        :param max_restart_delay: Максимальная пауза перед перезапуском.
+        :param metrics_interval: Период сбора метрик.
+        :param stop_timeout: Время на штатное завершение процессов до kill.
+        :param metrics_path: Файл со сводными метриками всех аккаунтов.
+        """
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        self.metrics_interval = metrics_interval
+        self.stop_timeout = stop_timeout
+        self.metrics_path = metrics_path
+
+        self.listeners = []
+        names = set()
+        for account in accounts:
+            name = account["name"]
+            if name in names:
+                raise ValueError(f"Аккаунт '{name}' указан дважды")
+            names.add(name)
+
+            data_dir = account.get("data_dir") or os.path.join("accounts", name)
+            env = {
+                "DATA_DIR": data_dir,
+                "SESSION_NAME": account.get("session_name", name),
+                "METRICS_INTERVAL": str(metrics_interval),
+            }
+            if account.get("env_file"):
+                env["ACCOUNT_ENV_FILE"] = os.path.abspath(account["env_file"])
+            env.update({key: str(value) for key, value in account.get("env", {}).items()})
+            self.listeners.append(ListenerProcess(name, data_dir, env))
+
+        self._stopping = asyncio.Event()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGINT, self._stopping.set)
+        loop.add_signal_handler(signal.SIGTERM, self._stopping.set)
+
+        watchers = [asyncio.create_task(self._watch(listener)) for listener in self.listeners]
+        metrics_task = asyncio.create_task(self._collect_metrics())
+
+        await self._stopping.wait()
+        print("Остановка слушателей...")
+        metrics_task.cancel()
+        for watcher in watchers:
+            watcher.cancel()
+        await asyncio.gather(*watchers, return_exceptions=True)
+        await self._stop_all()
+        self._write_metrics()
+
+    async def _watch(self, listener: ListenerProcess):
+        # Процессы запускаются без терминала, поэтому первый вход в аккаунт нужно выполнить вручную
+        if not os.path.exists(listener.session_path):
+            print(
+                f"[{listener.name}] нет сессии {listener.session_path}, аккаунт не запущен. Выполните вход один раз: "
+                f"DATA_DIR={listener.env['DATA_DIR']} SESSION_NAME={listener.env['SESSION_NAME']} python -m src"
+            )
+            return
+
+        delay = self.restart_delay
+        while True:
+            started = time.monotonic()
+            try:
+                await listener.start()
+                listener.last_exit_code = await listener.process.wait()
+            except Exception as e:
+                listener.last_exit_code = None
+                print(f"[{listener.name}] ошибка запуска: {e!r}")
+
+            if listener.last_exit_code == EXIT_NOT_AUTHORIZED:
+                print(f"[{listener.name}] сессия не авторизована, аккаунт остановлен (см. listener.log)")
+                return
+
+            uptime = time.monotonic() - started
+            if uptime > self.max_restart_delay:
+                delay = self.restart_delay
+            print(f"[{listener.name}] завершился с кодом {listener.last_exit_code} через {uptime:.1f} сек., перезапуск через {delay:.1f} сек.")
+
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_restart_delay)
+            listener.restarts += 1
+
+    async def _stop_all(self):
+        running = [listener for listener in self.listeners if listener.running]
+        # SIGINT запускает штатное завершение слушателя с сохранением хранилища
+        for listener in running:
+            listener.process.send_signal(signal.SIGINT)
+
+        for listener in running:
+            try:
+                listener.last_exit_code = await asyncio.wait_for(listener.process.wait(), self.stop_timeout)
+            except asyncio.TimeoutError:
+                print(f"[{listener.name}] не завершился за {self.stop_timeout} сек., kill")
+                listener.process.kill()
+                listener.last_exit_code = await listener.process.wait()
+
+    async def _collect_metrics(self):
+        while True:
+            await asyncio.sleep(self.metrics_interval)
+            self._write_metrics()
+
+    def _write_metrics(self):
+        metrics = {"time": time.time(), "accounts": {listener.name: listener.metrics() for listener in self.listeners}}
+        tmp_path = f"{self.metrics_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(metrics, f, indent=1)
+        os.replace(tmp_path, self.metrics_path)
+
+
+def main():
+    if len(sys.argv) != 2:
+        print("Usage: python -m src.supervisor <accounts.json>")
+        sys.exit(1)
+
+    with open(sys.argv[1]) as f:
+        accounts = json.load(f)
+
+    # Ключ расшифровки окружения запрашивается один раз и передается всем процессам
+    if not os.getenv("SEC_KEY"):
+        os.environ["SEC_KEY"] = input("Введите ключ шифрования: ")
+
+    asyncio.run(Supervisor(accounts).run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+import pytest
+
+from src.services import options
+from src.services.config import ConfigSnapshot
+from src.services.segments import COMPRESSION_SUFFIXES
+from src.services.serializers import get_serializer
+
+
+def _snapshot(**kwargs) -> ConfigSnapshot:
+    return ConfigSnapshot("1", "hash", None, 1, 2, **kwargs)
+
+
+def test_options_match_runtime_components():
+    assert set(options.COMPRESSION_METHODS) == set(COMPRESSION_SUFFIXES)
+    for name in options.JOURNAL_FORMATS:
+        assert get_serializer(name).name == name
+
+
+def test_defaults_are_valid():
+    _snapshot()
+
+
+@pytest.mark.parametrize("kwargs, setting", [
+    ({"journal_format": "xml"}, "JOURNAL_FORMAT"),
+    ({"journal_compress": "lz4"}, "JOURNAL_COMPRESS"),
+    ({"store_eviction": "fifo"}, "STORE_EVICTION"),
+    ({"pipeline_workers": 0}, "PIPELINE_WORKERS"),
+    ({"forward_window": -1.0}, "FORWARD_WINDOW"),
+    ({"metrics_port": 70000}, "METRICS_PORT"),
+    ({"journal_sample": {"UpdateUserTyping": 2.0}}, "JOURNAL_SAMPLE"),
+])
+def test_invalid_values_are_rejected(kwargs, setting):
+    with pytest.raises(ValueError, match=setting):
+        _snapshot(**kwargs)
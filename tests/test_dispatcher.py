@@ -0,0 +1,136 @@
+import asyncio
+
+from telethon import errors, types
+
+from src.services import dispatcher as dispatcher_module
+from src.services.dispatcher import PRIORITY_HIGH, JournalDispatcher, pack_lines, split_text
+
+
+JOURNAL = types.PeerChat(1)
+
+
+class FakeClient:
+    def __init__(self, errors_before_success: list[Exception] = ()):
+        self.errors = list(errors_before_success)
+        self.sent: list[str] = []
+
+    async def send_message(self, peer, text):
+        if self.errors:
+            raise self.errors.pop(0)
+        self.sent.append(text)
+        return types.Message(id=len(self.sent), peer_id=peer, message=text)
+
+
+async def _drain(dispatcher: JournalDispatcher, seconds: float = 0.1):
+    dispatcher.start()
+    await asyncio.sleep(seconds)
+    await dispatcher.stop(1.0)
+
+
+def test_pack_lines_repeats_header_and_respects_limit():
+    lines = [f"line {i}" for i in range(50)]
+    chunks = pack_lines("HEAD:", lines, limit=60)
+
+    assert len(chunks) > 1
+    assert all(chunk.startswith("HEAD:\n") and len(chunk) <= 60 for chunk in chunks)
+    assert [line for chunk in chunks for line in chunk.split("\n")[1:]] == lines
+
+
+def test_pack_lines_truncates_too_long_line():
+    (chunk,) = pack_lines("H", ["x" * 100], limit=20)
+    assert len(chunk) == 20
+    assert chunk.endswith("…")
+
+
+def test_split_text_prefers_newlines():
+    assert split_text("aaa\nbbb\nccc", limit=8) == ["aaa\nbbb", "ccc"]
+    assert split_text("x" * 10, limit=4) == ["xxxx", "xxxx", "xx"]
+
+
+def test_split_text_drops_empty_chunks():
+    assert split_text("") == []
+    assert split_text(" \n ") == []
+    assert split_text("xxxx\n", limit=4) == ["xxxx"]
+
+
+def test_empty_text_is_not_queued():
+    client = FakeClient()
+    dispatcher = JournalDispatcher(client, rate=100, burst=100)
+    dispatcher.submit(JOURNAL, "")
+    dispatcher.submit(JOURNAL, "  ")
+
+    asyncio.run(_drain(dispatcher))
+    assert client.sent == []
+    assert dispatcher.stats()["submitted"] == 0
+
+
+def test_merges_pending_lines_into_one_message():
+    client = FakeClient()
+    dispatcher = JournalDispatcher(client, rate=100, burst=100)
+    dispatcher.submit(JOURNAL, "a")
+    dispatcher.submit(JOURNAL, "b")
+
+    asyncio.run(_drain(dispatcher))
+    assert client.sent == ["a\n\nb"]
+
+
+def test_network_error_is_retried(monkeypatch):
+    monkeypatch.setattr(dispatcher_module, "RETRY_DELAY", 0.01)
+    client = FakeClient([ConnectionError("down"), OSError("reset")])
+    dispatcher = JournalDispatcher(client, rate=100, burst=100)
+    dispatcher.submit(JOURNAL, "a")
+
+    asyncio.run(_drain(dispatcher))
+    assert client.sent == ["a"]
+    assert dispatcher.stats()["retried"] == 2
+    assert dispatcher.stats()["failed"] == 0
+
+
+def test_batch_is_dropped_after_max_retries(monkeypatch):
+    monkeypatch.setattr(dispatcher_module, "RETRY_DELAY", 0.001)
+    client = FakeClient([ConnectionError("down")] * (dispatcher_module.MAX_RETRIES + 1))
+    dispatcher = JournalDispatcher(client, rate=1000, burst=1000)
+    dispatcher.submit(JOURNAL, "a")
+
+    async def run():
+        dispatcher.start()
+        await asyncio.sleep(0.1)
+        # Цикл отправки жив и после отброшенной пачки
+        dispatcher.submit(JOURNAL, "b")
+        await asyncio.sleep(0.05)
+        await dispatcher.stop(1.0)
+
+    asyncio.run(run())
+    assert client.sent == ["b"]
+    assert dispatcher.stats()["failed"] == 1
+
+
+def test_rpc_error_drops_batch():
+    client = FakeClient([errors.RPCError(None, "CHAT_WRITE_FORBIDDEN", 403)])
+    dispatcher = JournalDispatcher(client, rate=100, burst=100)
+    dispatcher.submit(JOURNAL, "a")
+
+    asyncio.run(_drain(dispatcher))
+    assert client.sent == []
+    assert dispatcher.stats()["failed"] == 1
+
+
+def test_flood_wait_requeues_batch():
+    client = FakeClient([errors.FloodWaitError(None, capture=0)])
+    dispatcher = JournalDispatcher(client, rate=100, burst=100)
+    dispatcher.submit(JOURNAL, "a")
+
+    asyncio.run(_drain(dispatcher))
+    assert client.sent == ["a"]
+    assert dispatcher.stats()["flood_waits"] == 1
+
+
+def test_high_priority_does_not_overtake_same_chat():
+    client = FakeClient()
+    dispatcher = JournalDispatcher(client, rate=100, burst=100, max_length=5)
+    dispatcher.submit(JOURNAL, "other")
+    dispatcher.submit(JOURNAL, "edit", keys=(7,))
+    dispatcher.submit(JOURNAL, "rm", PRIORITY_HIGH, keys=(7,))
+
+    asyncio.run(_drain(dispatcher))
+    assert client.sent == ["edit", "rm", "other"]
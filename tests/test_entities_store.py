@@ -0,0 +1,58 @@
+import asyncio
+import time
+
+from telethon import types
+
+from src.stores.entities_store import EntityStore
+from src.stores.sqlite_backend import SqliteBackend
+
+
+class FakeClient:
+    def __init__(self):
+        self.requested: list[int] = []
+
+    async def get_entity(self, peer):
+        self.requested.append(peer.user_id)
+        return types.User(id=peer.user_id, first_name="fresh")
+
+
+async def _store_entities(path: str, entities: dict[int, float]):
+    backend = SqliteBackend(path)
+    for user_id, updated_at in entities.items():
+        backend.put_entity(user_id, types.User(id=user_id, first_name="stored"), updated_at)
+    await backend.stop()
+
+
+def test_entity_stale_on_disk_is_refreshed(tmp_path):
+    path = str(tmp_path / "data.sqlite")
+    asyncio.run(_store_entities(path, {1: time.time() - 3600, 2: time.time()}))
+
+    async def run():
+        client = FakeClient()
+        backend = SqliteBackend(path)
+        store = EntityStore(client, backend, max_age=60)
+        stale, fresh = await store.get(1), await store.get(2)
+        await asyncio.sleep(0)
+        await backend.stop()
+        return client.requested, stale, fresh, await store.get(1)
+
+    requested, stale, fresh, refreshed = asyncio.run(run())
+    assert stale.first_name == fresh.first_name == "stored"
+    assert requested == [1]
+    assert refreshed.first_name == "fresh"
+
+
+def test_fetch_time_survives_backend_round_trip(tmp_path):
+    path = str(tmp_path / "data.sqlite")
+    updated_at = time.time() - 3600
+    asyncio.run(_store_entities(path, {1: updated_at}))
+
+    async def run():
+        backend = SqliteBackend(path)
+        stored = await backend.get_entity(1)
+        await backend.stop()
+        return stored
+
+    entity, stored_at = asyncio.run(run())
+    assert entity.id == 1
+    assert stored_at == updated_at
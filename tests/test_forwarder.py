@@ -0,0 +1,77 @@
+import asyncio
+
+from telethon import errors, types
+
+from src.services.forwarder import ForwardBatcher
+
+
+TARGET = types.PeerChannel(1)
+SOURCE = types.PeerUser(5)
+
+
+class FakeClient:
+    def __init__(self, error: Exception | None = None, latency: float = 0.0):
+        self.error = error
+        self.latency = latency
+        self.calls: list[list[int]] = []
+
+    async def forward_messages(self, entity, messages, from_peer):
+        self.calls.append(list(messages))
+        await asyncio.sleep(self.latency)
+        if self.error is not None:
+            raise self.error
+        return [types.Message(id=100 + msg_id, peer_id=entity, message="") for msg_id in messages]
+
+
+def _message(msg_id: int) -> types.Message:
+    return types.Message(id=msg_id, peer_id=SOURCE, message="text")
+
+
+def test_messages_of_one_chat_are_forwarded_in_one_call():
+    client = FakeClient()
+    forwarder = ForwardBatcher(client, window=0.01)
+
+    async def run():
+        futures = [forwarder.submit(TARGET, _message(i)) for i in range(3)]
+        return [msg.id for msg in await asyncio.gather(*futures)]
+
+    assert asyncio.run(run()) == [100, 101, 102]
+    assert client.calls == [[0, 1, 2]]
+
+
+def test_unexpected_error_resolves_every_future():
+    client = FakeClient(ConnectionError("down"))
+    forwarder = ForwardBatcher(client, window=0.01)
+
+    async def run():
+        futures = [forwarder.submit(TARGET, _message(i)) for i in range(3)]
+        return await asyncio.wait_for(asyncio.gather(*futures), 1.0)
+
+    assert asyncio.run(run()) == [None, None, None]
+    assert forwarder.stats()["failed"] == 3
+
+
+def test_restricted_chat_resolves_with_none():
+    client = FakeClient(errors.ChatForwardsRestrictedError(None))
+    forwarder = ForwardBatcher(client, window=0.01)
+
+    async def run():
+        return await asyncio.wait_for(forwarder.submit(TARGET, _message(1)), 1.0)
+
+    assert asyncio.run(run()) is None
+    assert forwarder.stats()["restricted"] == 1
+
+
+def test_flush_waits_for_batches_already_in_flight():
+    client = FakeClient(latency=0.05)
+    forwarder = ForwardBatcher(client, window=0.3, max_batch=2)
+
+    async def run():
+        # Полная пачка уходит сразу, третья ждет окна
+        futures = [forwarder.submit(TARGET, _message(i)) for i in range(3)]
+        await asyncio.sleep(0)
+        await forwarder.flush()
+        return [future.done() for future in futures]
+
+    assert asyncio.run(run()) == [True, True, True]
+    assert client.calls == [[0, 1], [2]]
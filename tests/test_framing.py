@@ -0,0 +1,71 @@
+import io
+
+import pytest
+from cryptography.fernet import Fernet
+
+from src.services.framing import (
+    BLOCK_HEADER,
+    CODEC_JSON,
+    FLAG_LINE,
+    complete_blocks,
+    decode_block,
+    encode_block,
+    iter_blocks,
+    iter_records,
+)
+
+
+RECORDS = [b'{"_": "UpdateUserStatus", "user_id": 1}', b"", b"x" * 5000]
+
+
+@pytest.mark.parametrize("cipher", [None, Fernet(Fernet.generate_key())])
+def test_encode_decode_round_trip(cipher):
+    data = encode_block(RECORDS, cipher)
+    blocks = list(iter_blocks(io.BytesIO(data)))
+
+    assert len(blocks) == 1
+    assert blocks[0].offset == 0
+    assert blocks[0].count == len(RECORDS)
+    assert decode_block(blocks[0], cipher) == RECORDS
+
+
+def test_encrypted_block_does_not_contain_plain_records():
+    cipher = Fernet(Fernet.generate_key())
+    assert RECORDS[0] not in encode_block(RECORDS, cipher)
+    with pytest.raises(Exception):
+        decode_block(next(iter_blocks(io.BytesIO(encode_block(RECORDS, cipher)))), Fernet(Fernet.generate_key()))
+
+
+def test_blocks_and_legacy_lines_are_read_in_order():
+    cipher = Fernet(Fernet.generate_key())
+    first = encode_block([b"a", b"b"], cipher)
+    line = cipher.encrypt(b"c") + b"\n"
+    last = encode_block([b"d"], cipher)
+    data = first + line + last
+
+    blocks = list(iter_blocks(io.BytesIO(data)))
+    assert [block.offset for block in blocks] == [0, len(first), len(first) + len(line)]
+    assert blocks[1].flags & FLAG_LINE and blocks[1].codec == CODEC_JSON
+    assert list(iter_records(io.BytesIO(data), cipher)) == [b"a", b"b", b"c", b"d"]
+
+
+def test_truncated_block_raises():
+    data = encode_block(RECORDS)
+    with pytest.raises(ValueError):
+        list(iter_blocks(io.BytesIO(data[:-1])))
+
+
+def test_complete_blocks_leaves_unfinished_tail():
+    block = encode_block([b"a"])
+    line = b'{"_": "x"}\n'
+    data = block + line + block[:BLOCK_HEADER.size + 1]
+
+    blocks, length = complete_blocks(data, 100)
+    assert length == len(block) + len(line)
+    assert [item.offset for item in blocks] == [100, 100 + len(block)]
+    assert decode_block(blocks[0]) == [b"a"]
+    assert decode_block(blocks[1]) == [b'{"_": "x"}']
+
+    # Часть магической последовательности и неполная строка тоже остаются на потом
+    assert complete_blocks(b"TG") == ([], 0)
+    assert complete_blocks(b'{"_": ') == ([], 0)
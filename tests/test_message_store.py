@@ -0,0 +1,112 @@
+import asyncio
+import datetime
+import time
+
+from telethon import types, utils
+
+from src.stores.message_store import MessageStore, content_fingerprint
+
+
+CHAT = types.PeerChannel(10)
+
+
+def _message(msg_id: int = 1, text: str = "hello", date: datetime.datetime | None = None, **kwargs) -> types.Message:
+    date = date or datetime.datetime.now(datetime.timezone.utc)
+    return types.Message(id=msg_id, peer_id=CHAT, date=date, message=text, **kwargs)
+
+
+def _bold(length: int) -> list:
+    return [types.MessageEntityBold(offset=0, length=length)]
+
+
+def _photo(photo_id: int) -> types.MessageMediaPhoto:
+    return types.MessageMediaPhoto(photo=types.PhotoEmpty(id=photo_id))
+
+
+def _webpage() -> types.MessageMediaWebPage:
+    return types.MessageMediaWebPage(webpage=types.WebPageEmpty(id=1))
+
+
+def test_fingerprint_is_stable_for_same_content():
+    assert content_fingerprint(_message(entities=_bold(2))) == content_fingerprint(_message(2, entities=_bold(2)))
+
+
+def test_fingerprint_changes_with_text_and_markup():
+    base = content_fingerprint(_message())
+    assert content_fingerprint(_message(text="hello!")) != base
+    assert content_fingerprint(_message(entities=_bold(2))) != base
+    assert content_fingerprint(_message(entities=_bold(3))) != content_fingerprint(_message(entities=_bold(2)))
+
+
+def test_fingerprint_changes_with_media_id():
+    assert content_fingerprint(_message(media=_photo(1))) != content_fingerprint(_message(media=_photo(2)))
+    assert content_fingerprint(_message(media=_photo(1))) != content_fingerprint(_message())
+
+
+def test_fingerprint_ignores_link_preview():
+    assert content_fingerprint(_message(media=_webpage())) == content_fingerprint(_message())
+
+
+def test_fwd_link_keeps_newer_edited_text():
+    store = MessageStore()
+    original = _message(text="original")
+    store.set(original)
+    store.set(_message(text="edited"))
+
+    # Пересылка оригинала завершилась уже после правки
+    store.set_fwd_link(original, "https://t.me/c/1/2")
+    record = asyncio.run(store.get(1, CHAT))
+
+    assert record.text == "edited"
+    assert record.fwd_link == "https://t.me/c/1/2"
+
+
+def test_max_size_evicts_least_recently_used():
+    store = MessageStore(max_size=2)
+    for msg_id in (1, 2):
+        store.set(_message(msg_id))
+    asyncio.run(store.get(1, CHAT))
+    store.set(_message(3))
+
+    assert asyncio.run(store.get_many([1, 2, 3], CHAT))[2] is None
+    assert store.stats()["evicted"] == 1
+
+
+def test_max_age_evicts_old_messages_only():
+    now = datetime.datetime.now(datetime.timezone.utc)
+    store = MessageStore(max_age=60, eviction="age")
+    store.set(_message(1, date=now - datetime.timedelta(minutes=5)))
+    store.set(_message(2, date=now))
+    # Старое сообщение, отредактированное с новой датой, остается
+    store.set(_message(3, date=now - datetime.timedelta(minutes=5)))
+    store.set(_message(3, date=now))
+    store.evict()
+
+    found = asyncio.run(store.get_many([1, 2, 3], CHAT))
+    assert found[1] is None
+    assert found[2] is not None and found[3] is not None
+    assert time.time() - found[3].date < 60
+
+
+def test_age_policy_evicts_oldest_date_past_max_size():
+    now = datetime.datetime.now(datetime.timezone.utc)
+    store = MessageStore(max_size=2, eviction="age")
+    store.set(_message(1, date=now - datetime.timedelta(hours=2)))
+    store.set(_message(2, date=now - datetime.timedelta(hours=1)))
+    # Правка старого сообщения не делает его новее
+    store.set(_message(1, text="edited", date=now - datetime.timedelta(hours=2)))
+    store.set(_message(3, date=now))
+
+    found = asyncio.run(store.get_many([1, 2, 3], CHAT))
+    assert found[1] is None
+    assert found[2] is not None and found[3] is not None
+
+
+def test_age_policy_ignores_load_order():
+    now = int(time.time())
+    store = MessageStore(max_size=2, eviction="age")
+    store.load([(utils.get_peer_id(CHAT), msg_id, "", None, now - age) for msg_id, age in ((1, 10), (2, 3600), (3, 20))])
+
+    found = asyncio.run(store.get_many([1, 2, 3], CHAT))
+    assert found[2] is None
+    assert found[1] is not None and found[3] is not None
@@ -0,0 +1,34 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from src.services.presence import overlap_pairs, user_overlap
+
+
+def _sessions(rows: list[tuple[int, float, float]]) -> dict:
+    user_id, start, end = (np.asarray(column) for column in zip(*rows))
+    return {"user_id": user_id.astype(np.int64), "start": start, "end": end, "duration": end - start}
+
+
+def test_overlap_of_two_users():
+    sessions = _sessions([(1, 0, 600), (2, 300, 900), (3, 2000, 2300)])
+    users, overlap = user_overlap(sessions, bin_seconds=300)
+
+    order = {user: i for i, user in enumerate(users)}
+    assert overlap[order[1], order[2]] == 300
+    assert overlap[order[1], order[1]] == 600
+    assert overlap[order[1], order[3]] == 0
+    pairs = overlap_pairs(users, overlap)
+    assert list(zip(pairs["user_a"], pairs["user_b"])) in ([(1, 2)], [(2, 1)])
+
+
+def test_chunked_overlap_matches_single_window():
+    rng = np.random.default_rng(1)
+    start = rng.uniform(0, 30 * 86400, 2000)
+    sessions = _sessions(list(zip(rng.integers(0, 50, 2000), start, start + rng.uniform(60, 7200, 2000))))
+
+    users, single = user_overlap(sessions, chunk_bins=1 << 30)
+    chunked_users, chunked = user_overlap(sessions, chunk_bins=7)
+
+    assert np.array_equal(users, chunked_users)
+    assert np.array_equal(single, chunked)
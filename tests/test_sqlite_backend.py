@@ -0,0 +1,48 @@
+import asyncio
+
+from src.stores.message_store import StoredMessage
+from src.stores.sqlite_backend import SqliteBackend
+
+
+def _record(msg_id: int) -> StoredMessage:
+    return StoredMessage(1, msg_id, f"text {msg_id}", 2, 1700000000)
+
+
+def test_pending_messages_are_read_before_flush(tmp_path):
+    async def run():
+        backend = SqliteBackend(str(tmp_path / "data.sqlite"), flush_interval=60)
+        backend.put_message(_record(1))
+        found = await backend.get_message(1, 1), await backend.get_message_by_id(1)
+        await backend.stop()
+        return found
+
+    by_key, by_id = asyncio.run(run())
+    assert by_key.text == by_id.text == "text 1"
+
+
+def test_write_loop_survives_unexpected_error(tmp_path):
+    path = str(tmp_path / "data.sqlite")
+
+    async def run():
+        backend = SqliteBackend(path, flush_interval=0.01)
+        backend.start()
+        # Сущность, которую нельзя сохранить (pickle не сериализует lambda)
+        backend.put_entity(1, lambda: None)
+        await asyncio.sleep(0.1)
+        backend.put_message(_record(2))
+        await asyncio.sleep(0.1)
+        stats = backend.stats()
+        await backend.stop()
+        return stats
+
+    stats = asyncio.run(run())
+    assert stats["errors"] == 1
+    assert stats["pending"] == 0 and stats["rows_written"] == 1
+
+    async def read():
+        backend = SqliteBackend(path)
+        record = await backend.get_message(1, 2)
+        await backend.stop()
+        return record
+
+    assert asyncio.run(read()).text == "text 2"
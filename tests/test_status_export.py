@@ -0,0 +1,88 @@
+import datetime
+import json
+
+from src.services import status_export
+from src.services.framing import encode_block
+from src.services.status_export import ONLINE_EXPIRES, JournalTail, MemorySink, StatusExporter, status_row
+
+
+def _status(user_id: int, date: int = 1700000000) -> bytes:
+    return json.dumps({
+        "_": "UpdateUserStatus",
+        "user_id": user_id,
+        "status": {"_": "UserStatusOffline", "was_online": date},
+        "date": date,
+    }).encode()
+
+
+def _write(path, *user_ids: int):
+    with open(path, "ab") as f:
+        f.write(encode_block([_status(user_id) for user_id in user_ids]))
+
+
+def _user_ids(tail: JournalTail) -> list[int]:
+    return [record["user_id"] for _, _, records in tail.read() for record in records]
+
+
+def test_read_continues_after_last_block(tmp_path):
+    path = tmp_path / "status.jsonl"
+    _write(path, 1, 2)
+    tail = JournalTail(str(path))
+
+    assert _user_ids(tail) == [1, 2]
+    assert _user_ids(tail) == []
+    _write(path, 3)
+    assert _user_ids(tail) == [3]
+
+
+def test_checkpoint_restores_position_in_new_instance(tmp_path):
+    path = tmp_path / "status.jsonl"
+    _write(path, 1)
+    _write(path, 2)
+
+    tail = JournalTail(str(path))
+    blocks = list(tail.read())
+    name, offset, _ = blocks[0]
+    tail.commit(name, offset)
+
+    assert json.loads((tmp_path / "status.jsonl.checkpoint").read_text()) == {"file": "status.jsonl", "offset": offset}
+    # Прочитанное, но не подтвержденное commit, читается заново
+    assert _user_ids(JournalTail(str(path))) == [2]
+
+
+def test_block_being_written_is_left_for_next_read(tmp_path, monkeypatch):
+    monkeypatch.setattr(status_export, "READ_SIZE", 16)
+    path = tmp_path / "status.jsonl"
+    _write(path, 1)
+    tail_block = encode_block([_status(2)])
+    with open(path, "ab") as f:
+        f.write(tail_block[:20])
+
+    tail = JournalTail(str(path))
+    assert _user_ids(tail) == [1]
+
+    with open(path, "ab") as f:
+        f.write(tail_block[20:])
+    assert _user_ids(tail) == [2]
+
+
+def test_exporter_commits_after_sink_accepts_rows(tmp_path):
+    path = tmp_path / "status.jsonl"
+    _write(path, 1, 2)
+    sink = MemorySink(failures=1)
+    exporter = StatusExporter(JournalTail(str(path)), sink, batch_rows=2, max_backoff=0.01)
+
+    exporter.run_once()
+
+    assert [row[1] for row in sink.rows] == [1, 2]
+    assert sink.calls == 2
+    assert _user_ids(JournalTail(str(path))) == []
+
+
+def test_status_row_uses_online_expires_without_date():
+    expires = datetime.datetime(2024, 1, 1, 12, 5, tzinfo=datetime.timezone.utc)
+    row = status_row({"_": "UpdateUserStatus", "user_id": 7, "status": {"_": "UserStatusOnline", "expires": expires.timestamp()}})
+
+    moment = expires - datetime.timedelta(seconds=ONLINE_EXPIRES)
+    assert row[:3] == [moment.astimezone().strftime(status_export.TIME_FORMAT), 7, "UserStatusOnline"]
+    assert status_row({"_": "UpdateUserTyping", "user_id": 7}) is None